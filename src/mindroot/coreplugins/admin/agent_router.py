@@ -7,6 +7,7 @@ import json
 from .agent_importer import scan_and_import_agents, import_github_agent
 import shutil
 from lib.providers.commands import command_manager
+from lib.providers.services import service_manager
 from .persona_handler import handle_persona_import, import_persona_from_index
 import traceback
 import hashlib
@@ -277,11 +278,7 @@ def update_agent(scope: str, name: str, agent: str=Form(...)):
         with open(agent_path, 'w') as f:
             json.dump(agent, f, indent=2)
         # Invalidate agent data cache so next get_agent_data() re-reads from disk
-        try:
-            from coreplugins.agent.agent import _agent_data_cache
-            _agent_data_cache.pop(name, None)
-        except Exception:
-            pass
+        service_manager.invalidate_cache('get_agent_data', name)
         return {'status': 'success'}
     except Exception as e:
         raise HTTPException(status_code=500, detail='Internal server error ' + str(e))
@@ -5,6 +5,7 @@ import json
 import shutil
 import traceback
 from .asset_manager import asset_manager
+from lib.providers.services import service_manager
 router = APIRouter()
 BASE_DIR = Path('personas')
 local_dir = BASE_DIR / 'local'
@@ -197,11 +198,7 @@ def update_persona(scope: str, name: str, persona: str=Form(...), faceref: Uploa
         with open(persona_path, 'w') as f:
             json.dump(persona, f, indent=2)
         # Invalidate agent data cache since persona data is embedded in it
-        try:
-            from coreplugins.agent.agent import _agent_data_cache
-            _agent_data_cache.clear()
-        except Exception:
-            pass
+        service_manager.invalidate_cache('get_agent_data')
         return {'status': 'success'}
     except Exception as e:
         traceback.print_exc()
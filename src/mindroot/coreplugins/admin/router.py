@@ -9,6 +9,7 @@ from lib.templates import render
 from .plugin_manager import router as plugin_manager_router
 from lib.route_decorators import requires_role
 from .mod import get_git_version_info
+from mindroot.lib.metrics import metrics
 
 # Create separate routers for public and admin routes
 public_router = APIRouter()  # No dependencies - for OAuth callbacks etc.
@@ -29,6 +30,16 @@ async def get_admin_html():
     html = await render('admin', {"log_id": log_id})
     return html
 
+@admin_router.get("/admin/metrics")
+async def get_metrics():
+    """Per service/command/hook/pipe call counts, errors and latencies, slowest first."""
+    return JSONResponse(metrics.snapshot())
+
+@admin_router.get("/metrics")
+async def get_prometheus_metrics():
+    """Metrics in Prometheus text format (scrape with ?api_key= of an admin user)."""
+    return Response(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @admin_router.get("/admin/model-preferences-v2", response_class=HTMLResponse)
 async def get_model_preferences_v2_html():
     """Serve the new Model Preferences V2 page"""
@@ -1,11 +1,14 @@
 import asyncio
 from typing import Dict, List, Any, Optional
 from lib.providers.services import service_manager
-service_models_cache: Dict[str, Dict[str, List[str]]] = {}
+from lib.providers.service_cache import cached
 
+@cached({'ttl': None, 'cache_falsy': False})
 async def cached_get_service_models():
     """
     Retrieve service models from the cache or fetch them if not available.
+    Concurrent first calls share one query of the providers; clear with
+    cached_get_service_models.cache.clear().
     Returns:
         Dictionary mapping services to providers to models:
         {
@@ -16,10 +19,7 @@ async def cached_get_service_models():
             ...
         }
     """
-    global service_models_cache
-    if not service_models_cache:
-        service_models_cache = await get_service_models_from_providers()
-    return service_models_cache
+    return await get_service_models_from_providers()
 
 async def get_service_models_from_providers(timeout: float=500.0, context=None) -> Dict[str, Dict[str, List[str]]]:
     """
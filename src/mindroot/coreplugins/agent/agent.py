@@ -11,10 +11,11 @@ from lib.providers.hooks import hook_manager
 from lib.pipelines.pipe import pipeline_manager
 from lib.providers.services import service
 from lib.providers.services import service_manager
+from lib.providers.service_cache import file_stamp
 from lib.json_str_block import replace_raw_blocks
 import sys
 from lib.utils.check_args import *
-from .command_parser import parse_streaming_commands, invalid_start_format
+from .command_parser import parse_streaming_commands, invalid_start_format, get_command_parser
 from datetime import datetime
 import pytz
 import traceback
@@ -27,6 +28,8 @@ from lib.templates import render
 import nanoid
 from lib.xml_stream_events import XmlEventStream
 from lib.xml_docstring_adapter import convert_docstring_json_examples_to_xml
+from lib.blob_store import rehydrate_messages_async
+from mindroot.lib.message_snapshot import snapshot_messages
 
 
 def _truthy(val) -> bool:
@@ -105,8 +108,25 @@ def speak_cmd_text_arg(cmd_name: str) -> str:
     }
     return arg_map.get(cmd_name, 'text')
 
+# Some models (Qwen 3) separate commands with these; they are replaced by
+# '}, {' before parsing.
+_QWEN_SEPARATORS = ('}] <>\n\n[{', '}] <>\n[{')
+
+def _separator_prefix_len(text):
+    """Length of the end of text that could still become part of a separator.
+    The separators' leading '}' is kept as is, so it does not count."""
+    longest = max(len(sep) for sep in _QWEN_SEPARATORS)
+    for start in range(max(0, len(text) - longest + 1), len(text)):
+        tail = text[start:]
+        if any(sep.startswith(tail) for sep in _QWEN_SEPARATORS):
+            return len(text) - start - 1
+    return 0
+
 import logging
-if os.environ.get('MR_DEBUG') == '1':
+# Per-chunk stream logging (the whole buffer) only when debugging: the
+# loguru JSON sink takes DEBUG records regardless of the stderr level.
+_debug_stream = os.environ.get('MR_DEBUG') == '1'
+if _debug_stream:
     logging.basicConfig(level=logging.DEBUG)
 else:
     logging.basicConfig(level=logging.CRITICAL)
@@ -149,17 +169,15 @@ END_RAW
 Please adhere to the system JSON command list response format carefully.
 """
 
-# In-memory cache for agent data to avoid repeated disk reads
-_agent_data_cache = {}
+def _agent_file_stamp(agent_name):
+    return (file_stamp(os.path.join('data/agents', 'local', agent_name, 'agent.json')),
+            file_stamp(os.path.join('data/agents', 'shared', agent_name, 'agent.json')))
 
-@service()
+# Cached in memory to avoid repeated disk reads. Edits to agent.json are
+# picked up by the stamp; persona edits (embedded below) by the TTL or by
+# service_manager.invalidate_cache('get_agent_data').
+@service(cache={'ttl': 60, 'stamp': _agent_file_stamp})
 async def get_agent_data(agent_name, context=None):
-    global _agent_data_cache
-    # Return cached agent data if available
-    if agent_name in _agent_data_cache:
-        return _agent_data_cache[agent_name]
-
-
     agent_path = os.path.join('data/agents', 'local', agent_name)
 
     if not os.path.exists(agent_path):
@@ -184,8 +202,6 @@ async def get_agent_data(agent_name, context=None):
 
     agent_data["flags"] = agent_data["flags"]
     agent_data["flags"] = list(dict.fromkeys(agent_data["flags"]))
-    # Cache the result
-    _agent_data_cache[agent_name] = agent_data
     return agent_data
 
 
@@ -196,6 +212,12 @@ def find_new_substring(s1, s2):
     return s2
 
 
+async def _with_stream_end(stream):
+    """Yield the stream's chunks, then None to mark the end."""
+    async for part in stream:
+        yield part
+    yield None
+
 class Agent:
 
     def __init__(self, model=None, sys_core_template=None, agent=None, clear_model=False, commands=[], context=None):
@@ -377,47 +399,81 @@ class Agent:
         partial_min_chars = int(os.environ.get("MR_PARTIAL_COMMAND_MIN_CHARS", "256"))
         debug_box(str(context))
         original_buffer = ""
+        parser = get_command_parser()
+        start_checked = False
+        # buffer up to here has had the Qwen separators below replaced
+        replaced_len = 0
+        # buffer up to here has been fed to the parser
+        fed_len = 0
+
+        async for part in _with_stream_end(stream):
+            # The extra pass after the last chunk lets commands that were held
+            # back for recovery still run.
+            if part is None:
+                if fed_len < len(buffer):
+                    parser.feed(buffer[fed_len:])
+                    fed_len = len(buffer)
+                if not parser.finish(recover=False) + await parser.recover(final=True):
+                    break
+                part = ''
+            else:
+                original_buffer += part
 
-        async for part in stream:
-            original_buffer += part
-
-            # Store original buffer for xml_streaming mode (used by handle_cmds)
-            context.data['_xml_original_buffer'] = original_buffer
+                # Store original buffer for xml_streaming mode (used by handle_cmds)
+                context.data['_xml_original_buffer'] = original_buffer
 
-            tmp_data = await pipeline_manager.process_stream({'chunk': part}, context=context)
-            part = tmp_data.get('chunk', '')
-            buffer += part
+                tmp_data = await pipeline_manager.process_stream({'chunk': part}, context=context, event='chunk')
+                part = tmp_data.get('chunk', '')
+                buffer += part
 
             # Give the web server/SSE machinery a chance to run during long streams.
-            # The command parser below can be CPU-heavy on large partial JSON buffers.
             await asyncio.sleep(0)
 
-            logger.debug(f"Current buffer: ||{buffer}||")
-       
-            if invalid_start_format(buffer):
-                print("Found invalid start to buffer", buffer)
-                # When xml_streaming is active, store original output (not pipe-transformed JSON)
-                xml_state = context.data.get('_xml_stream_state', {})
-                msg_content = original_buffer if xml_state.get('mode') == 'xml' else buffer
-                await context.chat_log.add_message_async({"role": "assistant", "content": msg_content})
-                started_with = f"Your invalid command started with: {buffer[0:20]}"
-                results.append({"cmd": "UNKNOWN", "args": { "invalid": "(" }, "result": error_result + "\n\n" + started_with})
-                return results, full_cmds 
-
-            if len(buffer) > 0 and buffer[0] == '{':
-                buffer = "[" + buffer
+            if _debug_stream:
+                logger.debug("Current buffer: ||{}||", buffer)
+
+            # The start of the buffer only needs checking once.
+            if not start_checked and buffer:
+                start_checked = True
+                if invalid_start_format(buffer):
+                    print("Found invalid start to buffer", buffer)
+                    # When xml_streaming is active, store original output (not pipe-transformed JSON)
+                    xml_state = context.data.get('_xml_stream_state', {})
+                    msg_content = original_buffer if xml_state.get('mode') == 'xml' else buffer
+                    await context.chat_log.add_message_async({"role": "assistant", "content": msg_content})
+                    started_with = f"Your invalid command started with: {buffer[0:20]}"
+                    results.append({"cmd": "UNKNOWN", "args": { "invalid": "(" }, "result": error_result + "\n\n" + started_with})
+                    return results, full_cmds 
+
+                if buffer[0] == '{':
+                    buffer = "[" + buffer
+                    replaced_len += 1
 
             # happened with Qwen 3 for some reason
-            buffer = buffer.replace('}] <>\n\n[{','}, {')
-            buffer = buffer.replace('}] <>\n[{','}, {')
-
-            commands, partial_cmd = parse_streaming_commands(buffer)
-
-            if isinstance(commands, int):
-                continue
-
-            if not isinstance(commands, list):
-                commands = [commands]
+            # Only the new tail (plus enough overlap for a separator split
+            # across chunks) is searched.
+            tail_start = max(0, replaced_len - 8)
+            tail = buffer[tail_start:]
+            if '<>' in tail:
+                fixed = tail
+                for separator in _QWEN_SEPARATORS:
+                    fixed = fixed.replace(separator, '}, {')
+                if fixed != tail:
+                    buffer = buffer[:tail_start] + fixed
+            replaced_len = len(buffer)
+
+            # The parser gets the rewritten text; the end of the buffer is held
+            # back while it could still become a separator.
+            feed_to = len(buffer) - _separator_prefix_len(buffer)
+            if feed_to > fed_len:
+                parser.feed(buffer[fed_len:feed_to])
+                fed_len = feed_to
+                # Fallback parsing of malformed commands runs in a worker
+                # thread with a time budget, not on the event loop.
+                if parser.needs_recovery:
+                    await parser.recover()
+
+            commands = parser.commands
 
             try:
                 if len(commands) == 1 and 'commands' in commands[0]:
@@ -425,7 +481,8 @@ class Agent:
             except Exception as e:
                 continue
 
-            logger.debug(f"commands: {commands}, partial_cmd: {partial_cmd}")
+            if _debug_stream:
+                logger.debug("commands: {}", commands)
 
             # Check for cancellation (either permanent or current turn)
             if context.data.get('finished_conversation') or context.data.get('cancel_current_turn'):
@@ -434,6 +491,7 @@ class Agent:
                 debug_box(str(context))
                 
                 # Add partial command to chat log if present
+                partial_cmd = parser.partial()
                 if partial_cmd is not None:
                     cmd_name = next(iter(partial_cmd))
                     if cmd_name in ["say", "json_encoded_md", "think"]:
@@ -475,7 +533,7 @@ class Agent:
                         command_ids[i] = cmd_id
                         
                         logger.debug(f"Processing command: {cmd}")
-                        await context.partial_command(cmd_name, json.dumps(cmd_args), cmd_args, cmd_id=cmd_id)
+                        await context.partial_command(cmd_name, json.dumps(cmd_args), cmd_args, cmd_id=cmd_id, final=True)
  
                         cmd_task = asyncio.create_task(
                             self.handle_cmds(cmd_name, cmd_args, json_cmd=json.dumps(cmd), context=context, cmd_id=cmd_id)
@@ -514,11 +572,19 @@ class Agent:
                         pass
             else:
                 logger.debug("No new commands found")
-                # sometimes partial_cmd is actually a string for some reason
-                # definitely skip that
-                # check if partial_cmd is a string
-                is_string = isinstance(partial_cmd, str)
-                if partial_cmd is not None and partial_cmd != {} and not is_string:
+                # Long streamed markdown/write/task_result commands can otherwise
+                # emit a full growing JSON payload on every provider token. That
+                # monopolizes the event loop and makes ordinary page requests stall.
+                # The partial command is only decoded when it will be emitted.
+                now = time.monotonic()
+                approx_len = len(buffer)
+                should_emit = (
+                    partial_min_interval <= 0
+                    or (now - last_partial_emit_time) >= partial_min_interval
+                    or (approx_len - last_partial_emit_len) >= partial_min_chars
+                )
+                partial_cmd = parser.partial() if should_emit else None
+                if partial_cmd is not None and partial_cmd != {}:
                     logger.debug(f"Partial command {partial_cmd}")
                     try:
                         cmd_name = next(iter(partial_cmd))
@@ -528,28 +594,17 @@ class Agent:
                         cmd_id = command_ids.get(num_processed, nanoid.generate())
                         command_ids[num_processed] = cmd_id
                         
-                        # Long streamed markdown/write/task_result commands can otherwise
-                        # emit a full growing JSON payload on every provider token. That
-                        # monopolizes the event loop and makes ordinary page requests stall.
-                        now = time.monotonic()
-                        approx_len = len(buffer)
-                        should_emit = (
-                            partial_min_interval <= 0
-                            or (now - last_partial_emit_time) >= partial_min_interval
-                            or (approx_len - last_partial_emit_len) >= partial_min_chars
-                        )
-                        if should_emit:
-                            logger.debug(f"Partial command detected: {partial_cmd}")
-                            await context.partial_command(cmd_name, json.dumps(cmd_args), cmd_args, cmd_id=cmd_id)
-                            last_partial_emit_time = now
-                            last_partial_emit_len = approx_len
+                        logger.debug(f"Partial command detected: {partial_cmd}")
+                        await context.partial_command(cmd_name, '', cmd_args, cmd_id=cmd_id)
+                        last_partial_emit_time = now
+                        last_partial_emit_len = approx_len
                     except Exception as de:
                         logger.error("Failed to parse partial command")
                         logger.error(str(de))
                         pass
 
         # Flush any remaining XML-stream tool commands
-        tmp_data = await pipeline_manager.process_stream({'chunk': '', 'finish': True}, context=context)
+        tmp_data = await pipeline_manager.process_stream({'chunk': '', 'finish': True}, context=context, event='finish')
         if tmp_data.get('chunk'):
             buffer += tmp_data['chunk']
 
@@ -569,7 +624,7 @@ class Agent:
         if len(full_cmds) == 0 or reasonOnly:
             print("\033[91m" + "No results and parse failed" + "\033[0m")
             try:
-                buffer = replace_raw_blocks(buffer)
+                buffer = await asyncio.to_thread(replace_raw_blocks, buffer)
                 parse_ok = json.loads(buffer)
                 parse_fail_reason = ""
                 tried_to_parse = ""
@@ -701,7 +756,7 @@ class Agent:
                     if seg_cmd_id is None:
                         seg_cmd_id = nanoid.generate()
                     args = {speak_text_arg: text}
-                    await context.partial_command(speak_cmd, json.dumps(args), args, cmd_id=seg_cmd_id)
+                    await context.partial_command(speak_cmd, json.dumps(args), args, cmd_id=seg_cmd_id, final=True)
                     result = await self.execute_command(speak_cmd, args, context=context, cmd_id=seg_cmd_id)
                     await context.command_result(speak_cmd, result, cmd_id=seg_cmd_id)
                     collected.append({speak_cmd: args})
@@ -720,7 +775,7 @@ class Agent:
                     # speech/generation but must not cancel the tone itself.
                     # Speak remains fully cancellable and is handled above.
                     cancel_policy = 'atomic' if name == 'send_dtmf' else 'cancellable'
-                    await context.partial_command(name, json.dumps(props), props, cmd_id=cmd_id)
+                    await context.partial_command(name, json.dumps(props), props, cmd_id=cmd_id, final=True)
                     context.data['active_command_name'] = name
                     context.data['active_command_cancel_policy'] = cancel_policy
                     cmd_task = asyncio.create_task(
@@ -861,8 +916,10 @@ class Agent:
 
         #logger.info("Messages for chat", extra={"messages": messages})
 
-        json_messages = json.dumps(messages)
-        new_messages = json.loads(json_messages)
+        # History messages from ChatLog.get_recent() are already copy-on-write
+        # snapshots; only the others (system message, demo messages) get
+        # copied, so filter_messages pipes can edit any of them in place.
+        new_messages = snapshot_messages(messages)
 
         if os.environ.get("AH_DEFAULT_MAX_TOKENS"):
             max_tokens = int(os.environ.get("AH_DEFAULT_MAX_TOKENS"))
@@ -895,6 +952,15 @@ class Agent:
             if 'service_models' in context.agent and context.agent['service_models'] is not None:
                 if context.agent['service_models'].get('stream_chat', None) is None:
                     model = os.environ.get("DEFAULT_LLM_MODEL")
+
+        token_model = model
+        if token_model is None:
+            stream_chat_model = (context.agent.get('service_models') or {}).get('stream_chat') or {}
+            token_model = stream_chat_model.get('model')
+        context.chat_log.set_token_model(token_model)
+
+        # History holds blob refs for images; load the payloads only now.
+        new_messages = await rehydrate_messages_async(new_messages)
         
         # we need to be able to abort this task if necessary
         stream = await context.stream_chat(model,
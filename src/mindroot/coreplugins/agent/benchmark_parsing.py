@@ -0,0 +1,269 @@
+"""Benchmark for the command stream parsing stack.
+
+Replays the fixtures in lib/json_str_block (ex*.txt, test_case_*.json) and
+synthetic responses of several sizes chunk by chunk, the way the agent
+receives them, through:
+
+    streaming_parser          StreamingCommandParser.feed(), partial() every
+                              --partial-every chars (as the agent throttles it)
+    parse_streaming_commands  whole buffer re-parsed on every chunk
+    replace_raw_blocks        whole buffer on every chunk
+    merge_json_arrays         whole buffer on every chunk
+    recover_long_form         once on the complete (malformed) response
+    xml_event_stream          XmlEventStream.feed() + finish()
+
+and reports per-chunk (mean / p95 / max) and total CPU time per input.
+
+Run from src/mindroot:
+
+    python -m coreplugins.agent.benchmark_parsing
+    python -m coreplugins.agent.benchmark_parsing --sizes 2000,50000 --chunk 16
+    python -m coreplugins.agent.benchmark_parsing --save baseline.json
+    python -m coreplugins.agent.benchmark_parsing --baseline baseline.json
+
+With --baseline, exits with status 1 if any total CPU time is more than
+--threshold times (default 1.5) its baseline value (and at least 5ms more),
+so it can gate a deploy.
+
+The whole-buffer benchmarks are quadratic in the response length; inputs
+longer than --max-replay characters (default 20000) are skipped for them.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+from lib.json_str_block import replace_raw_blocks
+from lib.utils.merge_arrays import merge_json_arrays
+from lib.xml_stream_events import XmlEventStream
+from coreplugins.agent.command_parser import parse_streaming_commands, StreamingCommandParser
+from coreplugins.agent.long_form_recovery import recover_long_form
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'lib', 'json_str_block')
+
+# Seconds below which a slowdown against the baseline is treated as noise.
+NOISE_FLOOR = 0.005
+
+
+def _paragraphs(size):
+    words = ('the agent reads the file and "quotes" it, then {braces} and a '
+             'backslash \\ before writing the next line of the report').split()
+    lines = []
+    total = 0
+    i = 0
+    while total < size:
+        line = ' '.join(words[(i + j) % len(words)] for j in range(12))
+        lines.append(f"{i}: {line}")
+        total += len(lines[-1]) + 1
+        i += 1
+    return '\n'.join(lines)
+
+
+def synthetic_json(size):
+    """A think, a RAW-block write and a say command, about size chars."""
+    body = _paragraphs(size)
+    return ('[{"think": {"thoughts": "I will write the report now."}},\n'
+            ' {"write": {"fname": "/tmp/report.md", "text": START_RAW\n' + body + '\nEND_RAW\n}},\n'
+            ' {"say": {"text": "Done, the report is written."}}]')
+
+
+def synthetic_malformed(size):
+    """A write command with unescaped newlines and quotes in its text."""
+    body = _paragraphs(size)
+    return '[{"write": {"fname": "/tmp/report.md", "text": "' + body + '"}}]'
+
+
+def synthetic_xml(size):
+    """Speech with tool tags, as used by the XML streaming mode."""
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        step = [f"Sure, let me check that for you, step {i}. "]
+        if i % 5 == 4:
+            step.append(f'<tool name="lookup">{{"query": "item {i}", "limit": 3}}</tool>')
+        if i % 9 == 8:
+            step.append(f'<send_dtmf digits="{i % 10}"/>')
+        parts.extend(step)
+        total += sum(len(p) for p in step)
+        i += 1
+    return ''.join(parts)
+
+
+def load_inputs(sizes):
+    """(name, kind, text) for every benchmark input; kind is 'json' or 'xml'."""
+    inputs = []
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, 'ex*.txt')) + glob.glob(os.path.join(FIXTURE_DIR, 'test_case_*.json'))):
+        with open(path) as f:
+            inputs.append((os.path.basename(path), 'json', f.read()))
+    for size in sizes:
+        inputs.append((f'synthetic_{size}', 'json', synthetic_json(size)))
+        inputs.append((f'malformed_{size}', 'json', synthetic_malformed(size)))
+        inputs.append((f'xml_{size}', 'xml', synthetic_xml(size)))
+    return inputs
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _replay_buffer(fn):
+    """Per-chunk call of fn on the buffer so far (the pre-incremental way)."""
+    def run(parts, timings, options):
+        buffer = ''
+        for part in parts:
+            buffer += part
+            start = time.perf_counter()
+            try:
+                fn(buffer)
+            except Exception:
+                pass
+            timings.append(time.perf_counter() - start)
+    return run
+
+
+# Chars between partial() calls; the agent's MR_PARTIAL_COMMAND_MIN_CHARS default.
+PARTIAL_EVERY = 256
+
+
+def _run_streaming_parser(parts, timings, options):
+    parser = StreamingCommandParser()
+    since_partial = 0
+    for part in parts:
+        start = time.perf_counter()
+        parser.feed(part)
+        since_partial += len(part)
+        if since_partial >= options['partial_every']:
+            parser.partial()
+            since_partial = 0
+        timings.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    parser.finish()
+    timings.append(time.perf_counter() - start)
+
+
+def _run_recover_long_form(parts, timings, options):
+    buffer = ''.join(parts)
+    start = time.perf_counter()
+    try:
+        recover_long_form(buffer)
+    except Exception:
+        pass
+    timings.append(time.perf_counter() - start)
+
+
+def _run_xml_event_stream(parts, timings, options):
+    stream = XmlEventStream()
+    for part in parts:
+        start = time.perf_counter()
+        stream.feed(part)
+        timings.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    stream.finish()
+    timings.append(time.perf_counter() - start)
+
+
+# name -> (input kind, replays the whole buffer per chunk, runner)
+BENCHMARKS = {
+    'streaming_parser': ('json', False, _run_streaming_parser),
+    'parse_streaming_commands': ('json', True, _replay_buffer(parse_streaming_commands)),
+    'replace_raw_blocks': ('json', True, _replay_buffer(replace_raw_blocks)),
+    'merge_json_arrays': ('json', True, _replay_buffer(merge_json_arrays)),
+    'recover_long_form': ('json', False, _run_recover_long_form),
+    'xml_event_stream': ('xml', False, _run_xml_event_stream),
+}
+
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_benchmarks(sizes, chunk_size, max_replay, only=None, partial_every=PARTIAL_EVERY):
+    results = []
+    options = {'partial_every': partial_every}
+    # The quiet default keeps fallback error output from swamping the report.
+    stdout = sys.stdout
+    for name, (kind, replays, runner) in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        for input_name, input_kind, text in load_inputs(sizes):
+            if input_kind != kind or (replays and len(text) > max_replay):
+                continue
+            parts = chunks(text, chunk_size)
+            timings = []
+            cpu_start = time.process_time()
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                runner(parts, timings, options)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            cpu = time.process_time() - cpu_start
+            results.append({
+                'benchmark': name,
+                'input': input_name,
+                'chars': len(text),
+                'chunks': len(parts),
+                'cpu_seconds': cpu,
+                'chunk_mean_ms': sum(timings) / len(timings) * 1000 if timings else 0,
+                'chunk_p95_ms': _quantile(timings, 0.95) * 1000 if timings else 0,
+                'chunk_max_ms': max(timings) * 1000 if timings else 0,
+            })
+    return results
+
+
+def print_report(results):
+    print(f"{'benchmark':<26}{'input':<22}{'chars':>8}{'chunks':>8}{'cpu ms':>11}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for r in results:
+        print(f"{r['benchmark']:<26}{r['input']:<22}{r['chars']:>8}{r['chunks']:>8}"
+              f"{r['cpu_seconds'] * 1000:>11.2f}{r['chunk_mean_ms']:>10.3f}{r['chunk_p95_ms']:>10.3f}{r['chunk_max_ms']:>10.3f}")
+
+
+def compare(results, baseline, threshold):
+    """Regressions against a saved run, as printable lines."""
+    previous = {(r['benchmark'], r['input']): r for r in baseline}
+    regressions = []
+    for r in results:
+        base = previous.get((r['benchmark'], r['input']))
+        if base is None:
+            continue
+        if r['cpu_seconds'] > base['cpu_seconds'] * threshold and r['cpu_seconds'] - base['cpu_seconds'] > NOISE_FLOOR:
+            regressions.append(f"{r['benchmark']} on {r['input']}: {r['cpu_seconds'] * 1000:.2f}ms "
+                               f"(baseline {base['cpu_seconds'] * 1000:.2f}ms)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark command stream parsing.')
+    parser.add_argument('--sizes', default='2000,20000,100000', help='synthetic response sizes in chars, comma separated')
+    parser.add_argument('--chunk', type=int, default=20, help='chars per streamed chunk')
+    parser.add_argument('--partial-every', type=int, default=PARTIAL_EVERY, help='chars between partial() calls in streaming_parser')
+    parser.add_argument('--max-replay', type=int, default=20000, help='longest input for whole-buffer benchmarks')
+    parser.add_argument('--only', help='comma separated benchmark names')
+    parser.add_argument('--save', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against results saved with --save')
+    parser.add_argument('--threshold', type=float, default=1.5, help='allowed slowdown factor against the baseline')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    only = set(args.only.split(',')) if args.only else None
+    results = run_benchmarks(sizes, args.chunk, args.max_replay, only, args.partial_every)
+    print_report(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print('\nRegressions:')
+            for line in regressions:
+                print('  ' + line)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import json
+import os
 import re
 from typing import List, Dict, Tuple, Any
 from partial_json_parser import loads, ensure_json
@@ -6,6 +7,8 @@ from lib.json_str_block import replace_raw_blocks
 from lib.utils.parse_json_newlines_partial import json_loads
 from lib.utils.merge_arrays import merge_json_arrays
 from lib.json_escape import escape_for_json
+from lib.utils.offload import run_with_budget
+from coreplugins.agent.long_form_recovery import recover_long_form
 import sys
 import traceback
 
@@ -149,6 +152,364 @@ def parse_streaming_commands(buffer: str) -> Tuple[List[Dict[str, Any]], str]:
         current_partial = None
     return (complete_commands, current_partial)
 
+RAW_START = 'START_RAW'
+RAW_END = 'END_RAW'
+CUT_MARKER = '<<CUT_HERE>>'
+# START_RAW is followed by a newline (possibly an escaped one) that is not
+# part of the raw text.
+_RAW_LEAD = re.compile('[ \\t]*(\\r?\\n|\\\\n)?')
+_STRING_SPECIAL = re.compile('["\\\\]')
+_PLAIN = re.compile('[^"{}\\[\\]S]+')
+
+
+def recover_element(source: str) -> List[Any]:
+    """Slow fallbacks for one command element that json.loads rejected."""
+    try:
+        commands, _ = parse_streaming_commands('[' + source + ']')
+        if isinstance(commands, list) and len(commands) > 0:
+            return commands
+    except Exception:
+        pass
+    try:
+        commands = recover_long_form('[' + source + ']')
+        if commands:
+            return commands
+    except Exception:
+        pass
+    return []
+
+
+def _recovery_budget(final):
+    name, default = ('MR_PARSE_RECOVERY_FINAL_BUDGET', '5') if final else ('MR_PARSE_RECOVERY_BUDGET', '0.25')
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+class _Unparsed:
+    __slots__ = ('source', 'attempted')
+
+    def __init__(self, source):
+        self.source = source
+        self.attempted = False
+
+
+class StreamingCommandParser:
+    """Incremental parser for a streamed command list.
+
+    parse_streaming_commands() re-parses the whole buffer for every chunk,
+    which is quadratic in the length of the response. This parser keeps its
+    scanner state between chunks, so feed() only looks at the new text.
+
+    Commands are the elements of the top-level JSON array. Bare top-level
+    objects and further arrays (e.g. '}] <>\\n[{' from some models) continue
+    the same list, as merge_json_arrays() does. START_RAW/END_RAW blocks are
+    turned into JSON strings as they stream, and the first <<CUT_HERE>>
+    discards everything before it (later ones are ordinary text, as in
+    parse_streaming_commands()).
+
+    A completed element is decoded with json.loads(strict=False). Elements
+    that fail are held back, together with everything after them, until
+    recover() (or finish()) runs the slow fallbacks (recover_element) on
+    them. partial() decodes the element in progress by closing its open
+    string and brackets.
+    """
+
+    def __init__(self):
+        self.commands: List[Any] = []
+        self._deferred: List[Any] = []
+        self._cut_tail = ''
+        self._cut = False
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pending = ''
+        self._element: List[str] = []
+        self._stack: List[str] = []
+        self._in_element = False
+        self._in_string = False
+        self._escape = False
+        self._raw = None
+        self._raw_lead = False
+        self._raw_buf = ''
+        self._after_raw = False
+        self._partial = None
+        self._partial_stale = False
+
+    def feed(self, text: str) -> List[Any]:
+        """Consume the next chunk; returns the commands it completed."""
+        if not text:
+            return []
+        if not self._cut:
+            combined = self._cut_tail + text
+            cut = combined.find(CUT_MARKER)
+            if cut >= 0:
+                self._cut = True
+                self.commands = []
+                self._deferred = []
+                self._reset_state()
+                text = combined[cut + len(CUT_MARKER):]
+            self._cut_tail = combined[-(len(CUT_MARKER) - 1):]
+        before = len(self.commands)
+        self._pending += text
+        self._scan()
+        self._partial_stale = True
+        return self.commands[before:]
+
+    def finish(self, recover=True) -> List[Any]:
+        """Consume input held back for lookahead at the end of the stream
+        and, unless recover=False, run recovery inline (for synchronous
+        callers; the agent uses await recover(final=True))."""
+        before = len(self.commands)
+        self._scan(final=True)
+        self._partial_stale = True
+        if recover:
+            while self._deferred:
+                item = self._deferred.pop(0)
+                self._add(recover_element(item.source) if isinstance(item, _Unparsed) else [item], item)
+        return self.commands[before:]
+
+    @property
+    def needs_recovery(self) -> bool:
+        """True if a failed element has not been tried yet (or at the end of
+        the stream, if any are left)."""
+        return any(isinstance(item, _Unparsed) and not item.attempted for item in self._deferred)
+
+    async def recover(self, final=False) -> List[Any]:
+        """Run the fallbacks for held-back elements in a worker thread.
+
+        Each element is tried once while streaming, within
+        MR_PARSE_RECOVERY_BUDGET seconds (default 0.25). One that runs over is
+        left for the final call at the end of the stream, which allows
+        MR_PARSE_RECOVERY_FINAL_BUDGET (default 5) and then gives up on it.
+        """
+        before = len(self.commands)
+        while self._deferred:
+            item = self._deferred[0]
+            if isinstance(item, _Unparsed):
+                if item.attempted and not final:
+                    break
+                item.attempted = True
+                recovered = await run_with_budget(recover_element, item.source, budget=_recovery_budget(final))
+                if recovered is None and not final:
+                    break
+                self._add(recovered or [], item)
+            else:
+                self._add([item], item)
+            self._deferred.pop(0)
+        return self.commands[before:]
+
+    def _add(self, commands, item):
+        if commands:
+            self.commands.extend(commands)
+        elif isinstance(item, _Unparsed):
+            print("\033[91m" + "Could not parse command: " + item.source[:200] + "\033[0m")
+
+    def _scan(self, final=False):
+        text = self._pending
+        n = len(text)
+        i = 0
+        out = self._element
+        while i < n:
+            if self._raw is not None:
+                if self._raw_lead:
+                    m = _RAW_LEAD.match(text, i)
+                    if m.end() == n and not final:
+                        break
+                    i = m.end()
+                    self._raw_lead = False
+                    continue
+                j = text.find(RAW_END, i)
+                if j < 0:
+                    # Hold back what could be the start of a split END_RAW.
+                    keep = n
+                    if not final:
+                        for k in range(min(len(RAW_END) - 1, n - i), 0, -1):
+                            if RAW_END.startswith(text[n - k:]):
+                                keep = n - k
+                                break
+                    self._raw_buf += text[i:keep]
+                    i = keep
+                    break
+                self._raw_buf += text[i:j]
+                i = j + len(RAW_END)
+                out.append(json.dumps(self._raw_buf))
+                self._after_raw = self._raw
+                self._raw = None
+                self._raw_buf = ''
+                if not self._stack:
+                    self._complete()
+                continue
+            c = text[i]
+            if self._after_raw:
+                # A START_RAW inside quotes is closed by END_RAW followed by
+                # the (now redundant) closing quote.
+                if c in ' \t\r\n':
+                    i += 1
+                    continue
+                self._after_raw = False
+                if c == '"':
+                    i += 1
+                    continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    out.append(c)
+                    i += 1
+                    continue
+                m = _STRING_SPECIAL.search(text, i)
+                if m is None:
+                    out.append(text[i:])
+                    i = n
+                    break
+                j = m.start()
+                out.append(text[i:j + 1])
+                i = j + 1
+                if text[j] == '\\':
+                    self._escape = True
+                else:
+                    self._in_string = False
+                    if not self._stack:
+                        self._complete()
+                continue
+            if c == '"' or c == 'S':
+                start = i + 1 if c == '"' else i
+                ahead = text[start:start + len(RAW_START)]
+                if ahead == RAW_START:
+                    if not self._in_element:
+                        self._in_element = True
+                    self._raw = c == '"'
+                    self._raw_lead = True
+                    self._raw_buf = ''
+                    i = start + len(RAW_START)
+                    continue
+                if not final and len(ahead) < len(RAW_START) and RAW_START.startswith(ahead) and (c == '"' or ahead):
+                    break
+                if c == '"':
+                    self._in_element = True
+                    self._in_string = True
+                    out.append(c)
+                elif self._in_element:
+                    out.append(c)
+                i += 1
+                continue
+            if not self._in_element:
+                if c == '{':
+                    self._in_element = True
+                    self._stack.append('{')
+                    out.append(c)
+                # '[', ']', ',' and anything else between elements is skipped.
+                i += 1
+                continue
+            if c == '{' or c == '[':
+                self._stack.append(c)
+                out.append(c)
+                i += 1
+            elif c == '}' or c == ']':
+                if self._stack:
+                    self._stack.pop()
+                out.append(c)
+                i += 1
+                if not self._stack:
+                    self._complete()
+            else:
+                m = _PLAIN.match(text, i)
+                j = m.end() if m else i + 1
+                out.append(text[i:j])
+                i = j
+        self._pending = text[i:]
+
+    def _complete(self):
+        source = ''.join(self._element)
+        self._element.clear()
+        self._stack.clear()
+        self._in_element = False
+        self._in_string = False
+        self._escape = False
+        try:
+            command = json.loads(source, strict=False)
+        except ValueError:
+            command = _Unparsed(source)
+        if self._deferred or isinstance(command, _Unparsed):
+            self._deferred.append(command)
+        else:
+            self.commands.append(command)
+
+    def partial(self):
+        """The command being streamed, decoded as far as it goes (or None)."""
+        if not self._partial_stale:
+            return self._partial
+        self._partial_stale = False
+        self._partial = None
+        if not self._in_element:
+            return None
+        base = ''.join(self._element)
+        closed = base
+        if self._raw is not None:
+            closed += json.dumps(self._raw_buf)
+        elif self._in_string:
+            if self._escape:
+                closed = closed[:-1]
+            closed += '"'
+        closed = closed.rstrip().rstrip(',')
+        closed += ''.join('}' if b == '{' else ']' for b in reversed(self._stack))
+        try:
+            parsed = json.loads(closed, strict=False)
+        except ValueError:
+            try:
+                parsed = loads(closed)
+            except Exception:
+                return None
+        if isinstance(parsed, dict):
+            self._partial = parsed
+        return self._partial
+
+
+class BufferCommandParser:
+    """StreamingCommandParser interface over parse_streaming_commands(),
+    which re-parses the whole buffer (MR_INCREMENTAL_PARSER=0)."""
+
+    def __init__(self):
+        self.buffer = ''
+        self.commands: List[Any] = []
+        self._partial = None
+
+    def feed(self, text: str) -> List[Any]:
+        before = len(self.commands)
+        self.buffer += text
+        buffer = self.buffer
+        if len(buffer) > 0 and buffer[0] == '{':
+            buffer = '[' + buffer
+        buffer = buffer.replace('}] <>\n\n[{', '}, {')
+        buffer = buffer.replace('}] <>\n[{', '}, {')
+        commands, partial = parse_streaming_commands(buffer)
+        if isinstance(commands, int):
+            # Not parseable yet; keep the last result.
+            return []
+        self._partial = partial
+        if not isinstance(commands, list):
+            commands = [commands]
+        self.commands = commands
+        return self.commands[before:]
+
+    def finish(self, recover=True) -> List[Any]:
+        return []
+
+    needs_recovery = False
+
+    async def recover(self, final=False) -> List[Any]:
+        return []
+
+    def partial(self):
+        return self._partial
+
+
+def get_command_parser():
+    if os.environ.get('MR_INCREMENTAL_PARSER', '1').lower() in ('0', 'false', 'no', 'off'):
+        return BufferCommandParser()
+    return StreamingCommandParser()
+
 def invalid_start_format(str):
     is_invalid = re.match('^[^\\s\\[\\{]', str)
     return is_invalid
@@ -228,6 +589,54 @@ class TestCommandParser(unittest.TestCase):
         self.assertEqual(len(commands), 0)
         self.assertEqual(partial, {'key': 'value'})
 
+class TestStreamingCommandParser(unittest.TestCase):
+
+    def feed_chars(self, buffer):
+        parser = StreamingCommandParser()
+        for char in buffer:
+            parser.feed(char)
+        return parser
+
+    def test_held_back_until_recovered(self):
+        parser = self.feed_chars('[{"say": {"text": "Hello"}, "x"}, {"say": {"text": "after"}}]')
+        self.assertEqual(parser.commands, [])
+        self.assertTrue(parser.needs_recovery)
+        parser.finish()
+        self.assertEqual(len(parser.commands), 2)
+        self.assertEqual(parser.commands[1], {'say': {'text': 'after'}})
+
+    def test_commands_across_chunks(self):
+        parser = self.feed_chars('[{"say": {"text": "Hello"}}, {"do_something": {"arg1": "valu')
+        self.assertEqual(parser.commands, [{'say': {'text': 'Hello'}}])
+        self.assertEqual(parser.partial(), {'do_something': {'arg1': 'valu'}})
+
+    def test_raw_block(self):
+        parser = self.feed_chars('[{"write": {"filename": "/test.py", "text": START_RAW\ndef foo():\n    print("hi")\nEND_RAW\n}}]')
+        self.assertEqual(parser.commands, [{'write': {'filename': '/test.py', 'text': 'def foo():\n    print("hi")\n'}}])
+
+    def test_quoted_raw_block(self):
+        parser = self.feed_chars('[{"say": {"text": "START_RAW\nsay "hi"\nEND_RAW\n"}}]')
+        self.assertEqual(parser.commands, [{'say': {'text': 'say "hi"\n'}}])
+
+    def test_partial_raw_block(self):
+        parser = self.feed_chars('[{"write": {"text": START_RAW\nline one\nline')
+        self.assertEqual(parser.partial(), {'write': {'text': 'line one\nline'}})
+
+    def test_cut_here(self):
+        parser = self.feed_chars('[{"say": {"text": "old"}}<<CUT_HERE>>[{"say": {"text": "new"}}]')
+        self.assertEqual(parser.commands, [{'say': {'text': 'new'}}])
+
+    def test_buffer_parser_ignores_int_result(self):
+        parser = BufferCommandParser()
+        self.assertEqual(parser.feed('1'), [])
+        self.assertEqual(parser.commands, [])
+
+    def test_only_first_cut_here(self):
+        buffer = 'old<<CUT_HERE>>[{"say": {"text": "use <<CUT_HERE>> to cut"}}]'
+        parser = self.feed_chars(buffer)
+        self.assertEqual(parser.commands, [{'say': {'text': 'use <<CUT_HERE>> to cut'}}])
+        self.assertEqual(parser.commands, parse_streaming_commands(buffer)[0])
+
 def ex6():
     buffer = '\n[ {"write": { "filename": "/test.py",\n              "text": "START_RAW\ndef foo():\n    #print(\'hello world\')\nEND_RAW\n" }\n } \n]\n'
     commands, partial = parse_streaming_commands(buffer)
\ No newline at end of file
@@ -19,6 +19,7 @@ from lib.providers.services import service, service_manager
 from lib.providers.commands import command_manager
 from lib.utils.debug import debug_box
 from lib.session_files import load_session_data, save_session_data
+from mindroot.lib.message_snapshot import thaw
 import os
 import json
 from lib.chatcontext import ChatContext
@@ -378,8 +379,8 @@ async def get_persona_faceref(persona_path: str):
     )
 
 @router.get("/chat/{log_id}/events")
-async def chat_events(log_id: str):
-    return EventSourceResponse(await subscribe_to_agent_messages(log_id))
+async def chat_events(log_id: str, deltas: bool = False):
+    return EventSourceResponse(await subscribe_to_agent_messages(log_id, deltas=deltas))
 
 
 @router.post("/chat/{log_id}/send")
@@ -711,7 +712,7 @@ async def run_task_route(request: Request, agent_name: str, task_request: TaskRe
                 context.data.pop('llm', None)
                 context.current_model = None
                 context.chat_log = ChatLog(log_id=new_log_id, agent=agent_name, user=user, parent_log_id=requested_log_id)
-                context.chat_log.messages = existing_context.chat_log.get_recent()
+                context.chat_log.messages = thaw(existing_context.chat_log.messages)
                 await context.chat_log.save_log()
                 await context.save_context()
                 continued = True
@@ -839,7 +840,7 @@ async def delete_chat_session(request: Request, log_id: str, user=Depends(requir
         # If we still don't have the agent name, try to find the chatlog file
         if agent_name == "unknown":
             from lib.chatlog import find_chatlog_file
-            chatlog_path = find_chatlog_file(log_id)
+            chatlog_path = await find_chatlog_file(log_id)
             if chatlog_path:
                 # Extract agent from path: data/chat/{user}/{agent}/chatlog_{log_id}.json
                 path_parts = chatlog_path.split(os.sep)
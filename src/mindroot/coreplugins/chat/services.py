@@ -1,11 +1,15 @@
 from lib.providers.services import service, service_manager
 from lib.providers.commands import command_manager, command
-from lib.providers.hooks import hook
+from lib.providers.hooks import hook, hook_manager
+from lib.providers.service_cache import ServiceCache
+from lib.utils.single_flight import SingleFlight
+from mindroot.lib.metrics import metrics
 from lib.pipelines.pipe import pipeline_manager, pipe
 from lib.chatcontext import ChatContext
 from lib.chatlog import ChatLog
 from typing import List
 from lib.utils.dataurl import dataurl_to_pil
+from lib.blob_store import rehydrate_messages_async
 from .models import MessageParts
 from coreplugins.agent import agent
 from coreplugins.agent.speech_to_speech import SpeechToSpeechAgent
@@ -26,11 +30,54 @@ import nanoid
 import logging
 logger = logging.getLogger(__name__)
 sse_clients = {}
-from lib.chatcontext import get_context
+from lib.chatcontext import get_context, contexts, flush_all_contexts
 active_tasks = {}
 
+def _env_number(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+# Responses of prompt() calls that opted in to caching, keyed by
+# (model, instructions, temperature, max_tokens, json, user).
+_prompt_cache = ServiceCache(ttl=_env_number('MR_PROMPT_CACHE_TTL', 3600) or None,
+                             maxsize=int(_env_number('MR_PROMPT_CACHE_SIZE', 500)), cache_falsy=False)
+_prompt_cache.name = 'prompt'
+_prompt_inflight = SingleFlight()
+metrics.register_gauges('prompt_cache', lambda: dict(_prompt_cache.stats(), inflight=len(_prompt_inflight)))
+
+def _prompt_cache_default():
+    return os.environ.get('MR_PROMPT_CACHE', '').lower() in ('1', 'true', 'yes', 'on')
+
 @service()
-async def prompt(model: str, instructions: str, temperature=0, max_tokens=400, json=False, context=None):
+async def prompt(model: str, instructions: str, temperature=0, max_tokens=400, json=False, cache=None, shared=False, context=None):
+    """Single-shot LLM call, returns the response text.
+
+    Concurrent identical calls at temperature 0 by the same user share one
+    provider request. With cache=True (default for temperature 0 calls when
+    MR_PROMPT_CACHE=1) the response is also reused for later identical calls
+    for MR_PROMPT_CACHE_TTL seconds (default 3600), up to MR_PROMPT_CACHE_SIZE
+    entries (default 500).
+
+    With shared=True calls from different users share requests and cached
+    responses too. The request runs (and its usage is recorded) under the
+    context of the first caller only.
+    """
+    if cache is None:
+        cache = temperature == 0 and _prompt_cache_default()
+    if not cache and temperature != 0:
+        return await _run_prompt(model, instructions, temperature, max_tokens, json, context)
+    # Without an explicit model the agent's default model is used.
+    model_key = model if model else ('agent', getattr(context, 'agent_name', None))
+    user = None if shared else getattr(context, 'username', None)
+    args = (model_key, instructions, temperature, max_tokens, json, user)
+    factory = lambda: _run_prompt(model, instructions, temperature, max_tokens, json, context)
+    if cache:
+        return await _prompt_cache.call(lambda *_: factory(), args, {})
+    return await _prompt_inflight.do(args, factory)
+
+async def _run_prompt(model, instructions, temperature, max_tokens, json, context):
     messages = [{'role': 'system', 'content': 'Respond to prompt with no extraneous commentary.'}, {'role': 'user', 'content': instructions}]
     stream = await context.stream_chat(model, temperature=temperature, max_tokens=max_tokens, messages=messages, json=False, context=context)
     text = ''
@@ -202,12 +249,39 @@ async def init_chat_session(user: str, agent_name: str, log_id: str, context=Non
         pass
     return log_id
 
+def _history_budget(context):
+    """Token budget for history sent to the LLM: the agent's
+    max_history_tokens, else MR_HISTORY_MAX_TOKENS (0 = unlimited)."""
+    if isinstance(context.agent, dict) and context.agent.get('max_history_tokens'):
+        try:
+            return int(context.agent['max_history_tokens'])
+        except (TypeError, ValueError):
+            pass
+    return None
+
+async def _summarize_evicted_history(context, history_budget):
+    """If a summarize_history service is installed, summarize messages that
+    fell out of the history window, in batches of MR_HISTORY_SUMMARY_EVERY."""
+    if 'summarize_history' not in service_manager.functions:
+        return
+    end, evicted = context.chat_log.unsummarized_span(history_budget)
+    if len(evicted) < int(os.environ.get('MR_HISTORY_SUMMARY_EVERY', 20)):
+        return
+    previous = (context.chat_log.window_summary or {}).get('text')
+    try:
+        summary = await service_manager.summarize_history(await rehydrate_messages_async(evicted), previous, context=context)
+        if summary:
+            await context.chat_log.set_window_summary(end, summary)
+    except Exception as e:
+        logger.warning(f"summarize_history failed: {e}")
+
 @service()
 async def get_chat_history(agent_name: str, session_id: str, user: str):
     agent = await service_manager.get_agent_data(agent_name)
     persona = agent['persona']['name']
     chat_log = ChatLog(log_id=session_id, agent=agent_name, user=user)
-    messages = chat_log.get_recent()
+    # The whole history for the UI; the token window is for the LLM prompt.
+    messages = await rehydrate_messages_async(chat_log.get_recent(max_tokens=0))
     for message in messages:
         if message['role'] == 'user':
             message['persona'] = 'user'
@@ -241,6 +315,17 @@ def process_result(result, formatted_results):
 in_progress = {}
 
 
+def _session_busy(session_id):
+    """Keep a session's ChatContext cached while a turn is running or a
+    client is subscribed to its events."""
+    if in_progress.get(session_id) or sse_clients.get(session_id):
+        return True
+    task = active_tasks.get(session_id)
+    return task is not None and not task.done()
+
+contexts.register_busy_check(_session_busy)
+
+
 async def _cancel_or_finish_active_command(context, timeout=1.0):
     """Cancel ordinary commands, but allow a parsed atomic control to finish."""
     task = context.data.get('active_command_task')
@@ -356,10 +441,17 @@ async def send_message_to_agent(session_id: str, message: str | List[MessagePart
         user = user.dict()
     else:
         pass
+    # Context saves during the turn are coalesced into one write at the end.
+    turn_context = context
     if context is not None:
+        context.begin_turn()
         context.data['cancel_current_turn'] = False
         context.data['finished_conversation'] = False
-        await context.save_context()
+        try:
+            await context.save_context()
+        except BaseException:
+            await context.end_turn()
+            raise
     else:
         pass
     in_progress[session_id] = True
@@ -389,6 +481,8 @@ async def send_message_to_agent(session_id: str, message: str | List[MessagePart
         if context is None:
             context = ChatContext(command_manager, service_manager, user)
             await context.load_context(session_id)
+            turn_context = context
+            context.begin_turn()
         else:
             pass
         agent_ = agent.Agent(agent=context.agent)
@@ -461,7 +555,10 @@ async def send_message_to_agent(session_id: str, message: str | List[MessagePart
                     pass
                 parse_error = False
                 max_tokens = os.environ.get('MR_MAX_TOKENS', 4000)
-                results, full_cmds = await agent_.chat_commands(context.current_model, context, messages=context.chat_log.get_recent(), max_tokens=max_tokens)
+                history_budget = _history_budget(context)
+                await _summarize_evicted_history(context, history_budget)
+                history = context.chat_log.get_recent(max_tokens=history_budget)
+                results, full_cmds = await agent_.chat_commands(context.current_model, context, messages=history, max_tokens=max_tokens)
                 if results is not None:
                     try:
                         for result in results:
@@ -592,9 +689,11 @@ async def send_message_to_agent(session_id: str, message: str | List[MessagePart
         raise
     except Exception as e:
         in_progress.pop(session_id, None)
+        active_tasks.pop(session_id, None)
         return []
     finally:
-        pass
+        if turn_context is not None:
+            await turn_context.end_turn()
 
 @pipe(name='process_results', priority=5)
 def add_current_time(data: dict, context=None) -> dict:
@@ -620,14 +719,109 @@ async def quit(context=None):
     else:
         pass
     sse_clients.clear()
+    await hook_manager.drain(timeout=5)
+    await flush_all_contexts()
     await asyncio.sleep(1)
     return {'status': 'shutdown_complete'}
 
+class SubscriberQueue(asyncio.Queue):
+    """Event queue of one SSE subscriber.
+
+    Also holds the subscriber's partial_command state: the params last sent
+    per cmd_id (for deltas), when they were sent, and updates held back
+    while the subscriber is lagging.
+    """
+
+    def __init__(self, deltas=False):
+        super().__init__()
+        self.deltas = deltas
+        self.sent_params = {}
+        self.last_partial = {}
+        self.pending = {}
+
+    def forget(self, cmd_id):
+        self.sent_params.pop(cmd_id, None)
+        self.last_partial.pop(cmd_id, None)
+        self.pending.pop(cmd_id, None)
+
+def _partial_lag_interval(depth):
+    """Minimum seconds between partial_command updates for a subscriber with
+    depth events still queued (0 = no limit)."""
+    if depth <= 0:
+        return 0
+    step = float(os.environ.get('MR_PARTIAL_COMMAND_LAG_STEP', '0.05'))
+    return min(step * depth, float(os.environ.get('MR_PARTIAL_COMMAND_MAX_INTERVAL', '1.0')))
+
+def _params_delta(old, new):
+    """Changes turning params old into new: {'append': {key: suffix},
+    'set': {key: value}, 'remove': [key]} ({} if unchanged), or None if they
+    are not both dicts."""
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return None
+    delta = {}
+    for key, value in new.items():
+        if key not in old:
+            delta.setdefault('set', {})[key] = value
+            continue
+        previous = old[key]
+        if isinstance(value, str) and isinstance(previous, str) and value.startswith(previous):
+            if len(value) > len(previous):
+                delta.setdefault('append', {})[key] = value[len(previous):]
+        elif value != previous:
+            delta.setdefault('set', {})[key] = value
+    removed = [key for key in old if key not in new]
+    if removed:
+        delta['remove'] = removed
+    return delta
+
+def _send_partial(queue, data, now):
+    cmd_id = data.get('cmd_id')
+    queue.pending.pop(cmd_id, None)
+    params = data.get('params')
+    if queue.deltas and cmd_id is not None:
+        delta = _params_delta(queue.sent_params.get(cmd_id), params)
+        queue.sent_params[cmd_id] = params
+        if delta == {}:
+            return
+        if delta is not None:
+            out = {k: v for k, v in data.items() if k not in ('chunk', 'params', 'json')}
+            out['delta'] = delta
+            queue.put_nowait({'event': 'partial_command', 'data': json.dumps(out)})
+            queue.last_partial[cmd_id] = now
+            return
+    if not data.get('chunk'):
+        data['chunk'] = json.dumps(params)
+    # Serialized once and shared by all subscribers that take full updates.
+    if 'json' not in data:
+        data['json'] = json.dumps({k: v for k, v in data.items() if k != 'json'})
+    queue.put_nowait({'event': 'partial_command', 'data': data['json']})
+    queue.last_partial[cmd_id] = now
+
+def _publish_partial(queues, data):
+    """Send a partial_command event to each subscriber, or hold it back
+    for subscribers that are lagging (see partial_command)."""
+    final = data.pop('final', False)
+    cmd_id = data.get('cmd_id')
+    now = time.monotonic()
+    for queue in list(queues):
+        if not final and now - queue.last_partial.get(cmd_id, 0) < _partial_lag_interval(queue.qsize()):
+            queue.pending[cmd_id] = data
+            continue
+        _send_partial(queue, data, now)
+
+def _flush_partials(queue):
+    now = time.monotonic()
+    for data in list(queue.pending.values()):
+        _send_partial(queue, data, now)
+
 @service()
-async def subscribe_to_agent_messages(session_id: str, context=None):
+async def subscribe_to_agent_messages(session_id: str, deltas: bool=False, context=None):
+    """SSE event stream for a session. With deltas=True, partial_command
+    events after the first for a command carry only a 'delta' of the params
+    (see _params_delta) instead of the full 'params' and 'chunk'."""
 
     async def event_generator():
-        queue = asyncio.Queue()
+        queue = SubscriberQueue(deltas=deltas)
         if session_id not in sse_clients:
             sse_clients[session_id] = set()
         else:
@@ -660,9 +854,18 @@ async def close_chat_session(session_id: str, context=None):
 @service()
 async def agent_output(event: str, data: dict, context=None):
     log_id = context.log_id
-    if log_id in sse_clients:
+    if log_id in sse_clients and event == 'partial_command':
+        _publish_partial(sse_clients[log_id], data)
+        await asyncio.sleep(0)
+    elif log_id in sse_clients:
         payload = {'event': event, 'data': json.dumps(data)}
         for queue in list(sse_clients[log_id]):
+            # Partial updates held back for a lagging subscriber go out
+            # before anything that follows them.
+            if queue.pending:
+                _flush_partials(queue)
+            if event == 'command_result':
+                queue.forget(data.get('cmd_id'))
             try:
                 queue.put_nowait(payload)
             except asyncio.QueueFull:
@@ -676,10 +879,26 @@ async def append_message(role: str, content, context=None):
     await context.chat_log.add_message_async({'role': role, 'content': content})
 
 @service()
-async def partial_command(command: str, chunk: str, params, cmd_id=None, context=None):
+async def partial_command(command: str, chunk: str, params, cmd_id=None, final=False, context=None):
+    """Report the current state of a command that is still streaming.
+
+    chunk (params as JSON) may be ''; it is then only serialized if a
+    partial_command pipe or a subscriber taking full updates needs it.
+    Emitted through agent_output, where subscribers that have fallen behind
+    (events still queued) get updates at most every
+    MR_PARTIAL_COMMAND_LAG_STEP seconds per queued event (default 0.05, up
+    to MR_PARTIAL_COMMAND_MAX_INTERVAL, default 1.0); the latest skipped
+    update is sent before their next other event. final=True (the complete
+    command) is never held back.
+    """
     agent_ = context.agent
+    if not chunk and pipeline_manager.pipes.get('partial_command'):
+        chunk = json.dumps(params)
     await pipeline_manager.execute_pipeline('partial_command', {'command': command, 'chunk': chunk, 'params': params, 'cmd_id': cmd_id}, context=context)
-    await context.agent_output('partial_command', {'command': command, 'chunk': chunk, 'params': params, 'persona': agent_['persona']['name'], 'cmd_id': cmd_id})
+    data = {'command': command, 'chunk': chunk, 'params': params, 'persona': agent_['persona']['name'], 'cmd_id': cmd_id}
+    if final:
+        data['final'] = True
+    await context.agent_output('partial_command', data)
 
 @service()
 async def running_command(command: str, args, cmd_id=None, context=None):
@@ -726,7 +945,6 @@ async def cancel_active_response(log_id: str, context=None):
         pass
     context.data['cancel_current_turn'] = True
     try:
-        from lib.providers.hooks import hook_manager
         await hook_manager.on_interrupt(context=context)
         logger.info(f'Called on_interrupt hook for session {log_id}')
     except Exception as e:
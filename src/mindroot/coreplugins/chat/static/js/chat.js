@@ -127,14 +127,14 @@ class Chat extends BaseEl {
       return
     }
     if (window.access_token) {
-      this.sse = new SSE(`/chat/${this.sessionid}/events`, {
+      this.sse = new SSE(`/chat/${this.sessionid}/events?deltas=true`, {
       headers: {
         'Authorization': `Bearer ${window.access_token}`
       }
      });
      this.sse.stream();
     } else {
-      this.sse = new EventSource(`/chat/${this.sessionid}/events`);
+      this.sse = new EventSource(`/chat/${this.sessionid}/events?deltas=true`);
     }
  
     const thisPartial_ = this._partialCmd.bind(this) 
@@ -142,8 +142,27 @@ class Chat extends BaseEl {
     // Growing text commands can be very chatty. Discrete controls such as
     // send_dtmf emit only once and must render immediately rather than being
     // delayed behind a throttled speech update.
+    // With deltas=true the server sends only what changed in a command's
+    // params since its previous partial_command; rebuild the full params
+    // before dispatching.
+    const partialParams = new Map()
     const thisPartialDispatch = e => {
       const data = JSON.parse(e.data);
+      if (data.delta) {
+        const params = Object.assign({}, partialParams.get(data.cmd_id) || {});
+        for (const [key, suffix] of Object.entries(data.delta.append || {})) {
+          params[key] = (params[key] || '') + suffix;
+        }
+        Object.assign(params, data.delta.set || {});
+        for (const key of data.delta.remove || []) {
+          delete params[key];
+        }
+        delete data.delta;
+        data.params = params;
+        data.chunk = JSON.stringify(params);
+        e = { data: JSON.stringify(data) };
+      }
+      partialParams.set(data.cmd_id, data.params);
       return ['speak', 'say', 'json_encoded_md', 'markdown_await_user', 'think'].includes(data.command) ? thisPartial(e) : thisPartial_(e);
     };
     const thisRunning = this._runningCmd.bind(this)
@@ -154,7 +173,10 @@ class Chat extends BaseEl {
     this.sse.addEventListener('image', this._imageMsg.bind(this));
     this.sse.addEventListener('partial_command', thisPartialDispatch);
     this.sse.addEventListener('running_command', e => thisRunning(e).catch(console.error));
-    this.sse.addEventListener('command_result', e => thisResult(e).catch(console.error));
+    this.sse.addEventListener('command_result', e => {
+      partialParams.delete(JSON.parse(e.data).cmd_id);
+      return thisResult(e).catch(console.error);
+    });
     this.sse.addEventListener('finished_chat', e => thisFinished(e).catch(console.error));
     this.sse.addEventListener('system_error', e=> thisError(e).catch(console.error));
     this.sse.addEventListener('backend_user_message', this._backendUserMessage.bind(this));
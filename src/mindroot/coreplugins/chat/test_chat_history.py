@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Tests for get_chat_history (the history shown in the chat UI).
+
+Run from src/mindroot:
+    python coreplugins/chat/test_chat_history.py
+"""
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from coreplugins.chat import services
+from lib.chatlog import ChatLog
+
+
+class TestChatHistory(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {'CHATLOG_DIR': os.path.join(self.tmp.name, 'chat'),
+                                                'CHATLOG_INDEX_DIR': os.path.join(self.tmp.name, 'chat_index'),
+                                                'MR_HISTORY_MAX_TOKENS': '50'})
+        self.env.start()
+        manager = mock.Mock()
+        manager.get_agent_data = mock.AsyncMock(return_value={'persona': {'name': 'persona'}})
+        self.manager = mock.patch.object(services, 'service_manager', manager)
+        self.manager.start()
+
+    def tearDown(self):
+        self.manager.stop()
+        self.env.stop()
+        self.tmp.cleanup()
+
+    async def test_history_is_not_windowed(self):
+        log = ChatLog(log_id='history_test', agent='agent', user='user')
+        for i in range(20):
+            role = 'user' if i % 2 == 0 else 'assistant'
+            log.add_message({'role': role, 'content': [{'type': 'text', 'text': f"message {i} " + 'word ' * 20}]})
+        # The LLM prompt path gets the token window only.
+        self.assertLess(len(log.get_recent()), 20)
+        messages = await services.get_chat_history('agent', 'history_test', 'user')
+        self.assertEqual(len(messages), 20)
+        self.assertEqual([m['persona'] for m in messages[:2]], ['user', 'persona'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Tests for partial_command delivery to SSE subscribers.
+
+Run from src/mindroot:
+    python coreplugins/chat/test_partial_command.py
+"""
+import os
+import sys
+import json
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from coreplugins.chat import services
+from coreplugins.chat.services import SubscriberQueue, sse_clients
+
+
+class FakeContext:
+    """Routes agent_output to the chat service and records what it got."""
+
+    def __init__(self, log_id):
+        self.log_id = log_id
+        self.agent = {'persona': {'name': 'persona'}}
+        self.outputs = []
+
+    async def agent_output(self, event, data):
+        self.outputs.append((event, dict(data)))
+        await services.agent_output(event, data, context=self)
+
+    async def partial_command(self, command, chunk, params, cmd_id=None, final=False):
+        await services.partial_command(command, chunk, params, cmd_id=cmd_id, final=final, context=self)
+
+
+def _events(queue):
+    events = []
+    while not queue.empty():
+        item = queue.get_nowait()
+        events.append((item['event'], json.loads(item['data'])))
+    return events
+
+
+class TestPartialCommand(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.context = FakeContext('partial_command_test')
+        self.full = SubscriberQueue()
+        self.deltas = SubscriberQueue(deltas=True)
+        sse_clients[self.context.log_id] = {self.full, self.deltas}
+
+    def tearDown(self):
+        sse_clients.pop(self.context.log_id, None)
+
+    async def test_goes_through_agent_output(self):
+        sse_clients.pop(self.context.log_id)
+        await self.context.partial_command('say', '', {'text': 'a'}, cmd_id='c1')
+        self.assertEqual(len(self.context.outputs), 1)
+        event, data = self.context.outputs[0]
+        self.assertEqual(event, 'partial_command')
+        self.assertEqual(data['chunk'], '')
+
+    async def test_full_and_delta_updates(self):
+        # Both subscribers keep up (read each event before the next).
+        full, deltas = [], []
+        for text in ('Hel', 'Hello'):
+            await self.context.partial_command('say', '', {'text': text}, cmd_id='c1')
+            full += _events(self.full)
+            deltas += _events(self.deltas)
+        self.assertEqual([data['params'] for _, data in full], [{'text': 'Hel'}, {'text': 'Hello'}])
+        self.assertEqual(json.loads(full[1][1]['chunk']), {'text': 'Hello'})
+        self.assertEqual(deltas[0][1]['params'], {'text': 'Hel'})
+        self.assertEqual(deltas[1][1]['delta'], {'append': {'text': 'lo'}})
+        self.assertNotIn('params', deltas[1][1])
+
+    async def test_lagging_subscriber_gets_latest_before_next_event(self):
+        self.full.put_nowait({'event': 'other', 'data': '{}'})
+        with mock.patch.dict(os.environ, {'MR_PARTIAL_COMMAND_LAG_STEP': '10'}):
+            await self.context.partial_command('say', '', {'text': 'a'}, cmd_id='c1')
+            await self.context.partial_command('say', '', {'text': 'ab'}, cmd_id='c1')
+            await self.context.partial_command('say', '', {'text': 'abc'}, cmd_id='c1')
+            await self.context.agent_output('running_command', {'cmd_id': 'c1'})
+        events = _events(self.full)
+        self.assertEqual([event for event, _ in events], ['other', 'partial_command', 'partial_command', 'running_command'])
+        self.assertEqual(events[2][1]['params'], {'text': 'abc'})
+
+    async def test_final_is_not_held_back(self):
+        self.full.put_nowait({'event': 'other', 'data': '{}'})
+        with mock.patch.dict(os.environ, {'MR_PARTIAL_COMMAND_LAG_STEP': '10'}):
+            await self.context.partial_command('say', '', {'text': 'a'}, cmd_id='c1')
+            await self.context.partial_command('say', '{"text": "ab"}', {'text': 'ab'}, cmd_id='c1', final=True)
+        events = _events(self.full)
+        self.assertEqual(events[-1][1]['params'], {'text': 'ab'})
+        self.assertNotIn('final', events[-1][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Tests for sharing of identical prompt() calls.
+
+Run from src/mindroot:
+    python coreplugins/chat/test_prompt.py
+"""
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from coreplugins.chat import services
+
+
+class FakeContext:
+
+    def __init__(self, username, calls):
+        self.username = username
+        self.agent_name = 'agent'
+        self.calls = calls
+
+    async def stream_chat(self, model, **kwargs):
+        self.calls.append(self.username)
+
+        async def stream():
+            await asyncio.sleep(0.01)
+            yield f"answer for {self.username}"
+        return stream()
+
+
+class TestPromptSharing(unittest.IsolatedAsyncioTestCase):
+
+    async def test_same_user_shares_one_call(self):
+        calls = []
+        context = FakeContext('alice', calls)
+        results = await asyncio.gather(*[services.prompt('model', 'same user', cache=False, context=context)
+                                         for _ in range(3)])
+        self.assertEqual(results, ['answer for alice'] * 3)
+        self.assertEqual(calls, ['alice'])
+
+    async def test_users_are_not_shared(self):
+        calls = []
+        alice, bob = FakeContext('alice', calls), FakeContext('bob', calls)
+        results = await asyncio.gather(services.prompt('model', 'two users', cache=False, context=alice),
+                                       services.prompt('model', 'two users', cache=False, context=bob))
+        self.assertEqual(results, ['answer for alice', 'answer for bob'])
+        self.assertEqual(sorted(calls), ['alice', 'bob'])
+
+    async def test_shared_opt_in(self):
+        calls = []
+        alice, bob = FakeContext('alice', calls), FakeContext('bob', calls)
+        results = await asyncio.gather(services.prompt('model', 'opt in', cache=False, shared=True, context=alice),
+                                       services.prompt('model', 'opt in', cache=False, shared=True, context=bob))
+        self.assertEqual(results, ['answer for alice'] * 2)
+        self.assertEqual(calls, ['alice'])
+
+    async def test_cache_is_per_user(self):
+        calls = []
+        alice, bob = FakeContext('alice', calls), FakeContext('bob', calls)
+        await services.prompt('model', 'cached', cache=True, context=alice)
+        self.assertEqual(await services.prompt('model', 'cached', cache=True, context=alice), 'answer for alice')
+        self.assertEqual(await services.prompt('model', 'cached', cache=True, context=bob), 'answer for bob')
+        self.assertEqual(calls, ['alice', 'bob'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,6 +15,7 @@ as tools. No third-party deps—only Python's `re` module.
 import re
 from lib.providers.commands import command, command_manager
 from lib.providers.services import service
+from lib.pipelines.pipe import pipe
 import traceback
 from collections import Counter
 from .helpers import find_nested_subtask, update_nested_subtask_status, resolve_subtask_id_with_nesting, format_nested_task_status, get_next_incomplete_task, has_incomplete_nested_tasks
@@ -130,6 +131,28 @@ def _format_checklist_status(context):
                 lines.append(f"  {nested_status} {nested_task['label']}")
     return '\n'.join(lines)
 
+@pipe(name='filter_messages', priority=8)
+def keep_checklist_in_window(data: dict, context=None) -> dict:
+    """Keep the checklist visible when older history is windowed out.
+
+    ChatLog.get_recent() drops the oldest messages once the history exceeds
+    its token budget, which can include the instructions and command results
+    that showed the checklist. Append the current status to the system
+    message instead.
+    """
+    chat_log = getattr(context, 'chat_log', None)
+    if chat_log is None or getattr(chat_log, 'window_start', 0) == 0:
+        return data
+    if not context.data.get('checklist', {}).get('tasks'):
+        return data
+    system_msg = data['messages'][0]
+    status = _format_checklist_status(context)
+    if isinstance(system_msg['content'], list):
+        system_msg['content'].append({'type': 'text', 'text': status})
+    else:
+        system_msg['content'] = system_msg['content'] + '\n\n' + status
+    return data
+
 @command()
 async def complete_subtask(subtask_id=None, context=None):
     """
@@ -0,0 +1 @@
+from .mod import *
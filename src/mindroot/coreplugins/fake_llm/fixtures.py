@@ -0,0 +1,92 @@
+"""Recorded LLM streams for the fake_llm provider.
+
+A fixture is one stream_chat response:
+
+    .json   {"first_token_latency": 0.4,
+             "chunks": [["[{\"say\": ", 0.0], ["{\"text\": \"Hi\"}}]", 0.03]]}
+            Each chunk is [text, seconds since the previous chunk] (or a
+            plain string). first_token_latency may be null.
+    .txt    the whole response, replayed in MR_FAKE_LLM_CHUNK_SIZE char
+            chunks (default 20), e.g. lib/json_str_block/ex*.txt.
+
+StreamRecorder captures a live stream in the .json format.
+"""
+import os
+import json
+import time
+from typing import List, Optional, Tuple
+
+FIXTURE_EXTENSIONS = ('.json', '.txt')
+
+
+def _chunk_size():
+    try:
+        return max(1, int(os.environ.get('MR_FAKE_LLM_CHUNK_SIZE', '20')))
+    except ValueError:
+        return 20
+
+
+class Fixture:
+
+    def __init__(self, name: str, chunks: List[Tuple[str, float]], first_token_latency: Optional[float] = None):
+        self.name = name
+        self.chunks = chunks
+        self.first_token_latency = first_token_latency
+
+    @property
+    def text(self) -> str:
+        return ''.join(chunk for chunk, _ in self.chunks)
+
+    @classmethod
+    def load(cls, path: str) -> 'Fixture':
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, 'r') as f:
+            if path.endswith('.txt'):
+                text = f.read()
+                size = _chunk_size()
+                return cls(name, [(text[i:i + size], 0.0) for i in range(0, len(text), size)])
+            data = json.load(f)
+        chunks = [(c, 0.0) if isinstance(c, str) else (c[0], float(c[1])) for c in data.get('chunks', [])]
+        return cls(data.get('name', name), chunks, data.get('first_token_latency'))
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'first_token_latency': self.first_token_latency,
+                'chunks': [[chunk, round(delay, 4)] for chunk, delay in self.chunks]}
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+
+def load_fixtures(path: str) -> List[Fixture]:
+    """Fixtures from a file, or from every fixture file in a directory in
+    name order (the order a multi-step turn replays them in)."""
+    if not path:
+        return []
+    if os.path.isdir(path):
+        names = sorted(n for n in os.listdir(path) if n.endswith(FIXTURE_EXTENSIONS))
+        return [Fixture.load(os.path.join(path, n)) for n in names]
+    return [Fixture.load(path)]
+
+
+class StreamRecorder:
+    """Collects the chunks of one live stream with their timing."""
+
+    def __init__(self, name: str, started: Optional[float] = None):
+        self.name = name
+        self.started = started
+        self.first_token_latency = None
+        self.chunks: List[Tuple[str, float]] = []
+        self._last = started
+
+    def add(self, chunk: str) -> None:
+        now = time.monotonic()
+        if not self.chunks and self.started is not None:
+            self.first_token_latency = now - self.started
+        delay = now - self._last if self._last is not None and self.chunks else 0.0
+        self.chunks.append((chunk, delay))
+        self._last = now
+
+    def fixture(self) -> Fixture:
+        return Fixture(self.name, list(self.chunks), self.first_token_latency)
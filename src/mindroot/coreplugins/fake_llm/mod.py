@@ -0,0 +1,153 @@
+"""Deterministic LLM provider for offline end-to-end runs and benchmarks.
+
+Replay (the default when the plugin is enabled):
+
+    MR_FAKE_LLM_FIXTURES              fixture file or directory (see fixtures.py)
+    MR_FAKE_LLM_TOKEN_DELAY           seconds between chunks, overrides the
+                                      recorded delays (default: recorded)
+    MR_FAKE_LLM_FIRST_TOKEN_LATENCY   seconds before the first chunk
+                                      (default: recorded, else 0)
+    MR_FAKE_LLM_TIME_SCALE            multiplier for all delays (default 1,
+                                      0 = no waiting)
+
+A model named 'fake_llm/<fixture name>' (or just '<fixture name>') replays
+that fixture. Otherwise each session steps through the fixtures in name
+order, one per stream_chat call, wrapping around; with no fixtures every
+call answers with DEFAULT_RESPONSE, which ends the turn.
+
+Record: with MR_FAKE_LLM_RECORD_DIR set, this plugin registers no services
+(so a real provider handles stream_chat) and instead saves every streamed
+response to <dir>/<log_id>-<n>.json with its chunk timing, ready to be used
+as MR_FAKE_LLM_FIXTURES. The pipe only sees chunks, so recordings have no
+first token latency; set MR_FAKE_LLM_FIRST_TOKEN_LATENCY when replaying.
+
+Enable the plugin and put 'fake_llm' in an agent's required_plugins (or
+preferred_providers) to route its stream_chat here.
+"""
+import os
+import json
+import asyncio
+import logging
+from lib.providers.services import service
+from lib.pipelines.pipe import pipe
+from .fixtures import Fixture, StreamRecorder, load_fixtures
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONSE = json.dumps([{"wait_for_user_reply": {"text": "OK."}}])
+
+RECORD_DIR = os.environ.get('MR_FAKE_LLM_RECORD_DIR')
+
+_fixtures = None
+_steps = {}
+_recorders = {}
+stats = {'calls': 0, 'chunks': 0, 'chars': 0}
+
+
+def _env_float(name, default=None):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+def fixtures():
+    """Loaded once; call reload_fixtures() after changing MR_FAKE_LLM_FIXTURES."""
+    global _fixtures
+    if _fixtures is None:
+        _fixtures = load_fixtures(os.environ.get('MR_FAKE_LLM_FIXTURES', ''))
+    return _fixtures
+
+
+def reload_fixtures():
+    global _fixtures
+    _fixtures = None
+    _steps.clear()
+    return fixtures()
+
+
+def _session_id(context):
+    return getattr(context, 'log_id', None) if context is not None else None
+
+
+def select_fixture(model, context=None) -> Fixture:
+    available = fixtures()
+    if not available:
+        return Fixture('default', [(DEFAULT_RESPONSE, 0.0)])
+    if model:
+        name = model.split('/', 1)[1] if model.startswith('fake_llm/') else model
+        for fixture in available:
+            if fixture.name == name:
+                return fixture
+    session = _session_id(context)
+    step = _steps.get(session, 0)
+    _steps[session] = step + 1
+    return available[step % len(available)]
+
+
+async def _replay(fixture: Fixture):
+    scale = _env_float('MR_FAKE_LLM_TIME_SCALE', 1.0)
+    token_delay = _env_float('MR_FAKE_LLM_TOKEN_DELAY')
+    first = _env_float('MR_FAKE_LLM_FIRST_TOKEN_LATENCY', fixture.first_token_latency) or 0.0
+    if first and scale:
+        await asyncio.sleep(first * scale)
+    for i, (chunk, delay) in enumerate(fixture.chunks):
+        if i:
+            delay = token_delay if token_delay is not None else delay
+            if delay and scale:
+                await asyncio.sleep(delay * scale)
+            else:
+                # Still yield to the loop, as a network stream would.
+                await asyncio.sleep(0)
+        stats['chunks'] += 1
+        stats['chars'] += len(chunk)
+        yield chunk
+
+
+async def stream_chat(model, messages=[], context=None, num_ctx=200000, temperature=0.0, max_tokens=5000,
+                      num_gpu_layers=0, json=False, **kwargs):
+    """Replay a recorded response as a chunk stream (ignores the messages)."""
+    fixture = select_fixture(model, context)
+    stats['calls'] += 1
+    logger.debug(f"fake_llm replaying fixture '{fixture.name}' ({len(fixture.chunks)} chunks)")
+    return _replay(fixture)
+
+
+async def format_image_message(pil_image, context=None):
+    """Images are not sent anywhere; a placeholder text part is returned."""
+    return {"type": "text", "text": f"[image {getattr(pil_image, 'size', '')}]"}
+
+
+async def record_stream(data: dict, context=None) -> dict:
+    """Save the raw streamed response (before other process_stream pipes)."""
+    session = _session_id(context) or 'session'
+    if data.get('finish'):
+        recorder = _recorders.pop(session, None)
+        if recorder is not None and recorder.chunks:
+            path = os.path.join(RECORD_DIR, f"{recorder.name}.json")
+            try:
+                recorder.fixture().save(path)
+            except Exception as e:
+                logger.error(f"fake_llm could not save recording {path}: {e}")
+        return data
+    chunk = data.get('chunk')
+    if chunk:
+        recorder = _recorders.get(session)
+        if recorder is None:
+            count = _steps.get(session, 0)
+            _steps[session] = count + 1
+            recorder = _recorders[session] = StreamRecorder(f"{session}-{count:03d}")
+        recorder.add(chunk)
+    return data
+
+
+if RECORD_DIR:
+    # Pipes run in ascending priority order: run first, so the raw chunks
+    # are recorded before other pipes transform them.
+    record_stream = pipe(name='process_stream', priority=-100, events=['chunk', 'finish'])(record_stream)
+else:
+    stream_chat = service()(stream_chat)
+    format_image_message = service()(format_image_message)
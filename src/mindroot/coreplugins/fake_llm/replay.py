@@ -0,0 +1,135 @@
+"""Replay chat turns end to end against the fake_llm provider.
+
+Runs the real turn path (send_message_to_agent -> Agent.chat_commands ->
+command stream parsing -> command execution -> chat log / context
+persistence) with stream_chat served from recorded fixtures, so it works
+offline and in CI and times everything except the LLM itself.
+
+Run from src/mindroot:
+
+    python -m coreplugins.fake_llm.replay --fixtures path/to/fixtures --turns 5
+    python -m coreplugins.fake_llm.replay --turns 20 --time-scale 0 --json
+
+A scratch working directory is created with a minimal agent (required_plugins
+['fake_llm'], commands from --commands; plugins providing commands outside
+the chat plugin are imported with --modules) and persona, so chat logs and
+context files never touch the real data directory. Without --fixtures every
+turn is a single wait_for_user_reply command.
+
+Per turn, wall time, CPU time, stream_chat calls and streamed chars are
+reported, plus totals.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import importlib
+
+AGENT_NAME = 'fake_llm_replay'
+PERSONA_NAME = 'fake_llm_replay'
+DEFAULT_COMMANDS = 'wait_for_user_reply,task_result'
+
+# Modules that register the services and commands a turn uses.
+PLUGIN_MODULES = ['coreplugins.chat.services', 'coreplugins.chat.commands', 'coreplugins.agent.agent',
+                  'coreplugins.persona.mod', 'coreplugins.fake_llm.mod']
+
+
+def write_agent(root, commands):
+    agent_dir = os.path.join(root, 'data', 'agents', 'local', AGENT_NAME)
+    persona_dir = os.path.join(root, 'personas', 'local', PERSONA_NAME)
+    os.makedirs(agent_dir, exist_ok=True)
+    os.makedirs(persona_dir, exist_ok=True)
+    os.makedirs(os.path.join(root, 'logs'), exist_ok=True)
+    with open(os.path.join(agent_dir, 'agent.json'), 'w') as f:
+        json.dump({'name': AGENT_NAME, 'persona': PERSONA_NAME, 'instructions': 'Replay benchmark agent.',
+                   'flags': [], 'commands': commands, 'required_plugins': ['fake_llm']}, f, indent=2)
+    with open(os.path.join(persona_dir, 'persona.json'), 'w') as f:
+        json.dump({'name': PERSONA_NAME, 'description': 'Replay benchmark persona.', 'behavior': '',
+                   'speech_patterns': '', 'negative_appearance': '', 'appearance': ''}, f, indent=2)
+
+
+def load_plugins(extra_modules=()):
+    # Same import order as server.py, so the service manager singleton and
+    # current_context come from mindroot.lib.providers.
+    importlib.import_module('mindroot.lib.chatcontext')
+    from coreplugins.agent.init_models import init_models_and_providers
+    # Default data/models.json etc. in the (scratch) working directory.
+    init_models_and_providers()
+    for name in PLUGIN_MODULES + list(extra_modules):
+        importlib.import_module(name)
+
+
+async def run_turns(turns, message, user):
+    from coreplugins.chat.services import init_chat_session, send_message_to_agent
+    from coreplugins.fake_llm import mod as fake_llm
+    import nanoid
+    log_id = 'replay_' + nanoid.generate()
+    await init_chat_session(user, AGENT_NAME, log_id)
+    results = []
+    for turn in range(turns):
+        before = dict(fake_llm.stats)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        await send_message_to_agent(log_id, f"{message} ({turn + 1})", user=user)
+        results.append({
+            'turn': turn + 1,
+            'wall_seconds': time.perf_counter() - wall_start,
+            'cpu_seconds': time.process_time() - cpu_start,
+            'llm_calls': fake_llm.stats['calls'] - before['calls'],
+            'chars': fake_llm.stats['chars'] - before['chars'],
+        })
+    return results
+
+
+def print_report(results):
+    print(f"{'turn':>5}{'wall ms':>11}{'cpu ms':>11}{'llm calls':>11}{'chars':>9}")
+    for r in results:
+        print(f"{r['turn']:>5}{r['wall_seconds'] * 1000:>11.1f}{r['cpu_seconds'] * 1000:>11.1f}{r['llm_calls']:>11}{r['chars']:>9}")
+    if results:
+        wall = sum(r['wall_seconds'] for r in results)
+        cpu = sum(r['cpu_seconds'] for r in results)
+        print(f"{'all':>5}{wall * 1000:>11.1f}{cpu * 1000:>11.1f}{sum(r['llm_calls'] for r in results):>11}"
+              f"{sum(r['chars'] for r in results):>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay chat turns against the fake_llm provider.')
+    parser.add_argument('--fixtures', help='fixture file or directory (MR_FAKE_LLM_FIXTURES)')
+    parser.add_argument('--turns', type=int, default=3, help='number of user messages to send')
+    parser.add_argument('--message', default='Hello', help='user message text')
+    parser.add_argument('--user', default='replay', help='username for the session')
+    parser.add_argument('--commands', default=DEFAULT_COMMANDS, help='comma separated commands enabled for the agent')
+    parser.add_argument('--modules', default='', help='comma separated extra plugin modules to import, e.g. for their commands')
+    parser.add_argument('--time-scale', type=float, help='multiplier for recorded delays (0 = no waiting)')
+    parser.add_argument('--token-delay', type=float, help='fixed seconds between chunks')
+    parser.add_argument('--first-token-latency', type=float, help='seconds before the first chunk')
+    parser.add_argument('--workdir', help='working directory for agent data and chat logs (default: temporary)')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    if args.fixtures:
+        os.environ['MR_FAKE_LLM_FIXTURES'] = os.path.abspath(args.fixtures)
+    for name, value in (('MR_FAKE_LLM_TIME_SCALE', args.time_scale), ('MR_FAKE_LLM_TOKEN_DELAY', args.token_delay),
+                        ('MR_FAKE_LLM_FIRST_TOKEN_LATENCY', args.first_token_latency)):
+        if value is not None:
+            os.environ[name] = str(value)
+    # Replay must not record over itself.
+    os.environ.pop('MR_FAKE_LLM_RECORD_DIR', None)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='mr_replay_')
+    write_agent(workdir, [c for c in args.commands.split(',') if c])
+    os.chdir(workdir)
+    load_plugins([m for m in args.modules.split(',') if m])
+    results = asyncio.run(run_turns(args.turns, args.message, args.user))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 from lib.providers.services import service
+from lib.providers.service_cache import file_stamp
 from lib.providers.commands import command
 import os
 import json
@@ -7,8 +8,7 @@ from pathlib import Path
 from PIL import Image
 from .init_persona import *
 
-@service()
-async def get_persona_data(persona_name, context=None):
+def _persona_path(persona_name):
     pwd = os.getcwd()
     if persona_name.startswith('registry/'):
         persona_path = os.path.join(pwd, 'personas', persona_name)
@@ -16,6 +16,16 @@ async def get_persona_data(persona_name, context=None):
         persona_path = os.path.join(pwd, 'personas', 'local', persona_name)
         if not os.path.exists(persona_path):
             persona_path = os.path.join(pwd, 'personas', 'shared', persona_name)
+    return persona_path
+
+def _persona_stamp(persona_name):
+    # The directory stamp changes when images or voice samples are added.
+    persona_path = _persona_path(persona_name)
+    return (persona_path, file_stamp(persona_path), file_stamp(os.path.join(persona_path, 'persona.json')))
+
+@service(cache={'stamp': _persona_stamp})
+async def get_persona_data(persona_name, context=None):
+    persona_path = _persona_path(persona_name)
     if not os.path.exists(persona_path):
         raise Exception(f'Persona {persona_name} not found in {persona_path}')
     persona_file = os.path.join(persona_path, 'persona.json')
@@ -1,4 +1,5 @@
 from lib.providers.services import service
+from lib.providers.service_cache import file_stamp
 from .models import UserAuth, UserCreate, UserBase
 from .email_service import send_verification_email, setup_verification
 from .role_service import has_role, add_role, remove_role, get_user_roles
@@ -50,7 +51,10 @@ async def verify_user(username: str, password: str, context=None) -> bool:
     else:
         return False
 
-@service()
+def _auth_file_stamp(username, include_email=False):
+    return file_stamp(os.path.join(USER_DATA_ROOT, username, 'auth.json'))
+
+@service(cache={'stamp': _auth_file_stamp, 'copy': True, 'maxsize': 1024})
 async def get_user_data(username: str, include_email=False, context=None) -> Optional[UserBase]:
     """Get user data excluding sensitive info"""
     auth_file = os.path.join(USER_DATA_ROOT, username, 'auth.json')
@@ -0,0 +1,225 @@
+"""Content-addressed blob store for large payloads in chat history.
+
+Pasted images are formatted by the LLM provider into base64 blocks (e.g.
+Anthropic source.data, OpenAI image_url data URLs). Kept inline, those
+megabytes are rewritten on every chatlog save and copied on every
+get_recent(). Instead, ChatLog stores the decoded bytes once under
+data/blobs/<aa>/<sha256> and keeps a small reference in the message:
+
+    {"blob_ref": "<sha256>", "prefix": "data:image/png;base64,"}
+
+rehydrate_messages() swaps the references back for the base64 payload right
+before the messages are handed to stream_chat (or to the UI); code on the
+event loop uses rehydrate_messages_async(), which reads the blobs in a worker
+thread. The
+message_added hook still gets the message with its inline payload.
+
+Only string values of at least MR_BLOB_MIN_CHARS characters inside
+non-text content parts are externalized. Set MR_BLOB_STORE=0 to keep
+payloads inline.
+"""
+import os
+import re
+import asyncio
+import base64
+import hashlib
+import binascii
+from functools import lru_cache
+
+BLOB_REF_KEY = 'blob_ref'
+
+_DATA_URL_RE = re.compile(r'^data:[\w.+-]+/[\w.+-]+;base64,')
+_BASE64_RE = re.compile(r'^[A-Za-z0-9+/]+={0,2}$')
+
+
+def blobs_enabled() -> bool:
+    return os.environ.get('MR_BLOB_STORE', '1').lower() not in ('0', 'false', 'no', 'off')
+
+
+def blob_dir() -> str:
+    return os.environ.get('MR_BLOB_DIR', 'data/blobs')
+
+
+def _min_chars() -> int:
+    try:
+        return int(os.environ.get('MR_BLOB_MIN_CHARS', '8192'))
+    except ValueError:
+        return 8192
+
+
+def blob_path(digest: str) -> str:
+    return os.path.join(blob_dir(), digest[:2], digest)
+
+
+def put_bytes(data: bytes) -> str:
+    """Store bytes (if not already present) and return their sha256 digest."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return digest
+
+
+def get_bytes(digest: str) -> bytes:
+    with open(blob_path(digest), 'rb') as f:
+        return f.read()
+
+
+@lru_cache(maxsize=16)
+def _get_base64(digest: str) -> str:
+    # The same images are re-sent on every iteration of a turn; keep the most
+    # recent encodings around instead of re-reading and re-encoding them.
+    return base64.b64encode(get_bytes(digest)).decode('ascii')
+
+
+def is_blob_ref(value) -> bool:
+    return isinstance(value, dict) and BLOB_REF_KEY in value and len(value) <= 2
+
+
+def _externalize_value(value):
+    if not isinstance(value, str) or len(value) < _min_chars():
+        return value
+    match = _DATA_URL_RE.match(value)
+    prefix = match.group(0) if match else ''
+    payload = value[len(prefix):]
+    if not match and not _BASE64_RE.match(payload):
+        return value
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        return value
+    return {BLOB_REF_KEY: put_bytes(data), 'prefix': prefix}
+
+
+def _externalize(obj):
+    if isinstance(obj, dict):
+        if is_blob_ref(obj):
+            return obj
+        new = None
+        for key, value in obj.items():
+            replaced = _externalize(value)
+            if replaced is not value:
+                if new is None:
+                    new = dict(obj)
+                new[key] = replaced
+        return obj if new is None else new
+    if isinstance(obj, list):
+        new = None
+        for i, value in enumerate(obj):
+            replaced = _externalize(value)
+            if replaced is not value:
+                if new is None:
+                    new = list(obj)
+                new[i] = replaced
+        return obj if new is None else new
+    return _externalize_value(obj)
+
+
+def needs_externalize(message: dict) -> bool:
+    """Cheap check: does the message have any non-text content parts?"""
+    if not blobs_enabled() or not isinstance(message, dict):
+        return False
+    content = message.get('content')
+    if not isinstance(content, list):
+        return False
+    return any(isinstance(part, dict) and part.get('type') != 'text' for part in content)
+
+
+def externalize_message(message: dict) -> dict:
+    """Return the message with large inline payloads replaced by blob refs.
+
+    Returns the same object when nothing was externalized. Does file I/O, so
+    async callers should run it in a worker thread.
+    """
+    if not needs_externalize(message):
+        return message
+    new_parts = None
+    content = message['content']
+    for i, part in enumerate(content):
+        if not isinstance(part, dict) or part.get('type') == 'text':
+            continue
+        replaced = _externalize(part)
+        if replaced is not part:
+            if new_parts is None:
+                new_parts = list(content)
+            new_parts[i] = replaced
+    if new_parts is None:
+        return message
+    return {**message, 'content': new_parts}
+
+
+def _rehydrate(obj):
+    if isinstance(obj, dict):
+        if is_blob_ref(obj):
+            return obj.get('prefix', '') + _get_base64(obj[BLOB_REF_KEY])
+        new = None
+        for key, value in obj.items():
+            replaced = _rehydrate(value)
+            if replaced is not value:
+                if new is None:
+                    new = dict(obj)
+                new[key] = replaced
+        return obj if new is None else new
+    if isinstance(obj, list):
+        new = None
+        for i, value in enumerate(obj):
+            replaced = _rehydrate(value)
+            if replaced is not value:
+                if new is None:
+                    new = list(obj)
+                new[i] = replaced
+        return obj if new is None else new
+    return obj
+
+
+def rehydrate_messages(messages: list) -> list:
+    """Return messages with blob refs replaced by their base64 payloads.
+
+    Messages and parts without refs are shared, not copied. A part whose blob
+    is missing on disk is replaced by a text note rather than failing the
+    whole LLM call.
+    """
+    result = None
+    for i, message in enumerate(messages):
+        content = message.get('content') if isinstance(message, dict) else None
+        if not isinstance(content, list):
+            continue
+        new_parts = None
+        for j, part in enumerate(content):
+            if not isinstance(part, dict) or part.get('type') == 'text':
+                continue
+            try:
+                replaced = _rehydrate(part)
+            except OSError as e:
+                print(f"Warning: could not load blob for chat message part: {e}")
+                replaced = {'type': 'text', 'text': '[image unavailable]'}
+            if replaced is not part:
+                if new_parts is None:
+                    new_parts = list(content)
+                new_parts[j] = replaced
+        if new_parts is not None:
+            if result is None:
+                result = list(messages)
+            result[i] = {**message, 'content': new_parts}
+    return messages if result is None else result
+
+
+def _has_parts(messages: list) -> bool:
+    """Cheap check: do any messages have non-text content parts?"""
+    for message in messages:
+        content = message.get('content') if isinstance(message, dict) else None
+        if isinstance(content, list) and any(isinstance(part, dict) and part.get('type') != 'text' for part in content):
+            return True
+    return False
+
+
+async def rehydrate_messages_async(messages: list) -> list:
+    """rehydrate_messages() with the blob reads and base64 encoding in a
+    worker thread, so large images don't block the event loop."""
+    if not _has_parts(messages):
+        return messages
+    return await asyncio.to_thread(rehydrate_messages, messages)
@@ -1,14 +1,22 @@
 from .providers.services import service_manager
 from .providers.commands import command_manager
+from mindroot.lib.providers import current_context
 import os
 import json
+import time
 import asyncio
+import sys
+from collections import OrderedDict
 import aiofiles
 import aiofiles.os
 from .chatlog import ChatLog
 from .chatlog import extract_delegate_task_log_ids, find_child_logs_by_parent_id, find_chatlog_file
+from . import chatlog_journal
+from mindroot.lib.chatlog_index import chatlog_index
+from mindroot.lib.metrics import metrics
 from typing import TypeVar, Type, Protocol, runtime_checkable, Set
 from .utils.debug import debug_box
+from .utils.single_flight import SingleFlight
 
 
 def _json_safe_data(data):
@@ -36,16 +44,211 @@ def _json_safe_data(data):
     return safe
 
 
-contexts = {}
+def _env_number(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+class ContextCache:
+    """LRU cache of live ChatContext objects, keyed by log_id.
+
+    Bounded by entry count (MR_CONTEXT_CACHE_SIZE, default 200), idle time
+    (MR_CONTEXT_CACHE_TTL seconds, default 3600) and approximate history size
+    (MR_CONTEXT_CACHE_MAX_MB, default 512). A context is never evicted while a
+    registered busy check reports it in use (the chat plugin reports running
+    turns and SSE subscribers), since a second ChatContext for the same
+    session would diverge from the one still being used.
+
+    Sizes are measured when a context is stored or looked up, and kept as a
+    running total. Idle contexts are swept on insert and, at most every
+    MR_CONTEXT_CACHE_SWEEP_INTERVAL seconds (default 60), on lookup.
+
+    Supports the dict operations callers used on the old `contexts` dict.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._last_used = {}
+        self._sizes = {}
+        self._total_bytes = 0
+        self._last_sweep = time.time()
+        self._busy_checks = []
+        self._evict_callbacks = []
+        self._loading = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def register_busy_check(self, check) -> None:
+        """check(log_id) -> True if the context must not be evicted."""
+        self._busy_checks.append(check)
+
+    def register_evict_callback(self, callback) -> None:
+        """callback(log_id, context), called after a context is evicted."""
+        self._evict_callbacks.append(callback)
+
+    def _is_busy(self, log_id) -> bool:
+        for check in self._busy_checks:
+            try:
+                if check(log_id):
+                    return True
+            except Exception as e:
+                print(f"Context cache busy check failed for {log_id}: {e}")
+                return True
+        return False
+
+    @staticmethod
+    def _approx_bytes(context) -> int:
+        chat_log = context.__dict__.get('chat_log')
+        return chat_log.approx_bytes() if chat_log is not None else 0
+
+    def _touch(self, log_id, context) -> None:
+        self._entries.move_to_end(log_id)
+        self._last_used[log_id] = time.time()
+        size = self._approx_bytes(context)
+        self._total_bytes += size - self._sizes.get(log_id, 0)
+        self._sizes[log_id] = size
+
+    def _forget(self, log_id) -> None:
+        self._last_used.pop(log_id, None)
+        self._total_bytes -= self._sizes.pop(log_id, 0)
+
+    def _maybe_sweep(self) -> None:
+        now = time.time()
+        if now - self._last_sweep >= _env_number('MR_CONTEXT_CACHE_SWEEP_INTERVAL', 60):
+            self.evict()
+
+    def evict(self) -> int:
+        """Evict idle and excess contexts, least recently used first."""
+        max_size = int(_env_number('MR_CONTEXT_CACHE_SIZE', 200))
+        ttl = _env_number('MR_CONTEXT_CACHE_TTL', 3600)
+        max_bytes = _env_number('MR_CONTEXT_CACHE_MAX_MB', 512) * 1024 * 1024
+        now = time.time()
+        self._last_sweep = now
+        evicted = 0
+        for log_id in list(self._entries):
+            over_size = len(self._entries) > max_size
+            over_bytes = self._total_bytes > max_bytes
+            idle = now - self._last_used.get(log_id, now) > ttl
+            if not (over_size or over_bytes or idle):
+                # Entries are in LRU order: the rest are newer.
+                break
+            if self._is_busy(log_id):
+                continue
+            context = self._entries.pop(log_id)
+            self._forget(log_id)
+            self.evictions += 1
+            evicted += 1
+            for callback in self._evict_callbacks:
+                try:
+                    callback(log_id, context)
+                except Exception as e:
+                    print(f"Context cache evict callback failed for {log_id}: {e}")
+        return evicted
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'approx_bytes': self._total_bytes
+        }
+
+    async def get_or_load(self, log_id, loader):
+        """Return the cached context, or await loader() once per log_id."""
+        self._maybe_sweep()
+        context = self._entries.get(log_id)
+        if context is not None:
+            self.hits += 1
+            self._touch(log_id, context)
+            return context
+        if log_id in self._loading:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        async def load():
+            context = await loader()
+            self[log_id] = context
+            return context
+        return await self._loading.do(log_id, load)
+
+    def __contains__(self, log_id):
+        return log_id in self._entries
+
+    def __getitem__(self, log_id):
+        context = self._entries[log_id]
+        self._touch(log_id, context)
+        self._maybe_sweep()
+        return context
+
+    def __setitem__(self, log_id, context):
+        self._entries[log_id] = context
+        self._touch(log_id, context)
+        self.evict()
+
+    def __delitem__(self, log_id):
+        del self._entries[log_id]
+        self._forget(log_id)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def get(self, log_id, default=None):
+        if log_id in self._entries:
+            return self[log_id]
+        return default
+
+    def pop(self, log_id, *default):
+        self._forget(log_id)
+        return self._entries.pop(log_id, *default)
+
+    def keys(self):
+        return list(self._entries.keys())
+
+    def values(self):
+        return list(self._entries.values())
+
+    def items(self):
+        return list(self._entries.items())
+
+
+def _flush_evicted(log_id, context):
+    if getattr(context, '_save_pending', False):
+        asyncio.get_running_loop().create_task(context.flush())
+
+# One cache of live contexts, shared through builtins like the service
+# manager, since this module can be imported both as lib.chatcontext and
+# mindroot.lib.chatcontext.
+_CONTEXTS_KEY = 'mindroot.lib.chatcontext.contexts'
+contexts = getattr(sys.modules['builtins'], _CONTEXTS_KEY, None)
+if contexts is None:
+    contexts = ContextCache()
+    contexts.register_evict_callback(_flush_evicted)
+    metrics.register_gauges('context_cache', contexts.stats)
+    setattr(sys.modules['builtins'], _CONTEXTS_KEY, contexts)
+
+
+async def flush_all_contexts():
+    """Write deferred context saves (on shutdown)."""
+    for context in contexts.values():
+        try:
+            await context.flush()
+        except Exception as e:
+            print(f"Error flushing context {context.log_id}: {e}")
 
 async def get_context(log_id, user):
-    if log_id in contexts:
-        return contexts[log_id]
-    else:
+    async def load():
         context = ChatContext(command_manager_=command_manager, service_manager_=service_manager, user=user)
         await context.load_context(log_id)
-        contexts[log_id] = context
         return context
+    return await contexts.get_or_load(log_id, load)
 
 @runtime_checkable
 class BaseService(Protocol):
@@ -100,6 +303,11 @@ class ChatContext:
         self.log_id = None
         self.env = {}  # Per-agent environment variable overrides
         self.parent_log_id = None
+        # save_context() bookkeeping: last content written, whether a write
+        # was deferred, and how many turns are running on this context.
+        self._saved_content = None
+        self._save_pending = False
+        self._turn_depth = 0
         if log_id is not None:
             self.log_id = log_id
         else:
@@ -116,13 +324,64 @@ class ChatContext:
     def cmds(self, command_set: Type[CommandSetT]) -> CommandSetT:
         return self._commands[command_set]
 
+    def _context_file(self, log_id=None):
+        context_dir = os.environ.get('CHATCONTEXT_DIR', 'data/context')
+        return f'{context_dir}/{self.username}/context_{log_id or self.log_id}.json'
+
+    def _context_payload(self):
+        """Context metadata to persist. The history itself lives in the
+        ChatLog file; only a reference to it is kept here."""
+        self.data['log_id'] = self.log_id
+        context_data = {'data': _json_safe_data(self.data)}
+        chat_log = self.__dict__.get('chat_log')
+        if chat_log is not None:
+            context_data['chat_log'] = {'agent': chat_log.agent, 'log_id': chat_log.log_id, 'parent_log_id': chat_log.parent_log_id}
+        agent = self.__dict__.get('agent')
+        if isinstance(agent, dict) and 'name' in agent:
+            context_data['agent_name'] = agent['name']
+        elif 'agent_name' in self.data:
+            context_data['agent_name'] = self.data['agent_name']
+        elif self.agent_name is not None:
+            context_data['agent_name'] = self.agent_name
+        else:
+            pass
+        return context_data
+
+    async def _write_context(self, context_data):
+        self._save_pending = False
+        content = json.dumps(context_data, indent=2)
+        if content == self._saved_content:
+            return
+        context_file = self._context_file()
+        await aiofiles.os.makedirs(os.path.dirname(context_file), exist_ok=True)
+        async with aiofiles.open(context_file, 'w') as f:
+            await f.write(content)
+        self._saved_content = content
+
+    def begin_turn(self):
+        """Defer save_context() writes until the matching end_turn()."""
+        self._turn_depth += 1
+
+    async def end_turn(self):
+        self._turn_depth = max(0, self._turn_depth - 1)
+        if self._turn_depth == 0:
+            await self.flush()
+
+    async def flush(self):
+        """Write a deferred save_context(), if any."""
+        if self._save_pending and self.log_id:
+            await self._write_context(self._context_payload())
+
     async def save_context_data(self):
         if not self.log_id:
             raise ValueError('log_id is not set for the context.')
         else:
             pass
-        context_dir = os.environ.get('CHATCONTEXT_DIR', 'data/context')
-        context_file = f'{context_dir}/{self.username}/context_{self.log_id}.json'
+        if 'agent_name' in self._context_payload():
+            await self.save_context()
+            return
+        # Agent not known on this instance: update 'data' in the existing file.
+        context_file = self._context_file()
         await aiofiles.os.makedirs(os.path.dirname(context_file), exist_ok=True)
         try:
             async with aiofiles.open(context_file, 'r') as f:
@@ -137,34 +396,29 @@ class ChatContext:
             await f.write(json.dumps(context_data, indent=2))
 
     async def save_context(self):
+        """Persist context metadata.
+
+        Skipped when nothing changed since the last write. During a turn
+        (begin_turn/end_turn) the write is deferred to the end of the turn, so
+        a turn writes the context file at most once.
+        """
         if not self.log_id:
             raise ValueError('log_id is not set for the context.')
         else:
             pass
-        context_dir = os.environ.get('CHATCONTEXT_DIR', 'data/context')
-        context_file = f'{context_dir}/{self.username}/context_{self.log_id}.json'
-        await aiofiles.os.makedirs(os.path.dirname(context_file), exist_ok=True)
-        self.data['log_id'] = self.log_id
-        context_data = {'data': _json_safe_data(self.data), 'chat_log': self.chat_log._get_log_data()}
-        if 'name' in self.agent:
-            context_data['agent_name'] = self.agent['name']
-        elif 'agent_name' in self.data:
-            context_data['agent_name'] = self.data['agent_name']
-        elif self.agent_name is not None:
-            context_data['agent_name'] = self.agent_name
-        else:
-            pass
+        context_data = self._context_payload()
         if 'agent_name' not in context_data:
             raise ValueError('Tried to save chat context, but agent name not found in context')
         else:
             pass
-        async with aiofiles.open(context_file, 'w') as f:
-            await f.write(json.dumps(context_data, indent=2))
+        if self._turn_depth > 0:
+            self._save_pending = True
+            return
+        await self._write_context(context_data)
 
     async def load_context(self, log_id):
         self.log_id = log_id
-        context_dir = os.environ.get('CHATCONTEXT_DIR', 'data/context')
-        context_file = f'{context_dir}/{self.username}/context_{log_id}.json'
+        context_file = self._context_file(log_id)
         if await aiofiles.os.path.exists(context_file):
             async with aiofiles.open(context_file, 'r') as f:
                 content = await f.read()
@@ -199,14 +453,22 @@ class ChatContext:
         else:
             pass
         if name in self._services:
-            self.service_manager.context = self
-            return getattr(self.service_manager, name)
+            manager = self.service_manager
+        elif name in self._commands:
+            manager = self.command_manager
         else:
-            pass
-        if name in self._commands:
-            self.command_manager.context = self
-            return getattr(self.command_manager, name)
-        raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+            raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+        # Make this the current task's context (it stays current for the rest
+        # of the task, as the shared manager.context used to) and cache the
+        # bound call on the instance so later lookups skip __getattr__.
+        context = self
+
+        async def method(*args, **kwargs):
+            current_context.set(context)
+            return await manager.execute(name, *args, **kwargs)
+        method.__name__ = name
+        self.__dict__[name] = method
+        return method
 
     @classmethod
     async def delete_session_by_id(cls, log_id: str, user: str, agent: str, cascade: bool = True, visited_log_ids: Set[str] = None):
@@ -228,10 +490,8 @@ class ChatContext:
 
             if await aiofiles.os.path.exists(chatlog_file_path_current):
                 try:
-                    async with aiofiles.open(chatlog_file_path_current, 'r') as f:
-                        content = await f.read()
-                        log_data = json.loads(content)
-                        messages_for_child_finding = log_data.get('messages', [])
+                    log_data = await chatlog_journal.read_log_data(chatlog_file_path_current)
+                    messages_for_child_finding = log_data.get('messages', [])
                 except Exception as e:
                     print(f"Error reading chatlog {chatlog_file_path_current} for child finding: {e}")
             
@@ -266,6 +526,8 @@ class ChatContext:
         if await aiofiles.os.path.exists(chatlog_file_to_delete):
             try:
                 await aiofiles.os.remove(chatlog_file_to_delete)
+                await asyncio.to_thread(chatlog_journal.remove_journal, chatlog_file_to_delete)
+                await asyncio.to_thread(chatlog_index.unregister, log_id)
                 print(f"Deleted chatlog file: {chatlog_file_to_delete}")
             except Exception as e:
                 print(f"Error deleting chatlog file {chatlog_file_to_delete}: {e}")
@@ -285,8 +547,10 @@ class ChatContext:
             print(f"Context file not found for deletion: {context_file_to_delete}")
             
         # --- Clear In-Memory Cache ---
-        if log_id in contexts: # 'contexts' is the global dict at module level
+        if log_id in contexts: # 'contexts' is the global cache at module level
             try:
+                # Don't let a deferred save recreate the deleted file.
+                contexts[log_id]._save_pending = False
                 del contexts[log_id]
                 print(f"Removed log_id {log_id} from in-memory contexts cache.")
             except Exception as e:
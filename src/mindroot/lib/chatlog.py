@@ -14,7 +14,24 @@ CHATLOG_DEBUG = os.environ.get('MR_CHATLOG_DEBUG', '0').lower() in ('1', 'true',
 def _chat_debug(*args, **kwargs):
     if CHATLOG_DEBUG:
         print(*args, **kwargs)
+
+SUMMARY_PREFIX = '[Summary of earlier conversation]\n'
+
+
+def history_token_budget() -> int:
+    """Default get_recent() budget (MR_HISTORY_MAX_TOKENS); 0 means unlimited."""
+    try:
+        return int(os.environ.get('MR_HISTORY_MAX_TOKENS', '0'))
+    except ValueError:
+        return 0
+
 from mindroot.lib.utils.debug import debug_box
+from mindroot.lib import chatlog_journal
+from mindroot.lib import blob_store
+from mindroot.lib.chatlog_index import chatlog_index
+from mindroot.lib.token_ledger import TokenLedger
+from mindroot.lib.tokenizer import get_tokenizer, tokenizer_for_model
+from mindroot.lib.message_snapshot import cow_message, is_dirty
 
 # Import hook manager for message sync
 try:
@@ -27,6 +44,22 @@ except ImportError:
 class ChatLog:
     def __init__(self, log_id=0, agent=None, parent_log_id=None, context_length: int = 4096, user: str = None):
         self.log_id = log_id
+        # Per-message token counts and running totals; see count_tokens().
+        self._ledger = TokenLedger()
+        self._ledger_synced = False
+        self._token_model = None
+        self._loaded_token_counts = None
+        # Copy-on-write copies of messages handed out by get_recent(); None
+        # until first requested.
+        self._snapshot_cache = []
+        self._snapshot_synced = False
+        # History windowing (see get_recent): indexes of messages that are
+        # always kept, the summary of evicted messages before index 'upto',
+        # and the last computed (budget, window start).
+        self.pinned = set()
+        self.window_summary = None
+        self.window_start = 0
+        self._window_cache = None
         self.messages = []
         self.parent_log_id = parent_log_id
         self.agent = agent
@@ -49,10 +82,58 @@ class ChatLog:
         self.log_dir = os.path.join(self.log_dir, self.agent)
         if not os.path.exists(self.log_dir):
             os.makedirs(self.log_dir)
+        # Journal bookkeeping: seq of the last persisted mutation, and how many
+        # journal records are pending compaction into the snapshot.
+        self._journal_seq = 0
+        self._journal_pending = 0
+        self._compact_task = None
+        self._indexed_parent = None
+        self._indexed = False
         # For backward compatibility, we'll load synchronously in constructor
         # Run blocking I/O in thread pool to avoid blocking event loop
         self._load_log_sync()
+        if self.parent_log_id is not None:
+            # Record the parent -> child edge as soon as a child session is
+            # created (run_task / delegate_task), before its first write.
+            # Never loads or rebuilds the index here, on the event loop.
+            self._register_in_index(load=False)
         
+    @property
+    def messages(self) -> List[Dict[str, any]]:
+        return self._messages
+
+    @messages.setter
+    def messages(self, value: List[Dict[str, any]]) -> None:
+        # Replacing the whole list (e.g. when a caller rewrites history) means
+        # the token ledger has to be rebuilt on next use, and the next write
+        # must be a full snapshot since the journal only records tail changes.
+        self._messages = value
+        self._ledger_synced = False
+        self._snapshot_synced = False
+        self._window_cache = None
+        self._loaded_token_counts = None
+        self._needs_snapshot = True
+
+    def _ensure_ledger(self) -> TokenLedger:
+        if not self._ledger_synced or len(self._ledger) != len(self._messages):
+            self._ledger.reset(self._messages, self._loaded_token_counts)
+            self._loaded_token_counts = None
+            self._ledger_synced = True
+        return self._ledger
+
+    def set_token_model(self, model: str) -> None:
+        """Count tokens with the tokenizer configured for model (see
+        lib/tokenizer.py). Recounts the history if the tokenizer changes."""
+        self._token_model = model
+        tokenizer = tokenizer_for_model(model)
+        if tokenizer.name == self._ledger.tokenizer_name:
+            return
+        self._ledger = TokenLedger(tokenizer)
+        self._ledger_synced = False
+        self._loaded_token_counts = None
+        # Stored counts belong to the old tokenizer.
+        self._needs_snapshot = True
+
     def _get_log_data(self) -> Dict[str, any]:
         return {
             'agent': self.agent,
@@ -61,25 +142,62 @@ class ChatLog:
             'parent_log_id': self.parent_log_id
         }
 
-    def _calculate_message_length(self, message: Dict[str, str]) -> int:
-        return len(json.dumps(message)) // 3
+    def _log_file(self, log_id=None) -> str:
+        if log_id is None:
+            log_id = self.log_id
+        return os.path.join(self.log_dir, f'chatlog_{log_id}.json')
+
+    def _snapshot_data(self) -> Dict[str, any]:
+        """Log data for a full snapshot write.
+
+        The message list is copied so a background compaction can serialize it
+        while the event loop keeps appending.
+        """
+        log_data = self._get_log_data()
+        log_data['messages'] = [dict(m) for m in self.messages]
+        log_data['token_counts'] = list(self._ensure_ledger().counts)
+        log_data['tokenizer'] = self._ledger.tokenizer_name
+        if self.pinned:
+            log_data['pinned'] = sorted(self.pinned)
+        if self.window_summary:
+            log_data['window_summary'] = dict(self.window_summary)
+        if self._journal_seq:
+            log_data['journal_seq'] = self._journal_seq
+        return log_data
+
+    def _apply_loaded_data(self, log_data: Dict[str, any], journal_text: str) -> None:
+        self._journal_pending = 0
+        if journal_text:
+            self._journal_pending = chatlog_journal.replay_journal(log_data, journal_text)
+        self._journal_seq = log_data.get('journal_seq', 0) or 0
+        self.agent = log_data.get('agent')
+        self.messages = log_data.get('messages', [])
+        stored_tokenizer = log_data.get('tokenizer', 'estimate')
+        if (self._token_model is None and 'token_counts' in log_data
+                and stored_tokenizer != self._ledger.tokenizer_name):
+            # Keep counting with the tokenizer the log was saved with.
+            self._ledger = TokenLedger(get_tokenizer(stored_tokenizer))
+        if stored_tokenizer == self._ledger.tokenizer_name:
+            self._loaded_token_counts = log_data.get('token_counts')
+        self._needs_snapshot = False
+        self.pinned = set(log_data.get('pinned', []))
+        self.window_summary = log_data.get('window_summary')
+        self.parent_log_id = log_data.get('parent_log_id', None)
 
     def _load_log_impl(self, log_id=None) -> None:
         """Internal implementation that does the actual file I/O"""
         if log_id is None:
             log_id = self.log_id
         self.log_id = log_id
-        log_file = os.path.join(self.log_dir, f'chatlog_{log_id}.json')
+        log_file = self._log_file(log_id)
         if os.path.exists(log_file):
             # Set last_modified even if JSON parsing fails, so callers that
             # read log.last_modified don't crash with AttributeError.
-            self.last_modified = os.path.getmtime(log_file)
+            self.last_modified = chatlog_journal.log_mtime(log_file)
             with open(log_file, 'r') as f:
                 try:
                     log_data = json.load(f)
-                    self.agent = log_data.get('agent')
-                    self.messages = log_data.get('messages', [])
-                    self.parent_log_id = log_data.get('parent_log_id', None)
+                    self._apply_loaded_data(log_data, chatlog_journal.read_journal_sync(log_file))
                 except json.JSONDecodeError:
                     # File exists but is empty or has invalid JSON (write race).
                     # Treat as empty log rather than crashing the caller.
@@ -100,27 +218,136 @@ class ChatLog:
         """Async version - runs implementation in thread pool"""
         await asyncio.to_thread(self._load_log_impl, log_id)
 
-    def _write_log_file(self, log_file: str) -> None:
+    def _write_log_file(self, log_file: str, log_data: Dict[str, any] = None) -> None:
         """Helper to write log file - can be run in thread pool"""
-        with open(log_file, 'w') as f:
-            json.dump(self._get_log_data(), f, indent=2)
+        if log_data is None:
+            log_data = self._snapshot_data()
+        chatlog_journal.write_snapshot(log_file, log_data)
+        if not self._indexed or self._indexed_parent != self.parent_log_id:
+            self._register_in_index()
+
+    def _register_in_index(self, load=True) -> None:
+        """Record this log's location and parent in the chatlog index. If
+        the index was not loaded (load=False), the first write registers again."""
+        parent_log_id = self.parent_log_id
+        indexed = chatlog_index.register(self.log_id, self.user, os.path.basename(self.log_dir), parent_log_id, load=load)
+        self._indexed_parent = parent_log_id
+        self._indexed = indexed
     
     def _save_log_sync(self) -> None:
         """Synchronous version for backward compatibility"""
-        log_file = os.path.join(self.log_dir, f'chatlog_{self.log_id}.json')
+        log_file = self._log_file()
         self.last_modified = time.time()
+        self._needs_snapshot = False
         self._write_log_file(log_file)
+        self._journal_pending = 0
 
     async def _save_log_async(self) -> None:
         """Async version - runs in thread pool to avoid blocking"""
-        log_file = os.path.join(self.log_dir, f'chatlog_{self.log_id}.json')
+        log_file = self._log_file()
+        self.last_modified = time.time()
+        log_data = self._snapshot_data()
+        self._needs_snapshot = False
+        await asyncio.to_thread(self._write_log_file, log_file, log_data)
+        self._journal_pending = self._journal_seq - log_data.get('journal_seq', 0)
+
+    def _change_records(self, prev_len: int, op: str = None) -> List[Dict[str, any]]:
+        """Describe the mutation since the log had prev_len messages, and
+        apply it to the token ledger. Each record gets its message's 'tokens'."""
+        records = []
+        if op == 'drop_last':
+            records.append({'op': 'drop_last'})
+        elif len(self.messages) > prev_len:
+            for message in self.messages[prev_len:]:
+                records.append({'op': 'append', 'message': message})
+        elif len(self.messages) > 0:
+            records.append({'op': 'set_last', 'message': self.messages[-1]})
+        if self._ledger_synced and len(self._ledger) == prev_len:
+            for record in records:
+                self._ledger.apply_record(self.messages, record)
+        else:
+            counts = self._ensure_ledger().counts
+            for i, record in enumerate(records):
+                if record['op'] == 'append':
+                    record['tokens'] = counts[prev_len + i]
+                elif record['op'] == 'set_last':
+                    record['tokens'] = counts[-1]
+        if self._snapshot_synced and len(self._snapshot_cache) == prev_len:
+            for record in records:
+                if record['op'] == 'append':
+                    self._snapshot_cache.append(None)
+                elif record['op'] == 'set_last':
+                    if self._snapshot_cache:
+                        self._snapshot_cache[-1] = None
+                    else:
+                        self._snapshot_cache.append(None)
+                elif record['op'] == 'drop_last':
+                    self._snapshot_cache.pop()
+        else:
+            self._snapshot_synced = False
+        return records
+
+    def _journal_records(self, records: List[Dict[str, any]]) -> List[Dict[str, any]]:
+        """Assign sequence numbers immediately (on the caller's thread) so records
+        stay ordered even when the writes themselves run in worker threads."""
+        for record in records:
+            self._journal_seq += 1
+            record['seq'] = self._journal_seq
+        return records
+
+    def _use_journal(self, log_file: str) -> bool:
+        # The first write of a new log is always a (small) snapshot so the
+        # chatlog_{id}.json file other tools look for exists from the start.
+        return (chatlog_journal.journal_enabled() and not self._needs_snapshot
+                and os.path.exists(log_file))
+
+    def _persist_change_sync(self, prev_len: int, op: str = None) -> None:
+        records = self._change_records(prev_len, op)
+        log_file = self._log_file()
+        if not self._use_journal(log_file):
+            self._save_log_sync()
+            return
+        self.last_modified = time.time()
+        records = self._journal_records(records)
+        chatlog_journal.append_lines(log_file, chatlog_journal.encode_records(records))
+        self._journal_pending += len(records)
+        if self._journal_pending >= chatlog_journal.compact_every():
+            self._save_log_sync()
+
+    async def _persist_change_async(self, prev_len: int, op: str = None) -> None:
+        """Persist one mutation: a journal append when journaling, else a full save."""
+        records = self._change_records(prev_len, op)
+        log_file = self._log_file()
+        if not self._use_journal(log_file):
+            await self._save_log_async()
+            return
         self.last_modified = time.time()
-        await asyncio.to_thread(self._write_log_file, log_file)
+        records = self._journal_records(records)
+        lines = chatlog_journal.encode_records(records)
+        await asyncio.to_thread(chatlog_journal.append_lines, log_file, lines)
+        self._journal_pending += len(records)
+        if self._journal_pending >= chatlog_journal.compact_every():
+            self._schedule_compaction()
+
+    def _schedule_compaction(self) -> None:
+        if self._compact_task is not None and not self._compact_task.done():
+            return
+        self._compact_task = asyncio.create_task(self._compact())
+
+    async def _compact(self) -> None:
+        """Fold the journal into the snapshot in the background."""
+        try:
+            await self._save_log_async()
+            _chat_debug(f"Compacted chatlog journal for {self.log_id}")
+        except Exception as e:
+            print(f"Warning: chatlog journal compaction failed for {self.log_id}: {e}")
 
     def add_message_role(self, message: Dict[str, str]) -> None:
         for i in range(len(self.messages)-1, -1, -1):
             if self.messages[i]['role'] == message.get('role'):
                 self.messages[i]['content'].append(message)
+                self._ledger_synced = False
+                self._snapshot_synced = False
                 self.last_modified = time.time()
                 self._save_log_sync()
                 return
@@ -129,7 +356,9 @@ class ChatLog:
         """Fire the message_added hook in a background task (non-blocking).
         
         This is used to notify other systems (like job queue workers) that a
-        message was added, enabling chat log synchronization.
+        message was added, enabling chat log synchronization. Callers pass the
+        message as it was added, with inline image data, not the copy with
+        blob store refs that is kept in history.
         """
         if not HOOKS_AVAILABLE or hook_manager is None:
             # print a large blue and yellow header for log visibility (temporary)
@@ -139,19 +368,20 @@ class ChatLog:
             return
         
         try:
-            # Create a background task to fire the hook
-            # This is non-blocking so it doesn't slow down message processing
+            # Queue the hook on the hook worker pool (message_added runs in
+            # background mode). This is non-blocking so it doesn't slow down
+            # message processing
             # print header in cyan
             _chat_debug("\033[96m" + "="*60 + "\033[0m")
             _chat_debug("Firing message added hook asynchronously")
 
-            asyncio.create_task(hook_manager.message_added(
+            hook_manager.fire('message_added',
                 log_id=self.log_id,
                 user=self.user,
                 agent=self.agent,
                 message=message,
                 parent_log_id=self.parent_log_id
-            ))
+            )
             _chat_debug("Fired message added hook")
         except Exception as e:
             # Don't let hook failures break message adding
@@ -161,9 +391,10 @@ class ChatLog:
         """Synchronous version for backward compatibility"""
         _chat_debug("Adding message synchronously")
         t0 = time.time()
-        self._add_message_impl(message)
-        self.last_modified = time.time()
-        self._save_log_sync()
+        added = blob_store.externalize_message(message)
+        prev_len = len(self.messages)
+        self._add_message_impl(added)
+        self._persist_change_sync(prev_len)
         save_ms = (time.time() - t0) * 1000
         _chat_debug(f'add_message total took {save_ms:.1f}ms')
         self._fire_message_added_hook(message)
@@ -238,17 +469,24 @@ class ChatLog:
     async def add_message_async(self, message: Dict[str, str]) -> None:
         """Async version for new code that needs non-blocking operations"""
         _chat_debug("Adding message asynchronously")
-        self._add_message_impl(message)
-        self.last_modified = time.time()
-        await self._save_log_async()
+        added = message
+        if blob_store.needs_externalize(message):
+            # Move image payloads into the blob store so history holds refs.
+            # externalize_message returns a copy; hooks get the original.
+            added = await asyncio.to_thread(blob_store.externalize_message, message)
+        prev_len = len(self.messages)
+        self._add_message_impl(added)
+        await self._persist_change_async(prev_len)
         self._fire_message_added_hook(message)
 
     async def drop_last(self, role) -> None:
         if len(self.messages) == 0:
             return
         if self.messages[-1]['role'] == role:
-            self.messages = self.messages[:-1]
-            await self.save_log()
+            prev_len = len(self.messages)
+            # Assign _messages directly: the ledger is updated incrementally.
+            self._messages = self._messages[:-1]
+            await self._persist_change_async(prev_len, op='drop_last')
 
     async def replace_last_assistant(self, content, commands=None) -> None:
         """Set the last assistant message authoritatively (one write per turn).
@@ -269,12 +507,12 @@ class ChatLog:
         message = {'role': 'assistant', 'content': content}
         if commands is not None:
             message['commands'] = commands
+        prev_len = len(self.messages)
         if len(self.messages) > 0 and self.messages[-1]['role'] == 'assistant':
             self.messages[-1] = message
         else:
             self.messages.append(message)
-        self.last_modified = time.time()
-        await self._save_log_async()
+        await self._persist_change_async(prev_len)
         self._fire_message_added_hook(message)
 
     def get_history(self) -> List[Dict[str, str]]:
@@ -303,42 +541,144 @@ class ChatLog:
                 continue
         return commands
 
-    def get_recent(self, max_tokens: int = 4096) -> List[Dict[str, str]]:
-        recent_messages = []
-        total_length = 0
-        #print('returning all messages', self.messages)
-        json_messages = json.dumps(self.messages)
-        return json.loads(json_messages)
-
-        #for message in self.messages:
-        #    message_length = self._calculate_message_length(message)
-        #    if total_length + message_length <= max_tokens:
-        #        recent_messages.append(message)
-        #        total_length += message_length
-        #    else:
-        #        break
-        # 
-        #return recent_messages
+    def _refresh_snapshots(self) -> List[Dict[str, any]]:
+        if not self._snapshot_synced or len(self._snapshot_cache) != len(self._messages):
+            self._snapshot_cache = [None] * len(self._messages)
+            self._snapshot_synced = True
+        cache = self._snapshot_cache
+        for i, cached in enumerate(cache):
+            if cached is None or is_dirty(cached):
+                cache[i] = cow_message(self._messages[i])
+        return cache
+
+    def _pinned_indexes(self) -> List[int]:
+        """Pinned messages plus the first user message (the instructions)."""
+        count = len(self._messages)
+        pinned = {i for i in self.pinned if 0 <= i < count}
+        first_user = next((i for i, m in enumerate(self._messages) if m.get('role') == 'user'), None)
+        if first_user is not None:
+            pinned.add(first_user)
+        return sorted(pinned)
+
+    def _summary_message(self) -> Dict[str, any]:
+        return {'role': 'user', 'content': [{'type': 'text', 'text': SUMMARY_PREFIX + self.window_summary['text']}]}
+
+    def _window_start(self, max_tokens: int) -> int:
+        """Index of the first unpinned message that fits in max_tokens, 0 if all do."""
+        ledger = self._ensure_ledger()
+        count = len(self._messages)
+        if count == 0 or ledger.total() <= max_tokens:
+            return 0
+        pinned = self._pinned_indexes()
+        fixed = ledger.tokenizer.count_message(self._summary_message()) if self.window_summary else 0
+
+        def cost(start):
+            return (ledger.total() - ledger.prefix_tokens(start) + fixed
+                    + sum(ledger.counts[i] for i in pinned if i < start))
+
+        # cost() only decreases as start moves forward, and appending only
+        # moves the boundary forward, so resume from the cached boundary.
+        cached = self._window_cache
+        if (cached is not None and cached[0] == max_tokens and cached[1] < count
+                and (cached[1] == 0 or cost(cached[1] - 1) > max_tokens)):
+            start = cached[1]
+            while start < count - 1 and cost(start) > max_tokens:
+                start += 1
+        else:
+            low, high = 0, count - 1
+            while low < high:
+                mid = (low + high) // 2
+                if cost(mid) <= max_tokens:
+                    high = mid
+                else:
+                    low = mid + 1
+            start = low
+        self._window_cache = (max_tokens, start)
+        # Don't open the window on an assistant reply to an evicted message.
+        while start < count - 1 and self._messages[start].get('role') == 'assistant':
+            start += 1
+        return start
+
+    def get_recent(self, max_tokens: int = None) -> List[Dict[str, str]]:
+        """Snapshot of the history that callers may modify freely.
+
+        Returns a new list of copy-on-write message copies (see
+        lib/message_snapshot.py). Copies are made once per message and shared
+        between calls; only messages that were modified through an earlier
+        snapshot are copied again.
+
+        If the history exceeds max_tokens (default MR_HISTORY_MAX_TOKENS,
+        0 = unlimited), the oldest messages are left out, except pinned ones
+        and the first user message. A summary of evicted messages (see
+        set_window_summary) is inserted in their place once it covers them.
+        """
+        snapshot = self._refresh_snapshots()
+        if max_tokens is None:
+            max_tokens = history_token_budget()
+        start = self._window_start(max_tokens) if max_tokens and max_tokens > 0 else 0
+        self.window_start = start
+        if start == 0:
+            return list(snapshot)
+        recent = [snapshot[i] for i in self._pinned_indexes() if i < start]
+        if self.window_summary and self.window_summary.get('upto', 0) <= start:
+            recent.append(self._summary_message())
+        recent.extend(snapshot[start:])
+        return recent
+
+    def unsummarized_span(self, max_tokens: int = None):
+        """(end, messages): evicted, unpinned messages not yet covered by the
+        window summary, for a summarize_history service."""
+        if max_tokens is None:
+            max_tokens = history_token_budget()
+        if not max_tokens or max_tokens <= 0:
+            return 0, []
+        end = self._window_start(max_tokens)
+        begin = self.window_summary.get('upto', 0) if self.window_summary else 0
+        if end <= begin:
+            return end, []
+        snapshot = self._refresh_snapshots()
+        pinned = set(self._pinned_indexes())
+        return end, [snapshot[i] for i in range(begin, end) if i not in pinned]
+
+    async def set_window_summary(self, upto: int, text: str) -> None:
+        """Record a summary of the (unpinned) messages before index upto."""
+        self.window_summary = {'upto': upto, 'text': text}
+        self._window_cache = None
+        await self._save_log_async()
+
+    async def pin_message(self, index: int = -1) -> None:
+        """Always keep this message in get_recent() windows."""
+        if index < 0:
+            index += len(self._messages)
+        if 0 <= index < len(self._messages) and index not in self.pinned:
+            self.pinned.add(index)
+            self._window_cache = None
+            await self._save_log_async()
+
+    async def unpin_message(self, index: int) -> None:
+        if index < 0:
+            index += len(self._messages)
+        if index in self.pinned:
+            self.pinned.discard(index)
+            self._window_cache = None
+            await self._save_log_async()
 
     async def save_log(self) -> None:
-        log_file = os.path.join(self.log_dir, f'chatlog_{self.log_id}.json')
-        async with aiofiles.open(log_file, 'w') as f:
-            await f.write(json.dumps(self._get_log_data(), indent=2))
+        """Write a full snapshot (also compacts any pending journal)."""
+        await self._save_log_async()
         
 
     async def load_log(self, log_id = None) -> None:
         if log_id is None:
             log_id = self.log_id
         self.log_id = log_id
-        log_file = os.path.join(self.log_dir, f'chatlog_{log_id}.json')
+        log_file = self._log_file(log_id)
         if await aiofiles.os.path.exists(log_file):
             async with aiofiles.open(log_file, 'r') as f:
                 content = await f.read()
                 try:
                     log_data = json.loads(content)
-                    self.agent = log_data.get('agent')
-                    self.messages = log_data.get('messages', [])
-                    self.parent_log_id = log_data.get('parent_log_id', None)
+                    self._apply_loaded_data(log_data, await chatlog_journal.read_journal(log_file))
                 except json.JSONDecodeError:
                     # File exists but is empty or has invalid JSON (write race).
                     print(f"Warning: chatlog file {log_file} exists but is empty or invalid JSON; treating as empty")
@@ -349,45 +689,24 @@ class ChatLog:
             _chat_debug("Could not find log file at ", log_file)
             self.messages = []
 
+    def approx_bytes(self) -> int:
+        """Rough in-memory size of the history, from the token ledger."""
+        return self._ensure_ledger().total() * 4
+
     def count_tokens(self) -> Dict[str, int]:
         """
         Count tokens in the chat log, providing both sequence totals and cumulative request totals.
         
+        Totals are maintained incrementally as messages are added, replaced or
+        dropped (see TokenLedger), so this is O(1) for a live log.
+        
         Returns:
             Dict with the following keys:
             - input_tokens_sequence: Total tokens in all user messages
             - output_tokens_sequence: Total tokens in all assistant messages
             - input_tokens_total: Cumulative tokens sent to LLM across all requests
         """
-        # Initialize counters
-        input_tokens_sequence = 0  # Total tokens in all user messages
-        output_tokens_sequence = 0  # Total tokens in all assistant messages
-        input_tokens_total = 0  # Cumulative tokens sent to LLM across all requests
-        
-        # Process each message
-        for i, message in enumerate(self.messages):
-            # Calculate tokens in this message (rough approximation)
-            message_tokens = len(json.dumps(message)) // 4
-            
-            # Add to appropriate sequence counter
-            if message['role'] == 'assistant':
-                output_tokens_sequence += message_tokens
-            else:  # user or system
-                input_tokens_sequence += message_tokens
-            
-            # For each assistant message, calculate the input tokens for that request
-            # (which includes all previous messages)
-            if message['role'] == 'assistant':
-                request_input_tokens = 0
-                for j in range(i):
-                    request_input_tokens += len(json.dumps(self.messages[j])) // 4
-                input_tokens_total += request_input_tokens
-        
-        return {
-            'input_tokens_sequence': input_tokens_sequence,
-            'output_tokens_sequence': output_tokens_sequence,
-            'input_tokens_total': input_tokens_total
-        }
+        return self._ensure_ledger().totals()
 
 async def find_chatlog_file(log_id: str) -> str:
     """
@@ -399,15 +718,7 @@ async def find_chatlog_file(log_id: str) -> str:
     Returns:
         The full path to the chatlog file if found, None otherwise
     """
-    chat_dir = os.environ.get('CHATLOG_DIR', 'data/chat')
-    
-    # Use os.walk to search through all subdirectories
-    for root, dirs, files in await asyncio.to_thread(os.walk, chat_dir):
-        for file in files:
-            if file == f"chatlog_{log_id}.json":
-                return os.path.join(root, file)
-    
-    return None
+    return await asyncio.to_thread(chatlog_index.find, log_id)
 
 async def find_child_logs_by_parent_id(parent_log_id: str) -> List[str]:
     """
@@ -419,24 +730,7 @@ async def find_child_logs_by_parent_id(parent_log_id: str) -> List[str]:
     Returns:
         List of log IDs that have this parent_log_id
     """
-    child_log_ids = []
-    chat_dir = os.environ.get('CHATLOG_DIR', 'data/chat')
-    
-    # Search through all chatlog files
-    for root, dirs, files in await asyncio.to_thread(os.walk, chat_dir):
-        for file in files:
-            if file.startswith("chatlog_") and file.endswith(".json"):
-                try:
-                    async with aiofiles.open(os.path.join(root, file), 'r') as f:
-                        content = await f.read()
-                        log_data = json.loads(content)
-                        if log_data.get('parent_log_id') == parent_log_id:
-                            # Extract log_id from the data
-                            child_log_ids.append(log_data.get('log_id'))
-                except (json.JSONDecodeError, IOError):
-                    continue
-    
-    return child_log_ids
+    return await asyncio.to_thread(chatlog_index.children, parent_log_id)
 
 def extract_delegate_task_log_ids(messages: List[Dict]) -> List[str]:
     """
@@ -517,12 +811,16 @@ async def get_cached_token_counts(log_id: str, log_path: str) -> Dict[str, int]:
     """
     Get cached token counts if available and valid.
     
+    The counting functions below no longer consult this cache: per-message
+    token counts are stored with each log, so counting is cheap and always
+    current. Kept for callers that read the cache files directly.
+    
     Args:
         log_id: The log ID
         log_path: Path to the actual log file
         
     Returns:
-        Cached token counts if valid, None otherwise
+        Cached token counts if the log has not changed since they were saved, None otherwise
     """
     cache_path = await get_cache_path(log_id)
     
@@ -531,27 +829,14 @@ async def get_cached_token_counts(log_id: str, log_path: str) -> Dict[str, int]:
         return None
     
     try:
-        # Get modification times
-        log_mtime = await aiofiles.os.path.getmtime(log_path)
-        cache_mtime = await aiofiles.os.path.getmtime(cache_path)
-        current_time = time.time()
-        
         # If log was modified after cache was created, cache is invalid
+        log_mtime = await asyncio.to_thread(chatlog_journal.log_mtime, log_path)
+        cache_mtime = await aiofiles.os.path.getmtime(cache_path)
         if log_mtime > cache_mtime:
             return None
-        
-        # Don't recalculate sooner than 3 minutes after last calculation
-        if current_time - cache_mtime < 180:  # 3 minutes in seconds
-            async with aiofiles.open(cache_path, 'r') as f:
-                content = await f.read()
-                return json.loads(content)
-                
-        # For logs that haven't been modified in over an hour, consider them "finished"
-        # and use the cache regardless of when it was last calculated
-        if current_time - log_mtime > 3600:  # 1 hour in seconds
-            async with aiofiles.open(cache_path, 'r') as f:
-                content = await f.read()
-                return json.loads(content)
+        async with aiofiles.open(cache_path, 'r') as f:
+            content = await f.read()
+            return json.loads(content)
     
     except (json.JSONDecodeError, IOError) as e:
         print(f"Error reading token cache: {e}")
@@ -596,60 +881,13 @@ async def build_token_hierarchy(log_id: str, user: str = None, visited: set = No
         return None
     
     # Load the chat log
-    async with aiofiles.open(chatlog_path, 'r') as f:
-        content = await f.read()
-        log_data = json.loads(content)
-    
-    # Check if we have cached individual counts for this specific session
-    cached_individual = await get_cached_token_counts(log_id, chatlog_path)
-    if cached_individual and 'input_tokens_sequence' in cached_individual:
-        print(f"Using cached individual token counts for session {log_id}")
-        individual_counts = {
-            'input_tokens_sequence': cached_individual['input_tokens_sequence'],
-            'output_tokens_sequence': cached_individual['output_tokens_sequence'],
-            'input_tokens_total': cached_individual['input_tokens_total']
-        }
-    else:
-        # Calculate individual counts for this session
-        if user is None:
-            try:
-                path_parts = chatlog_path.split(os.sep)
-                if len(path_parts) >= 4 and path_parts[-4] == 'chat':
-                    user = path_parts[-3]
-                else:
-                    user = "system"
-            except Exception:
-                user = "system"
-        
-        temp_log = ChatLog(log_id=log_id, user=user, agent=log_data.get('agent', 'unknown'))
-        temp_log.messages = log_data.get('messages', [])
-        
-        # Count tokens for this log only
-        individual_counts = temp_log.count_tokens()
-        
-        # Cache the individual session counts
-        individual_cache_data = {
-            'input_tokens_sequence': individual_counts['input_tokens_sequence'],
-            'output_tokens_sequence': individual_counts['output_tokens_sequence'],
-            'input_tokens_total': individual_counts['input_tokens_total']
-        }
-        await save_token_counts_to_cache(log_id, individual_cache_data)
-        print(f"Cached individual token counts for session {log_id}")
+    log_data = await chatlog_journal.read_log_data(chatlog_path)
     
-    # Find all child log IDs
-    if user is None:
-        try:
-            path_parts = chatlog_path.split(os.sep)
-            if len(path_parts) >= 4 and path_parts[-4] == 'chat':
-                user = path_parts[-3]
-            else:
-                user = "system"
-        except Exception:
-            user = "system"
+    # Counts for this session only; cheap since per-message counts are
+    # stored with the log.
+    individual_counts = TokenLedger.from_log_data(log_data).totals()
     
-    temp_log = ChatLog(log_id=log_id, user=user, agent=log_data.get('agent', 'unknown'))
-    temp_log.messages = log_data.get('messages', [])
-    delegated_log_ids = extract_delegate_task_log_ids(temp_log.messages)
+    delegated_log_ids = extract_delegate_task_log_ids(log_data.get('messages', []))
     child_logs_by_parent = await find_child_logs_by_parent_id(log_id)
     all_child_log_ids = list(set(delegated_log_ids) | set(child_logs_by_parent))
     
@@ -697,57 +935,16 @@ async def count_tokens_for_log_id(log_id: str, user: str = None, hierarchical: b
     
     # If hierarchical structure is requested, build and return it
     if hierarchical:
-        # Check cache first for hierarchical data
-        cached_counts = await get_cached_token_counts(log_id, chatlog_path)
-        if cached_counts and 'hierarchy' in cached_counts:
-            print(f"Using cached hierarchical token counts for {log_id}")
-            return cached_counts
-        
-        print(f"Calculating hierarchical token counts for {log_id}")
         hierarchy = await build_token_hierarchy(log_id, user)
         if hierarchy:
-            result = {'hierarchy': hierarchy}
-            # Save hierarchical data to cache
-            await save_token_counts_to_cache(log_id, result)
-            return result
+            return {'hierarchy': hierarchy}
         return None
     
-    # Check cache first
-    cached_counts = await get_cached_token_counts(log_id, chatlog_path)
-    if cached_counts:
-        print(f"Using cached token counts for {log_id}")
-        return cached_counts
-    
-    print(f"Calculating token counts for {log_id}")
-    
     # Load the chat log
-    async with aiofiles.open(chatlog_path, 'r') as f:
-        content = await f.read()
-        log_data = json.loads(content)
-    
-    # Get parent_log_id if it exists
-    parent_log_id = log_data.get('parent_log_id')
-        
-    # Create a temporary ChatLog instance to count tokens
-    # Use provided user or try to determine from chatlog path or fallback to "system"
-    if user is None:
-        # Try to extract user from chatlog path: data/chat/{user}/{agent}/chatlog_{log_id}.json
-        try:
-            path_parts = chatlog_path.split(os.sep)
-            if len(path_parts) >= 4 and path_parts[-4] == 'chat':
-                extracted_user = path_parts[-3]  # User is third from the end
-                user = extracted_user
-                print(f"Extracted user '{user}' from chatlog path: {chatlog_path}")
-            else:
-                user = "system"  # Default fallback
-        except Exception as e:
-            print(f"Error extracting user from path {chatlog_path}: {e}")
-            user = "system"  # Default fallback
-    temp_log = ChatLog(log_id=log_id, user=user, agent=log_data.get('agent', 'unknown'))
-    temp_log.messages = log_data.get('messages', [])
+    log_data = await chatlog_journal.read_log_data(chatlog_path)
     
     # Count tokens for this log
-    parent_counts = temp_log.count_tokens()
+    parent_counts = TokenLedger.from_log_data(log_data).totals()
     
     # Create combined counts (starting with parent counts)
     combined_counts = {
@@ -757,7 +954,7 @@ async def count_tokens_for_log_id(log_id: str, user: str = None, hierarchical: b
     }
     
     # Find delegated task log IDs
-    delegated_log_ids = extract_delegate_task_log_ids(temp_log.messages)
+    delegated_log_ids = extract_delegate_task_log_ids(log_data.get('messages', []))
     
     # Also find child logs by parent_log_id
     child_logs_by_parent = await find_child_logs_by_parent_id(log_id)
@@ -789,7 +986,4 @@ async def count_tokens_for_log_id(log_id: str, user: str = None, hierarchical: b
         'combined_input_tokens_total': combined_counts['input_tokens_total']
     }
     
-    # Save to cache
-    await save_token_counts_to_cache(log_id, token_counts)
-    
     return token_counts
@@ -0,0 +1,292 @@
+"""Persistent log_id -> {user, agent, parent} index for chat logs.
+
+find_chatlog_file() used to os.walk the whole CHATLOG_DIR for every lookup,
+and find_child_logs_by_parent_id() parsed every chatlog on disk. This index
+keeps the location and parent of every chatlog in memory, plus the reverse
+parent -> children adjacency, backed by an append-only file
+(CHATLOG_INDEX_DIR/log_locations.jsonl):
+
+    {"op": "rebuilt", "chat_dir": "data/chat", "version": 2}
+    {"op": "set", "log_id": "abc", "user": "bob", "agent": "Assistant", "parent": "xyz"}
+    {"op": "del", "log_id": "abc"}
+
+ChatLog registers a log when it is created with a parent_log_id (run_task /
+delegate_task children) and the first time it writes it; ChatContext
+removes it on delete. The server loads the index in a worker thread at
+startup. It is rebuilt from disk when the file is missing or was built for
+a different CHATLOG_DIR, and on demand with `mindroot chatlog reindex`. Records appended by other processes are picked
+up on a lookup miss; failing that, a lookup scans CHATLOG_DIR once for the
+log (e.g. a log restored from a backup) and indexes it if found.
+"""
+import os
+import json
+import threading
+
+INDEX_FILE_NAME = 'log_locations.jsonl'
+# Bump when the record format changes so older index files get rebuilt.
+INDEX_VERSION = 2
+
+
+def chat_dir() -> str:
+    return os.environ.get('CHATLOG_DIR', 'data/chat')
+
+
+def index_dir() -> str:
+    return os.environ.get('CHATLOG_INDEX_DIR', 'data/chat_index')
+
+
+def parse_chatlog_path(path: str, base_dir: str = None):
+    """data/chat/{user}/{agent}/chatlog_{log_id}.json -> (log_id, user, agent)"""
+    if base_dir is None:
+        base_dir = chat_dir()
+    parts = os.path.relpath(path, base_dir).split(os.sep)
+    if len(parts) != 3:
+        return None
+    file = parts[2]
+    if not (file.startswith('chatlog_') and file.endswith('.json')):
+        return None
+    return file[len('chatlog_'):-len('.json')], parts[0], parts[1]
+
+
+class ChatLogIndex:
+
+    def __init__(self):
+        self._entries = {}
+        self._parents = {}
+        self._children = {}
+        self._loaded_for = None
+        self._offset = 0
+        self._dead = 0
+        self._built_for = None
+        self._inode = None
+        self._lock = threading.RLock()
+
+    def _index_file(self) -> str:
+        return os.path.join(index_dir(), INDEX_FILE_NAME)
+
+    def _set_parent(self, log_id: str, parent) -> None:
+        old_parent = self._parents.pop(log_id, None)
+        if old_parent is not None:
+            siblings = self._children.get(old_parent)
+            if siblings is not None:
+                siblings.discard(log_id)
+                if not siblings:
+                    del self._children[old_parent]
+        if parent is not None:
+            self._parents[log_id] = parent
+            self._children.setdefault(parent, set()).add(log_id)
+
+    def _reset(self) -> None:
+        self._entries = {}
+        self._parents = {}
+        self._children = {}
+        self._dead = 0
+
+    def _apply(self, record: dict) -> None:
+        op = record.get('op')
+        if op == 'set':
+            log_id = record['log_id']
+            if log_id in self._entries:
+                self._dead += 1
+            self._entries[log_id] = (record['user'], record['agent'])
+            self._set_parent(log_id, record.get('parent'))
+        elif op == 'del':
+            if self._entries.pop(record['log_id'], None) is not None:
+                self._set_parent(record['log_id'], None)
+                self._dead += 2
+        elif op == 'rebuilt':
+            if record.get('version') == INDEX_VERSION:
+                self._built_for = record.get('chat_dir')
+
+    def _read_from(self, offset: int) -> None:
+        with open(self._index_file(), 'r') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            if offset and inode != self._inode:
+                # Another process rewrote the index; start over.
+                self._reset()
+                offset = 0
+            self._inode = inode
+            f.seek(offset)
+            for line in f:
+                if not line.endswith('\n'):
+                    # Partial line still being written by another process.
+                    break
+                offset += len(line.encode('utf-8'))
+                try:
+                    self._apply(json.loads(line))
+                except (json.JSONDecodeError, KeyError):
+                    continue
+        self._offset = offset
+
+    def _ensure_loaded(self) -> None:
+        current_dir = chat_dir()
+        if self._loaded_for == current_dir:
+            return
+        self._reset()
+        self._offset = 0
+        self._built_for = None
+        if os.path.exists(self._index_file()):
+            self._read_from(0)
+        if self._built_for != current_dir:
+            self.rebuild()
+            return
+        self._loaded_for = current_dir
+        if self._dead > len(self._entries) + 1000:
+            self._write_all()
+
+    def load(self) -> None:
+        """Load the index, rebuilding it from disk if needed (slow the first
+        time). Call off the event loop."""
+        with self._lock:
+            self._ensure_loaded()
+
+    def _append(self, record: dict) -> None:
+        os.makedirs(index_dir(), exist_ok=True)
+        # Pick up other processes' records first so our offset stays valid.
+        if os.path.exists(self._index_file()):
+            self._read_from(self._offset)
+        with open(self._index_file(), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        self._read_from(self._offset)
+
+    def _write_all(self) -> None:
+        os.makedirs(index_dir(), exist_ok=True)
+        tmp_file = self._index_file() + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(json.dumps({'op': 'rebuilt', 'chat_dir': chat_dir(), 'version': INDEX_VERSION}) + '\n')
+            for log_id, (user, agent) in self._entries.items():
+                f.write(json.dumps(self._set_record(log_id, user, agent, self._parents.get(log_id))) + '\n')
+        os.replace(tmp_file, self._index_file())
+        stat = os.stat(self._index_file())
+        self._offset = stat.st_size
+        self._inode = stat.st_ino
+        self._dead = 0
+
+    @staticmethod
+    def _set_record(log_id: str, user: str, agent: str, parent) -> dict:
+        record = {'op': 'set', 'log_id': log_id, 'user': user, 'agent': agent}
+        if parent is not None:
+            record['parent'] = parent
+        return record
+
+    @staticmethod
+    def _read_parent(path: str):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f).get('parent_log_id')
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def rebuild(self) -> int:
+        """Rescan CHATLOG_DIR and rewrite the index. Returns the entry count.
+
+        Reads every chatlog once to recover parent_log_id, so this is the slow
+        path; it only runs on first use, after a format change or on request.
+        """
+        with self._lock:
+            base_dir = chat_dir()
+            self._reset()
+            for root, dirs, files in os.walk(base_dir):
+                for file in files:
+                    path = os.path.join(root, file)
+                    parsed = parse_chatlog_path(path, base_dir)
+                    if parsed:
+                        log_id, user, agent = parsed
+                        self._entries[log_id] = (user, agent)
+                        self._set_parent(log_id, self._read_parent(path))
+            self._built_for = base_dir
+            self._loaded_for = base_dir
+            self._write_all()
+            return len(self._entries)
+
+    def _scan_for(self, log_id: str):
+        """Find chatlog_{log_id}.json on disk: (user, agent, parent) or None."""
+        base_dir = chat_dir()
+        name = f'chatlog_{log_id}.json'
+        for root, dirs, files in os.walk(base_dir):
+            if name in files:
+                path = os.path.join(root, name)
+                parsed = parse_chatlog_path(path, base_dir)
+                if parsed:
+                    return parsed[1], parsed[2], self._read_parent(path)
+        return None
+
+    def lookup(self, log_id: str):
+        """Return (user, agent) for log_id, or None."""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(log_id)
+            if entry is None and os.path.exists(self._index_file()):
+                self._read_from(self._offset)
+                entry = self._entries.get(log_id)
+            if entry is None:
+                # Not indexed (copied in, restored, or written by a process
+                # that doesn't index): look on disk and index it.
+                found = self._scan_for(log_id)
+                if found is not None:
+                    user, agent, parent = found
+                    self._append(self._set_record(log_id, user, agent, parent))
+                    entry = (user, agent)
+            return entry
+
+    def find(self, log_id: str) -> str:
+        """Return the chatlog path for log_id if it exists on disk, else None."""
+        entry = self.lookup(log_id)
+        if entry is None:
+            return None
+        path = os.path.join(chat_dir(), entry[0], entry[1], f'chatlog_{log_id}.json')
+        if os.path.exists(path):
+            return path
+        # Stale entry (file removed outside of ChatContext.delete).
+        self.unregister(log_id)
+        return None
+
+    def register(self, log_id: str, user: str, agent: str, parent_log_id=None, load=True) -> bool:
+        """Record log_id's location and parent. With load=False an index that
+        is not loaded yet is not loaded (or rebuilt) for this: the record is
+        only appended to the file and False is returned."""
+        log_id = str(log_id)
+        if parent_log_id is not None:
+            parent_log_id = str(parent_log_id)
+        record = self._set_record(log_id, user, agent, parent_log_id)
+        with self._lock:
+            if not load and self._loaded_for != chat_dir():
+                os.makedirs(index_dir(), exist_ok=True)
+                with open(self._index_file(), 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+                return False
+            self._ensure_loaded()
+            if self._entries.get(log_id) != (user, agent) or self._parents.get(log_id) != parent_log_id:
+                self._append(record)
+            return True
+
+    def unregister(self, log_id: str) -> None:
+        with self._lock:
+            self._ensure_loaded()
+            if log_id not in self._entries:
+                return
+            self._append({'op': 'del', 'log_id': log_id})
+
+    def children(self, parent_log_id: str) -> list:
+        """Log ids whose parent_log_id is parent_log_id."""
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._children.get(str(parent_log_id), ()))
+
+    def parent(self, log_id: str):
+        with self._lock:
+            self._ensure_loaded()
+            return self._parents.get(str(log_id))
+
+    def all_entries(self) -> dict:
+        with self._lock:
+            self._ensure_loaded()
+            return dict(self._entries)
+
+
+chatlog_index = ChatLogIndex()
+
+
+if __name__ == '__main__':
+    count = chatlog_index.rebuild()
+    print(f"Indexed {count} chat logs from {chat_dir()}")
@@ -0,0 +1,201 @@
+"""Append-only journal storage for chat logs.
+
+With MR_CHATLOG_JOURNAL enabled, chatlog_{log_id}.json is treated as a
+snapshot and every later mutation is appended as one JSON line to
+chatlog_{log_id}.journal.jsonl next to it, so persisting a message costs
+O(message) instead of re-serializing the whole session. Once the journal
+grows past MR_CHATLOG_COMPACT_EVERY records it is folded back into the
+snapshot in the background.
+
+Journal records:
+    {"seq": 12, "op": "append", "message": {...}}
+    {"seq": 13, "op": "set_last", "message": {...}}
+    {"seq": 14, "op": "drop_last"}
+
+Snapshots carry the 'journal_seq' of the last record they include, so
+records at or below it are ignored on replay. That makes compaction safe
+even if a record is appended between taking the snapshot and rewriting
+the journal. Readers always replay an existing journal, regardless of
+whether journaling is currently enabled.
+"""
+import os
+import json
+import threading
+import aiofiles
+import aiofiles.os
+
+JOURNAL_SUFFIX = '.journal.jsonl'
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def journal_enabled() -> bool:
+    return os.environ.get('MR_CHATLOG_JOURNAL', '0').lower() in ('1', 'true', 'yes', 'on')
+
+
+def compact_every() -> int:
+    try:
+        return max(1, int(os.environ.get('MR_CHATLOG_COMPACT_EVERY', '200')))
+    except ValueError:
+        return 200
+
+
+def journal_path(log_file: str) -> str:
+    """chatlog_{id}.json -> chatlog_{id}.journal.jsonl"""
+    if log_file.endswith('.json'):
+        log_file = log_file[:-len('.json')]
+    return log_file + JOURNAL_SUFFIX
+
+
+def _file_lock(log_file: str) -> threading.Lock:
+    """One lock per chatlog file, shared by every ChatLog instance on it."""
+    with _locks_guard:
+        lock = _locks.get(log_file)
+        if lock is None:
+            lock = threading.Lock()
+            _locks[log_file] = lock
+        return lock
+
+
+def apply_record(messages: list, record: dict, token_counts: list = None) -> None:
+    """Apply one record to messages, and to the per-message token_counts list
+    (see token_ledger) when the caller is tracking it."""
+    op = record.get('op')
+    if op == 'append' or (op == 'set_last' and not messages):
+        messages.append(record['message'])
+        if token_counts is not None:
+            token_counts.append(record.get('tokens'))
+    elif op == 'set_last':
+        messages[-1] = record['message']
+        if token_counts is not None:
+            token_counts[-1] = record.get('tokens')
+    elif op == 'drop_last':
+        if messages:
+            messages.pop()
+            if token_counts is not None:
+                token_counts.pop()
+
+
+def replay_journal(log_data: dict, journal_text: str) -> int:
+    """Apply journal records newer than the snapshot to log_data in place.
+
+    Returns the number of records applied. A torn trailing line (crash in the
+    middle of an append) ends the replay instead of failing the load.
+    """
+    base_seq = log_data.get('journal_seq', 0) or 0
+    messages = log_data.get('messages')
+    if messages is None:
+        messages = []
+        log_data['messages'] = messages
+    token_counts = log_data.get('token_counts')
+    if not isinstance(token_counts, list) or len(token_counts) != len(messages):
+        token_counts = None
+    applied = 0
+    for line in journal_text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            print(f"Warning: ignoring truncated chatlog journal record: {line[:80]}")
+            break
+        seq = record.get('seq', 0)
+        if seq <= base_seq:
+            continue
+        apply_record(messages, record, token_counts)
+        log_data['journal_seq'] = seq
+        base_seq = seq
+        applied += 1
+    if token_counts is None or None in token_counts:
+        # Counts are missing for some messages (older snapshot or journal);
+        # TokenLedger will re-estimate the whole log.
+        log_data.pop('token_counts', None)
+    return applied
+
+
+def read_journal_sync(log_file: str) -> str:
+    path = journal_path(log_file)
+    if not os.path.exists(path):
+        return ''
+    with open(path, 'r') as f:
+        return f.read()
+
+
+async def read_journal(log_file: str) -> str:
+    path = journal_path(log_file)
+    if not await aiofiles.os.path.exists(path):
+        return ''
+    async with aiofiles.open(path, 'r') as f:
+        return await f.read()
+
+
+async def read_log_data(log_file: str) -> dict:
+    """Load a chatlog file with its journal applied (for read-only callers)."""
+    async with aiofiles.open(log_file, 'r') as f:
+        log_data = json.loads(await f.read())
+    journal_text = await read_journal(log_file)
+    if journal_text:
+        replay_journal(log_data, journal_text)
+    return log_data
+
+
+def log_mtime(log_file: str) -> float:
+    """Last modification of the log, counting journal appends."""
+    mtime = os.path.getmtime(log_file)
+    path = journal_path(log_file)
+    if os.path.exists(path):
+        mtime = max(mtime, os.path.getmtime(path))
+    return mtime
+
+
+def encode_records(records: list) -> str:
+    """Serialize records on the caller's thread, before the message dicts can
+    be mutated again by the next turn."""
+    return ''.join(json.dumps(record) + '\n' for record in records)
+
+
+def append_lines(log_file: str, lines: str) -> None:
+    """Append encoded records to the journal. Runs in a worker thread."""
+    with _file_lock(log_file):
+        with open(journal_path(log_file), 'a') as f:
+            f.write(lines)
+
+
+def write_snapshot(log_file: str, log_data: dict) -> None:
+    """Atomically write a full snapshot and drop the journal records it covers.
+
+    Runs in a worker thread. Records appended after log_data was captured
+    (seq > log_data['journal_seq']) are kept.
+    """
+    tmp_file = log_file + '.tmp'
+    with _file_lock(log_file):
+        with open(tmp_file, 'w') as f:
+            json.dump(log_data, f, indent=2)
+        os.replace(tmp_file, log_file)
+        path = journal_path(log_file)
+        if not os.path.exists(path):
+            return
+        snapshot_seq = log_data.get('journal_seq', 0) or 0
+        with open(path, 'r') as f:
+            lines = f.readlines()
+        keep = []
+        for line in lines:
+            try:
+                if json.loads(line).get('seq', 0) > snapshot_seq:
+                    keep.append(line)
+            except json.JSONDecodeError:
+                continue
+        if keep:
+            with open(path + '.tmp', 'w') as f:
+                f.writelines(keep)
+            os.replace(path + '.tmp', path)
+        else:
+            os.remove(path)
+
+
+def remove_journal(log_file: str) -> None:
+    path = journal_path(log_file)
+    with _file_lock(log_file):
+        if os.path.exists(path):
+            os.remove(path)
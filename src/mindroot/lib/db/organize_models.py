@@ -1,3 +1,4 @@
+import logging
 from typing import List, Dict, Optional
 from termcolor import colored
 from mindroot.registry import data_access
@@ -54,7 +55,11 @@ def organize_for_display(models: List[Dict], providers: List[Dict], equivalent_f
 
     return organized_data
 
-async def load_organized():
+def _registry_files() -> List[str]:
+    return [data_access.models_file, data_access.providers_file,
+            data_access.plugins_file, data_access.equivalent_flags_file]
+
+def _build_organized() -> List[Dict]:
     models = data_access.read_models()
     providers = data_access.read_providers()
     plugins = data_access.read_plugins()
@@ -64,15 +69,27 @@ async def load_organized():
     equivalent_flags = load_equivalent_flags()
     return organize_for_display(models, providers, equivalent_flags)
 
+def organized_models() -> List[Dict]:
+    """organize_for_display() for the enabled providers, recomputed only when
+    models, providers, plugin manifest or equivalent flags change (shared; do
+    not modify)."""
+    return data_access.derived('organized_models', _registry_files(), _build_organized)
+
+def service_index() -> Dict[str, Dict[str, List[Dict]]]:
+    """service -> flag -> model entries, from organized_models()."""
+    def build():
+        return {service['service']: {flag['flag']: flag['models'] for flag in service['flags']}
+                for service in organized_models()}
+    return data_access.derived('service_index', _registry_files(), build)
+
+async def load_organized():
+    return organized_models()
+
 async def uses_models(service_or_command_name: str) -> bool:
     if not isinstance(service_or_command_name, str) or not service_or_command_name:
         logging.error('Invalid service_or_command_name')
         raise ValueError('Invalid service_or_command_name')
-    organized_data = await load_organized()
-    for service in organized_data:
-        if service['service'] == service_or_command_name:
-            return True
-    return False
+    return service_or_command_name in service_index()
 
 async def matching_models(service_or_command_name: str, flags: List[str]) -> Optional[List[Dict]]:
     if not isinstance(service_or_command_name, str) or not service_or_command_name:
@@ -84,25 +101,23 @@ async def matching_models(service_or_command_name: str, flags: List[str]) -> Opt
 
     if len(flags) == 0:
         flags = ['no_flags']
-    organized_data = await load_organized()
+    service_flags = service_index().get(service_or_command_name, {})
     # find all models that match the given service_or_command_name and equivalent_flags
     matching_models = []
-    for service in organized_data:
-        if service['service'] == service_or_command_name:
-            for flag in service['flags']:
-                if flag['flag'] in flags:
-                    for entry in flag['models']:
-                        result = {}  
-                        models = entry['provider']['models']
-                        available_models = [model for model in models if model['available']]
-                        if len(available_models) > 0:
-                            result.update(available_models[0])
-                            result['provider'] = entry['provider']['plugin']
-                            result.update(entry['model'])
-                            if 'meta' in result:
-                                result.update(result['meta'])
-
-                            matching_models.append(result)
+    for flag, entries in service_flags.items():
+        if flag in flags:
+            for entry in entries:
+                result = {}  
+                models = entry['provider']['models']
+                available_models = [model for model in models if model['available']]
+                if len(available_models) > 0:
+                    result.update(available_models[0])
+                    result['provider'] = entry['provider']['plugin']
+                    result.update(entry['model'])
+                    if 'meta' in result:
+                        result.update(result['meta'])
+
+                    matching_models.append(result)
     return matching_models
 
 if __name__ == '__main__':
@@ -18,6 +18,34 @@ async def load_provider_data() -> Optional[Dict]:
         return None
     return provider_data
 
+def preferred_models_index() -> Dict[str, List[Dict]]:
+    """service_or_command_name -> preferred model settings (shared; do not modify)."""
+    def build():
+        index = {}
+        for setting in data_access.read_preferred_models():
+            index.setdefault(setting['service_or_command_name'], []).append(setting)
+        return index
+    return data_access.derived('preferred_models_index', [data_access.preferred_models_file], build)
+
+def provider_models_index() -> Dict[str, List[tuple]]:
+    """model name -> [(provider plugin, provider model entry), ...]"""
+    def build():
+        index = {}
+        for provider in data_access.read_providers():
+            for provider_model in provider['models']:
+                index.setdefault(provider_model['name'], []).append((provider['plugin'], provider_model))
+        return index
+    return data_access.derived('provider_models_index', [data_access.providers_file], build)
+
+def models_index() -> Dict[str, Dict]:
+    """model name -> models.json entry"""
+    def build():
+        index = {}
+        for model in data_access.read_models():
+            index.setdefault(model['name'], model)
+        return index
+    return data_access.derived('models_index', [data_access.models_file], build)
+
 async def find_preferred_models(service_or_command_name: str, flags: List[str]) -> Optional[List[Dict]]:
     if not isinstance(service_or_command_name, str) or not service_or_command_name:
         logging.error('Invalid service_or_command_name')
@@ -26,30 +54,29 @@ async def find_preferred_models(service_or_command_name: str, flags: List[str])
         logging.error('Invalid flags')
         return None
     try:
-        settings = data_access.read_preferred_models()
+        settings = preferred_models_index().get(service_or_command_name, [])
     except Exception as e:
         logging.error(f'Error reading settings file: {e}')
         return None
     matching_models = []
-    settings = [setting for setting in settings if setting['service_or_command_name'] == service_or_command_name]
     for setting in settings:
         if setting['flag'] in flags:
-            matching_models.append(setting)
+            matching_models.append(dict(setting))
     if not matching_models:
         return None
-    providers = await load_provider_data()
-    models = await load_models()
+    try:
+        provider_models = provider_models_index()
+        models = models_index()
+    except Exception as e:
+        logging.error(f'Error reading model or provider data: {e}')
+        return matching_models
     for model in matching_models:
-        for provider in providers:
-            for provider_model in provider['models']:
-                if provider_model['name'] == model['model']:
-                    model['provider'] = provider['plugin']
-                    model.update(provider_model)
-                    for model_entry in models:
-                        if model['name'] == model['model']:
-                            model.update(model_entry)
-                            break
-                    if 'meta' in model:
-                        model.update(model['meta'])
+        for plugin, provider_model in provider_models.get(model['model'], []):
+            model['provider'] = plugin
+            model.update(provider_model)
+            if model['model'] in models:
+                model.update(models[model['model']])
+            if 'meta' in model:
+                model.update(model['meta'])
     logging.debug(f'Matching models found: {matching_models}')
     return matching_models
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""Copy-on-write snapshots of chat history messages.
+
+Every agent iteration used to hand the LLM pipeline a json.loads(json.dumps())
+copy of the whole history (twice: once in ChatLog.get_recent() and again in
+Agent.chat_commands), so filter_messages pipes and providers could mutate
+messages without touching the log. ChatLog now keeps one detached copy of
+each message (made once, when it is first requested) and get_recent()
+returns a new list of those copies.
+
+The copies are CowDict / CowList objects: ordinary dict and list subclasses
+(isinstance checks and json.dumps work as before) whose mutating methods
+mark the message they belong to as dirty. Pipes can keep editing messages in
+place; the history is never affected, and ChatLog replaces only the dirtied
+copies on the next get_recent(). Untouched messages are shared between
+snapshots.
+"""
+
+
+class CowDict(dict):
+    __slots__ = ('_root', '_dirty')
+
+    def _touch(self):
+        self._root._dirty = True
+
+    def __setitem__(self, key, value):
+        self._touch()
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._touch()
+        dict.__delitem__(self, key)
+
+    def __ior__(self, other):
+        self._touch()
+        return dict.__ior__(self, other)
+
+    def pop(self, *args):
+        self._touch()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._touch()
+        return dict.popitem(self)
+
+    def clear(self):
+        self._touch()
+        dict.clear(self)
+
+    def update(self, *args, **kwargs):
+        self._touch()
+        dict.update(self, *args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        self._touch()
+        return dict.setdefault(self, key, default)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce_ex__(self, protocol):
+        return (dict, (dict(self),))
+
+
+class CowList(list):
+    __slots__ = ('_root',)
+
+    def _touch(self):
+        self._root._dirty = True
+
+    def __setitem__(self, index, value):
+        self._touch()
+        list.__setitem__(self, index, value)
+
+    def __delitem__(self, index):
+        self._touch()
+        list.__delitem__(self, index)
+
+    def __iadd__(self, other):
+        self._touch()
+        return list.__iadd__(self, other)
+
+    def __imul__(self, n):
+        self._touch()
+        return list.__imul__(self, n)
+
+    def append(self, value):
+        self._touch()
+        list.append(self, value)
+
+    def extend(self, values):
+        self._touch()
+        list.extend(self, values)
+
+    def insert(self, index, value):
+        self._touch()
+        list.insert(self, index, value)
+
+    def pop(self, *args):
+        self._touch()
+        return list.pop(self, *args)
+
+    def remove(self, value):
+        self._touch()
+        list.remove(self, value)
+
+    def clear(self):
+        self._touch()
+        list.clear(self)
+
+    def sort(self, *args, **kwargs):
+        self._touch()
+        list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._touch()
+        list.reverse(self)
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce_ex__(self, protocol):
+        return (list, (list(self),))
+
+
+def _cow_copy(obj, root):
+    if isinstance(obj, dict):
+        copy = CowDict()
+        copy._root = root
+        dict.update(copy, ((key, _cow_copy(value, root)) for key, value in obj.items()))
+        return copy
+    if isinstance(obj, (list, tuple)):
+        copy = CowList(_cow_copy(value, root) for value in obj)
+        copy._root = root
+        return copy
+    return obj
+
+
+def cow_message(message: dict) -> CowDict:
+    """Detached copy-on-write copy of a history message."""
+    root = CowDict()
+    root._root = root
+    root._dirty = False
+    dict.update(root, ((key, _cow_copy(value, root)) for key, value in message.items()))
+    return root
+
+
+def is_dirty(message) -> bool:
+    """True if a snapshot message was modified since it was copied."""
+    return not isinstance(message, CowDict) or getattr(message, '_dirty', True)
+
+
+def thaw(obj):
+    """Plain dict/list deep copy of a snapshot (or any JSON-like) value."""
+    if isinstance(obj, dict):
+        return {key: thaw(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [thaw(value) for value in obj]
+    return obj
+
+
+def snapshot_messages(messages: list) -> list:
+    """New list in which every message is a copy-on-write copy. Messages that
+    already are (e.g. from ChatLog.get_recent()) are reused as-is."""
+    return [m if isinstance(m, CowDict) and not is_dirty(m) else cow_message(m) for m in messages]
@@ -0,0 +1,151 @@
+"""Call counts, error counts and latency histograms for the dispatch layers.
+
+ProviderManager.execute (services and commands), HookManager.execute_hooks
+and PipelineManager.execute_pipeline record one observation per
+implementation call, labelled with kind ('service', 'command', 'hook',
+'pipe'), name and provider (the plugin or module of the implementation).
+Recording is a dict lookup, a bisect and a few increments; set
+MR_METRICS=0 to turn it off.
+
+For services that return a stream (e.g. stream_chat), the latency is the
+time until the generator is returned, not the full stream.
+
+Read the numbers with metrics.snapshot() (JSON; /admin/metrics) or
+metrics.render_prometheus() (text exposition format; /metrics). Other
+modules can add gauges with metrics.register_gauges(prefix, fn), where fn
+returns a dict of numbers.
+"""
+import os
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict
+
+# Histogram bucket upper bounds in seconds (+Inf is implicit).
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def metrics_enabled() -> bool:
+    return os.environ.get('MR_METRICS', '1').lower() not in ('0', 'false', 'no', 'off')
+
+
+class _Series:
+    __slots__ = ('count', 'errors', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+
+    def __init__(self):
+        self.enabled = metrics_enabled()
+        self.started = time.time()
+        self._series: Dict[tuple, _Series] = {}
+        self._gauges: Dict[str, Callable[[], dict]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind: str, name: str, provider: str, seconds: float, error: bool = False) -> None:
+        if not self.enabled:
+            return
+        key = (kind, name, provider)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, _Series())
+        series.count += 1
+        series.total += seconds
+        if seconds > series.max:
+            series.max = seconds
+        series.buckets[bisect_left(BUCKETS, seconds)] += 1
+        if error:
+            series.errors += 1
+
+    def register_gauges(self, prefix: str, fn: Callable[[], dict]) -> None:
+        self._gauges[prefix] = fn
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series = {}
+        self.started = time.time()
+
+    def _quantile(self, series: _Series, q: float) -> float:
+        """Upper bucket bound below which a fraction q of calls fell (capped
+        at the slowest call)."""
+        target = q * series.count
+        seen = 0
+        for i, n in enumerate(series.buckets):
+            seen += n
+            if seen >= target and n:
+                return min(BUCKETS[i], series.max) if i < len(BUCKETS) else series.max
+        return series.max
+
+    def _gauge_values(self) -> Dict[str, dict]:
+        values = {}
+        for prefix, fn in list(self._gauges.items()):
+            try:
+                values[prefix] = {k: v for k, v in fn().items() if isinstance(v, (int, float))}
+            except Exception as e:
+                print(f"Warning: metrics gauge '{prefix}' failed: {e}")
+        return values
+
+    def snapshot(self) -> dict:
+        calls = []
+        for (kind, name, provider), series in sorted(self._series.items()):
+            calls.append({
+                'kind': kind,
+                'name': name,
+                'provider': provider,
+                'count': series.count,
+                'errors': series.errors,
+                'total_seconds': round(series.total, 6),
+                'avg_ms': round(series.total / series.count * 1000, 3) if series.count else 0,
+                'p50_ms': round(self._quantile(series, 0.5) * 1000, 3),
+                'p95_ms': round(self._quantile(series, 0.95) * 1000, 3),
+                'max_ms': round(series.max * 1000, 3),
+            })
+        calls.sort(key=lambda c: c['total_seconds'], reverse=True)
+        return {'since': self.started, 'enabled': self.enabled, 'calls': calls, 'gauges': self._gauge_values()}
+
+    def render_prometheus(self) -> str:
+        lines = [
+            '# HELP mindroot_calls_total Implementation calls by dispatch layer.',
+            '# TYPE mindroot_calls_total counter',
+        ]
+        items = sorted(self._series.items())
+        for (kind, name, provider), series in items:
+            labels = f'kind="{_escape(kind)}",name="{_escape(name)}",provider="{_escape(provider)}"'
+            lines.append(f'mindroot_calls_total{{{labels}}} {series.count}')
+        lines += ['# HELP mindroot_call_errors_total Implementation calls that raised.',
+                  '# TYPE mindroot_call_errors_total counter']
+        for (kind, name, provider), series in items:
+            labels = f'kind="{_escape(kind)}",name="{_escape(name)}",provider="{_escape(provider)}"'
+            lines.append(f'mindroot_call_errors_total{{{labels}}} {series.errors}')
+        lines += ['# HELP mindroot_call_duration_seconds Implementation call latency.',
+                  '# TYPE mindroot_call_duration_seconds histogram']
+        for (kind, name, provider), series in items:
+            labels = f'kind="{_escape(kind)}",name="{_escape(name)}",provider="{_escape(provider)}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS, series.buckets):
+                cumulative += n
+                lines.append(f'mindroot_call_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'mindroot_call_duration_seconds_bucket{{{labels},le="+Inf"}} {series.count}')
+            lines.append(f'mindroot_call_duration_seconds_sum{{{labels}}} {series.total}')
+            lines.append(f'mindroot_call_duration_seconds_count{{{labels}}} {series.count}')
+        for prefix, values in self._gauge_values().items():
+            for key, value in values.items():
+                metric = f'mindroot_{prefix}_{key}'
+                lines.append(f'# TYPE {metric} gauge')
+                lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -1,13 +1,16 @@
 import inspect
-from typing import Any, Callable
+from typing import Any, Callable, Iterable, Optional
 from .pipelines import PipelineManager
 pipeline_manager = PipelineManager()
 
-def pipe(name: str, priority: int=0):
+def pipe(name: str, priority: int=0, events: Optional[Iterable[str]]=None):
+    """Register a pipe. events limits it to the pipeline events it needs,
+    e.g. @pipe(name='process_stream', events=['finish']) is skipped for
+    every streamed chunk."""
 
     def decorator(func: Callable[[Any], Any]):
         docstring = func.__doc__
         signature = inspect.signature(func)
-        pipeline_manager.register_pipe(name, func, signature, docstring, priority)
+        pipeline_manager.register_pipe(name, func, signature, docstring, priority, events=events)
         return func
     return decorator
\ No newline at end of file
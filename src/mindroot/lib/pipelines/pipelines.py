@@ -1,13 +1,62 @@
 import inspect
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Iterable
 import asyncio
+import os
+import time
 import termcolor
+from mindroot.lib.metrics import metrics
+
+# Latency budgets (seconds per pipeline run) for the pipelines on the
+# streaming hot path; MR_PIPELINE_BUDGET_MS sets one for all others.
+DEFAULT_BUDGETS = {
+    'process_stream': 0.01,
+    'partial_command': 0.01,
+}
+
+# Minimum seconds between two over-budget warnings for the same pipeline.
+BUDGET_WARNING_INTERVAL = 60
 
 class PipelineManager:
+    """Runs registered pipes in priority order.
+
+    Callers may pass an event (e.g. process_stream uses 'chunk' and
+    'finish'); pipes registered with events=[...] are skipped for other
+    events. Each pipe's call count and cumulative/max time are tracked (see
+    get_registered_pipes()), and a run that exceeds its pipeline's latency
+    budget logs a warning naming the slowest pipe.
+    """
     def __init__(self):
         self.pipes: Dict[str, List[Dict[str, Any]]] = {}
+        self.budgets: Dict[str, float] = dict(DEFAULT_BUDGETS)
+        self._by_event: Dict[tuple, List[Dict[str, Any]]] = {}
+        self._last_warning: Dict[str, float] = {}
+
+    def set_budget(self, name: str, seconds: Optional[float]) -> None:
+        """Set (or with None, remove) the latency budget of a pipeline."""
+        if seconds is None:
+            self.budgets.pop(name, None)
+        else:
+            self.budgets[name] = seconds
 
-    def register_pipe(self, name: str, implementation: Callable, signature: inspect.Signature, docstring: str, priority: int):
+    def _budget(self, name: str) -> float:
+        if name in self.budgets:
+            return self.budgets[name]
+        try:
+            return float(os.environ.get('MR_PIPELINE_BUDGET_MS', '0')) / 1000
+        except ValueError:
+            return 0
+
+    def _pipes_for(self, name: str, event: Optional[str]) -> List[Dict[str, Any]]:
+        key = (name, event)
+        pipes = self._by_event.get(key)
+        if pipes is None:
+            pipes = [p for p in self.pipes.get(name, [])
+                     if event is None or p['events'] is None or event in p['events']]
+            self._by_event[key] = pipes
+        return pipes
+
+    def register_pipe(self, name: str, implementation: Callable, signature: inspect.Signature, docstring: str, priority: int,
+                      events: Optional[Iterable[str]] = None):
         if name not in self.pipes:
             self.pipes[name] = []
         self.pipes[name].append({
@@ -19,42 +68,83 @@ class PipelineManager:
             # hot path (e.g. partial_command/process_stream run once per token)
             # doesn't pay inspect.iscoroutinefunction() on every invocation.
             'is_async': asyncio.iscoroutinefunction(implementation),
+            'provider': getattr(implementation, '__module__', None) or 'unknown',
+            # Pipeline events this pipe needs (None = all).
+            'events': frozenset(events) if events is not None else None,
+            'calls': 0,
+            'total_time': 0.0,
+            'max_time': 0.0,
         })
         print(termcolor.colored(f"Registering pipe '{name}' with priority {priority}", 'yellow'))
         self.pipes[name].sort(key=lambda x: x['priority'])
+        self._by_event.clear()
 
-    async def execute_pipeline(self, name: str, data: Any, context=None) -> Any:
+    async def execute_pipeline(self, name: str, data: Any, context=None, event: Optional[str]=None) -> Any:
         #print(termcolor.colored(f"Executing pipeline '{name}'", 'yellow'))
         if name not in self.pipes:
             #print(termcolor.colored(f"Pipeline '{name}' not found", 'red'))
             return data
-        #print(termcolor.colored(f"Pipeline '{name}' found", 'yellow'))
-        #print(self.pipes[name])
-        for pipe_info in self.pipes[name]:
+        pipes = self._pipes_for(name, event)
+        if not pipes:
+            return data
+        run_start = time.perf_counter()
+        slowest = None
+        for pipe_info in pipes:
             implementation = pipe_info['implementation']
             #print(termcolor.colored(f"Executing step with priority {pipe_info['priority']}", 'yellow'))
+            start = time.perf_counter()
+            error = False
             try:
                 if pipe_info['is_async']:
                     data = await implementation(data, context)
                 else:
                     data = implementation(data, context)
             except Exception as e:
+                error = True
                 #print in red
                 print(termcolor.colored(f"Error in pipeline '{name}' at step with priority {pipe_info['priority']}: {str(e)}", 'red'))
                 # raise e
+            elapsed = time.perf_counter() - start
+            pipe_info['calls'] += 1
+            pipe_info['total_time'] += elapsed
+            if elapsed > pipe_info['max_time']:
+                pipe_info['max_time'] = elapsed
+            if slowest is None or elapsed > slowest[1]:
+                slowest = (pipe_info, elapsed)
+            metrics.observe('pipe', name, pipe_info['provider'], elapsed, error=error)
+        budget = self._budget(name)
+        if budget:
+            total = time.perf_counter() - run_start
+            if total > budget:
+                self._warn_over_budget(name, total, budget, slowest)
         return data
 
+    def _warn_over_budget(self, name: str, total: float, budget: float, slowest) -> None:
+        now = time.monotonic()
+        if now - self._last_warning.get(name, 0) < BUDGET_WARNING_INTERVAL:
+            return
+        self._last_warning[name] = now
+        pipe_info, elapsed = slowest
+        print(termcolor.colored(f"Pipeline '{name}' took {total * 1000:.1f}ms (budget {budget * 1000:.1f}ms); "
+                                f"slowest pipe {pipe_info['provider']}.{pipe_info['implementation'].__name__} "
+                                f"(priority {pipe_info['priority']}) {elapsed * 1000:.1f}ms", 'yellow'))
+
     def get_registered_pipes(self) -> Dict[str, List[Dict[str, Any]]]:
-        return {name: [{'priority': p['priority'], 'docstring': p['docstring']} for p in pipes]
+        return {name: [{'priority': p['priority'], 'docstring': p['docstring'],
+                        'events': sorted(p['events']) if p['events'] is not None else None,
+                        'calls': p['calls'], 'total_time': p['total_time'], 'max_time': p['max_time']}
+                       for p in pipes]
                 for name, pipes in self.pipes.items()}
 
     def clear_pipeline(self, name: str) -> None:
         if name in self.pipes:
             del self.pipes[name]
+            self._by_event.clear()
 
     def remove_pipe(self, name: str, priority: int) -> bool:
         if name in self.pipes:
             self.pipes[name] = [p for p in self.pipes[name] if p['priority'] != priority]
+            self._by_event.clear()
             return True
         return False
 
@@ -2,11 +2,17 @@ import inspect
 import traceback
 import json
 import logging
+import asyncio
+import contextvars
+import os
+import time
 from typing import List, Dict, Optional, Type, TypeVar, cast
 from ..db.preferences import find_preferred_models
 from ..db.organize_models import uses_models, matching_models
 from ..utils.check_args import *
 from ..utils.debug import debug_box
+from mindroot.lib.metrics import metrics
+from .failover import call_with_failover
 import sys
 import nanoid
 from termcolor import colored
@@ -30,9 +36,47 @@ except ImportError:
 # TypeVar for Protocol typing
 P = TypeVar('P')
 
+# The ChatContext of the current asyncio task, used by execute() when a call
+# does not pass one. Each task (e.g. each chat session's turn) sees only the
+# value set in it or inherited from the task that created it, so concurrent
+# sessions cannot pick up each other's context. Shared through builtins like
+# the service manager, since this module can be imported both as
+# lib.providers and mindroot.lib.providers.
+_CURRENT_CONTEXT_KEY = 'mindroot.lib.providers.current_context'
+current_context = getattr(sys.modules['builtins'], _CURRENT_CONTEXT_KEY, None)
+if current_context is None:
+    current_context = contextvars.ContextVar('mindroot_current_context', default=None)
+    setattr(sys.modules['builtins'], _CURRENT_CONTEXT_KEY, current_context)
+
+# Files whose changes can alter which provider/model a service resolves to.
+DISPATCH_DATA_FILES = [
+    'data/models.json',
+    'data/providers.json',
+    'data/preferred_models.json',
+    'data/equivalent_flags.json',
+    'data/plugin_manifest.json',
+]
+
+def _dispatch_check_interval():
+    try:
+        return float(os.environ.get('MR_DISPATCH_CACHE_CHECK_INTERVAL', '1.0'))
+    except ValueError:
+        return 1.0
+
+def _data_files_signature():
+    signature = []
+    for path in DISPATCH_DATA_FILES:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
 class ProviderManager:
 
-    def __init__(self):
+    def __init__(self, kind='service'):
+        self.kind = kind  # label for metrics: 'service' or 'command'
         self.functions = {}
         # Fast path for services that don't need model selection
         # These services skip all the overhead and go directly to implementation
@@ -47,6 +91,13 @@ class ProviderManager:
             'sip_audio_out_chunk',
         }
         self._prefs_manager = None  # Cache for ModelPreferencesV2
+        # Resolved-dispatch cache for execute(): key -> (agent dict, function
+        # info, model for context.data). See _resolve_cached().
+        self._dispatch_cache = {}
+        self._dispatch_signature = None
+        self._dispatch_checked = 0.0
+        self.dispatch_hits = 0
+        self.dispatch_misses = 0
 
     def register_function(self, name, provider, implementation, signature, docstring, flags):
         if name not in self.functions:
@@ -54,6 +105,170 @@ class ProviderManager:
         if provider in [func_info['provider'] for func_info in self.functions[name]]:
             return
         self.functions[name].append({'implementation': implementation, 'docstring': docstring, 'flags': flags, 'provider': provider})
+        self.invalidate_dispatch_cache()
+
+    async def _invoke(self, name, func_info, args, kwargs):
+        """Call an implementation, recording its latency in metrics."""
+        start = time.perf_counter()
+        try:
+            result = await func_info['implementation'](*args, **kwargs)
+        except BaseException:
+            metrics.observe(self.kind, name, func_info['provider'], time.perf_counter() - start, error=True)
+            raise
+        metrics.observe(self.kind, name, func_info['provider'], time.perf_counter() - start)
+        return result
+
+    @property
+    def context(self):
+        """Context of the current task (see current_context)."""
+        return current_context.get()
+
+    @context.setter
+    def context(self, context):
+        current_context.set(context)
+
+    def invalidate_cache(self, name, *args, **kwargs):
+        """Drop memoized results of a @service(cache=...) function, for the
+        given arguments or (with none) all of them."""
+        for func_info in self.functions.get(name, []):
+            cache = getattr(func_info['implementation'], 'cache', None)
+            if cache is not None:
+                cache.invalidate(*args, **kwargs)
+
+    def invalidate_dispatch_cache(self):
+        """Forget resolved providers (after model, provider, preference or
+        plugin changes that did not go through the data files)."""
+        self._dispatch_cache = {}
+
+    def _check_dispatch_data(self):
+        now = time.monotonic()
+        if now - self._dispatch_checked < _dispatch_check_interval():
+            return
+        self._dispatch_checked = now
+        signature = _data_files_signature()
+        if signature != self._dispatch_signature:
+            self._dispatch_signature = signature
+            self._dispatch_cache = {}
+
+    async def _resolve_cached(self, name, context):
+        """Cached _resolve() keyed by (service, agent name, flags,
+        PREFERRED_PROVIDER). Entries are only valid for the same agent dict,
+        so reloaded agent config misses the cache."""
+        self._check_dispatch_data()
+        agent = getattr(context, 'agent', None) if context is not None else None
+        agent_name = agent.get('name') if isinstance(agent, dict) else None
+        flags = getattr(context, 'flags', None) if context is not None else None
+        data = getattr(context, 'data', None) if context is not None else None
+        preferred = data.get('PREFERRED_PROVIDER') if isinstance(data, dict) else None
+        try:
+            key = (name, agent_name, tuple(flags or ()), preferred, context.__class__.__name__)
+            hash(key)
+        except TypeError:
+            return (await self._resolve(name, context))[0]
+        entry = self._dispatch_cache.get(key)
+        if entry is not None and entry[0] is agent:
+            self.dispatch_hits += 1
+            function_info, sets_model, model = entry[1], entry[2], entry[3]
+            if sets_model:
+                context.data['model'] = model
+            return function_info
+        self.dispatch_misses += 1
+        function_info, sets_model, model = await self._resolve(name, context)
+        if len(self._dispatch_cache) >= 4096:
+            self._dispatch_cache = {}
+        self._dispatch_cache[key] = (agent, function_info, sets_model, model)
+        return function_info
+
+    async def _resolve(self, name, context):
+        """Pick the implementation of a service for this context from the
+        agent's required/preferred providers, PREFERRED_PROVIDER, and the
+        preferred or matching models for the context flags.
+
+        Returns (function_info, sets_model, model); when sets_model is true,
+        execute() stores model in context.data['model'].
+        """
+        preferred_models = None
+        preferred_provider = None
+        preferred_providers = None
+        sets_model = False
+        model = None
+
+        required_plugins = []
+        if context and hasattr(context, 'agent') and context.agent:
+            required_plugins = context.agent.get('required_plugins', [])
+        if required_plugins and name in self.functions:
+            for plugin in required_plugins:
+                for func_info in self.functions[name]:
+                    if func_info['provider'] == plugin:
+                        return func_info, False, None
+
+        preferred_providers_list = []
+        if context is not None and hasattr(context, 'agent') and context.agent:
+            preferred_providers = context.agent.get('preferred_providers', [])
+            if isinstance(preferred_providers, list):
+                preferred_providers_list = preferred_providers
+            elif isinstance(preferred_providers, dict):
+                if name in preferred_providers:
+                    preferred_provider = preferred_providers[name]
+                    for func_info in self.functions[name]:
+                        if func_info['provider'] == preferred_provider:
+                            return func_info, False, None
+        if context is not None and hasattr(context, 'data') and 'PREFERRED_PROVIDER' in context.data:
+            preferred_providers_list = [ context.data['PREFERRED_PROVIDER'] ]
+
+        if preferred_providers_list and name in self.functions:
+            for func_info in self.functions[name]:
+                if func_info['provider'] in preferred_providers_list:
+                    return func_info, False, None
+
+        if preferred_providers and name in preferred_providers:
+            preferred_provider = preferred_providers[name]
+            for func_info in self.functions[name]:
+                if func_info['provider'] == preferred_provider:
+                    return func_info, False, None
+
+        need_model = await uses_models(name)
+
+        if context.__class__.__name__ == 'ChatContext':
+            preferred_models = await find_preferred_models(name, context.flags)
+            if need_model and preferred_models is None:
+                preferred_models = await matching_models(name, context.flags)
+            sets_model = True
+            if preferred_models is not None:
+                if len(preferred_models) > 0:
+                    model = preferred_models[0]
+            context.data['model'] = model
+
+        if preferred_models is not None:
+            if len(preferred_models) > 0:
+                try:
+                    preferred_provider = preferred_models[0]['provider']
+                except KeyError:
+                    preferred_provider = None
+        function_info = None
+        if not need_model and preferred_provider is None:
+            preferred_provider = self.functions[name][0]['provider']
+        if preferred_provider is not None:
+            for func_info in self.functions[name]:
+                if func_info['provider'] == preferred_provider:
+                    function_info = func_info
+                    break
+            if function_info is None:
+                # No implementation from the preferred provider: fall back to the
+                # first registered one. (Previously this assignment was
+                # unconditional, which silently DISCARDED the matched provider and
+                # always used registration order. That is how e.g. a pasted image
+                # could be formatted by mr_gemini's format_image_message while
+                # stream_chat ran on ah_anthropic, producing an OpenAI-style
+                # 'image_url' block that Anthropic rejects with a 400.)
+                function_info = self.functions[name][0]
+
+        if function_info is None:
+            raise ValueError(f"1. function '{name}' not found. preferred_provider is '{preferred_provider}'.")
+
+        if function_info['implementation'] is None:
+            raise ValueError(f"2. function '{name}' not found. preferred_provider is '{preferred_provider}'.")
+        return function_info, sets_model, model
 
     async def exec_with_provider(self, name, provider, *args, **kwargs):
         if name not in self.functions:
@@ -67,11 +282,7 @@ class ProviderManager:
         implementation = func_info['implementation']
         if implementation is None:
             raise ValueError(f"function '{name}' not found for provider '{provider}'.")
-        try:
-            result = await implementation(*args, **kwargs)
-        except Exception as e:
-            raise e
-        return result
+        return await self._invoke(name, func_info, args, kwargs)
 
     async def execute(self, name, *args, **kwargs):
         if check_empty_args(args, kwargs=kwargs):
@@ -92,21 +303,15 @@ class ProviderManager:
                         found_context = True
                         break
                 
-                # If still no context, use self.context
+                # If still no context, use the current task's context
                 if not found_context:
-                    if hasattr(self, 'context'):
-                        kwargs['context'] = self.context
-                    else:
-                        raise ValueError(f"No context available for service '{name}'")
+                    kwargs['context'] = current_context.get()
             
-            return await self.functions[name][0]['implementation'](*args, **kwargs)
+            return await self._invoke(name, self.functions[name][0], args, kwargs)
         
         if name not in self.functions:
             raise ValueError(f"function '{name}' not found.")
 
-        preferred_models = None
-        preferred_provider = None
-        preferred_providers = None
         found_context = False
         context = None
 
@@ -120,10 +325,8 @@ class ProviderManager:
             found_context = True
 
         if not found_context and (not 'context' in kwargs):
-            kwargs['context'] = self.context
-            context = self.context
-
-        need_model = await uses_models(name)
+            context = current_context.get()
+            kwargs['context'] = context
 
         if (len(args) > 0 and args[0] is None) and not 'model' in kwargs or ('model' in kwargs and kwargs['model'] is None):
             if context is not None and context.agent is not None and 'service_models' in context.agent:
@@ -132,7 +335,7 @@ class ProviderManager:
                     for func_info in self.functions[name]:
                         if func_info['provider'] == service_models[name]['provider']:
                             args = (service_models[name]['model'], *args[1:])
-                            return await func_info['implementation'](*args, **kwargs)
+                            return await self._invoke(name, func_info, args, kwargs)
             else:
                 # NEW V2 PREFERENCES LOGIC - Only as fallback when no agent-specific model
                 if ModelPreferencesV2 is not None:
@@ -142,23 +345,26 @@ class ProviderManager:
                             self._prefs_manager = ModelPreferencesV2()
                         prefs_manager = self._prefs_manager
                         ordered_providers = prefs_manager.get_ordered_providers_for_service(name)
-                        
-                        if ordered_providers:
-                            for provider_name, model_name in ordered_providers:
-                                # Check if this provider is available for this function
-                                if name in self.functions:
-                                    for func_info in self.functions[name]:
-                                        if func_info['provider'] == provider_name:
-                                            try:
-                                                # Set the model as first argument if needed
-                                                if len(args) > 0 and (args[0] is None or not args[0]):
-                                                    args = (model_name, *args[1:])
-                                                elif 'model' not in kwargs:
-                                                    kwargs['model'] = model_name
-                                                
-                                                return await func_info['implementation'](*args, **kwargs)
-                                            except Exception as e:
-                                                continue
+                        # (func_info, model) for each preferred provider that implements this function
+                        candidates = []
+                        for provider_name, model_name in ordered_providers:
+                            for func_info in self.functions[name]:
+                                if func_info['provider'] == provider_name:
+                                    candidates.append((func_info, model_name))
+                                    break
+
+                        def invoke(func_info, model_name):
+                            # Set the model as first argument if needed
+                            if len(args) > 0 and (args[0] is None or not args[0]):
+                                return self._invoke(name, func_info, (model_name, *args[1:]), kwargs)
+                            if kwargs.get('model') is None:
+                                return self._invoke(name, func_info, args, {**kwargs, 'model': model_name})
+                            return self._invoke(name, func_info, args, kwargs)
+
+                        if candidates:
+                            # Breakers, first-token deadline and hedging: see failover.py
+                            return await call_with_failover(name, candidates, invoke,
+                                                            streaming=name.startswith('stream'))
                     except Exception as e:
                         pass  # Continue with existing logic
         else:
@@ -177,98 +383,17 @@ class ProviderManager:
                         if model_name in model_list:
                             for func_info in self.functions[name]:
                                 if func_info['provider'] == provider:
-                                    return await func_info['implementation'](*args, **kwargs)
+                                    return await self._invoke(name, func_info, args, kwargs)
                 except Exception as e:
                     pass
 
-        required_plugins = []
-        if context and hasattr(context, 'agent') and context.agent:
-            required_plugins = context.agent.get('required_plugins', [])
-        if required_plugins and name in self.functions:
-            for plugin in required_plugins:
-                for func_info in self.functions[name]:
-                    if func_info['provider'] == plugin:
-                        function_info = func_info
-                        return await function_info['implementation'](*args, **kwargs)
-
-        preferred_providers_list = []
-        if context is not None and hasattr(context, 'agent') and context.agent:
-            preferred_providers = context.agent.get('preferred_providers', [])
-            if isinstance(preferred_providers, list):
-                preferred_providers_list = preferred_providers
-            elif isinstance(preferred_providers, dict):
-                if name in preferred_providers:
-                    preferred_provider = preferred_providers[name]
-                    for func_info in self.functions[name]:
-                        if func_info['provider'] == preferred_provider:
-                            function_info = func_info
-                            return await function_info['implementation'](*args, **kwargs)
         if name == 'stream_chat' and context is None:
             raise ValueError('stream_chat, context is None')
         if name == 'stream_chat' and context.agent is None:
             raise ValueError('stream_chat, context.agent is None')
 
-        if context is not None and hasattr(context, 'data') and 'PREFERRED_PROVIDER' in context.data:
-            preferred_providers_list = [ context.data['PREFERRED_PROVIDER'] ]
-
-        if preferred_providers_list and name in self.functions:
-            for func_info in self.functions[name]:
-                if func_info['provider'] in preferred_providers_list:
-                    return await func_info['implementation'](*args, **kwargs)
-
-        if preferred_providers and name in preferred_providers:
-            preferred_provider = preferred_providers[name]
-            for func_info in self.functions[name]:
-                if func_info['provider'] == preferred_provider:
-                    function_info = func_info
-                    return await function_info['implementation'](*args, **kwargs)
-
-        if context.__class__.__name__ == 'ChatContext':
-            preferred_models = await find_preferred_models(name, context.flags)
-            context.data['model'] = None
-            if need_model and preferred_models is None:
-                preferred_models = await matching_models(name, context.flags)
-            if preferred_models is not None:
-                if len(preferred_models) > 0:
-                    context.data['model'] = preferred_models[0]
-
-        if preferred_models is not None:
-            if len(preferred_models) > 0:
-                try:
-                    preferred_provider = preferred_models[0]['provider']
-                except KeyError:
-                    preferred_provider = None
-        function_info = None
-        if not need_model and preferred_provider is None:
-            preferred_provider = self.functions[name][0]['provider']
-        if preferred_provider is not None:
-            for func_info in self.functions[name]:
-                if func_info['provider'] == preferred_provider:
-                    function_info = func_info
-                    break
-            if function_info is None:
-                # No implementation from the preferred provider: fall back to the
-                # first registered one. (Previously this assignment was
-                # unconditional, which silently DISCARDED the matched provider and
-                # always used registration order. That is how e.g. a pasted image
-                # could be formatted by mr_gemini's format_image_message while
-                # stream_chat ran on ah_anthropic, producing an OpenAI-style
-                # 'image_url' block that Anthropic rejects with a 400.)
-                function_info = self.functions[name][0]
-
-        if function_info is None:
-            raise ValueError(f"1. function '{name}' not found. preferred_provider is '{preferred_provider}'.")
-
-        implementation = function_info['implementation']
-        if implementation is None:
-            raise ValueError(f"2. function '{name}' not found. preferred_provider is '{preferred_provider}'.")
-
-        try:
-            result = await implementation(*args, **kwargs)
-        except Exception as e:
-            raise e
-
-        return result
+        function_info = await self._resolve_cached(name, context)
+        return await self._invoke(name, function_info, args, kwargs)
 
     def get_docstring(self, name):
         if name not in self.functions:
@@ -350,7 +475,48 @@ class ProviderManager:
             return {}
         return list_protocols()
 
+HOOK_MODES = ('sequential', 'concurrent', 'background')
+
+# Execution policies for core hooks; plugins can override them with
+# @hook(mode=..., timeout=..., propagate=...) or hook_manager.set_policy().
+# handle_usage stays sequential: credits raises InsufficientCreditsError from
+# it to stop the request, which must reach the caller.
+DEFAULT_HOOK_POLICIES = {
+    'message_added': {'mode': 'background'},
+    'add_instructions': {'mode': 'concurrent'},
+}
+
+def _hook_queue_size():
+    try:
+        return max(1, int(os.environ.get('MR_HOOK_QUEUE_SIZE', '1000')))
+    except ValueError:
+        return 1000
+
+def _hook_workers():
+    try:
+        return max(1, int(os.environ.get('MR_HOOK_WORKERS', '4')))
+    except ValueError:
+        return 4
+
 class HookManager:
+    """Registry and dispatcher for @hook implementations.
+
+    Each hook name has an execution policy:
+
+      sequential  await implementations one after another (the default); an
+                  exception stops the hook and propagates to the caller
+      concurrent  run all implementations with asyncio.gather; results keep
+                  registration order, and failing or timed-out
+                  implementations are logged and left out, except for
+                  exceptions of the policy's propagate types, which are
+                  raised to the caller (once every implementation is done)
+      background  queue the implementations for a bounded pool of workers
+                  (MR_HOOK_WORKERS, MR_HOOK_QUEUE_SIZE) and return [] at once;
+                  when the queue is full the call is dropped with a warning
+
+    A timeout (seconds) can be set per hook or per implementation. A timed-out
+    implementation is cancelled.
+    """
     _instance = None
     _initialized = False
     _hook_manager = None
@@ -365,20 +531,138 @@ class HookManager:
         if not self._initialized:
             self.unique_id = nanoid.generate()
             self.hooks = {}
+            self.policies = {name: dict(policy) for name, policy in DEFAULT_HOOK_POLICIES.items()}
+            self._queue = None
+            self._queue_loop = None
+            self._workers = []
+            self.dropped = 0
             self.__class__._initialized = True
 
-    def register_hook(self, name, implementation, signature, docstring):
+    def register_hook(self, name, implementation, signature, docstring, mode=None, timeout=None, propagate=None):
         if name not in self.hooks:
             self.hooks[name] = []
-        self.hooks[name].append({'implementation': implementation, 'docstring': docstring})
+        self.hooks[name].append({'implementation': implementation, 'docstring': docstring, 'timeout': timeout,
+                                 'provider': getattr(implementation, '__module__', None) or 'unknown'})
+        if mode is not None or propagate is not None:
+            self.set_policy(name, mode=mode, propagate=propagate)
+
+    def set_policy(self, name, mode=None, timeout=None, propagate=None):
+        """Set the execution mode, default timeout and/or the exception types
+        a concurrent hook re-raises (propagate, a type or tuple of types)."""
+        if mode is not None and mode not in HOOK_MODES:
+            raise ValueError(f"hook mode must be one of {HOOK_MODES}, got '{mode}'")
+        policy = self.policies.setdefault(name, {})
+        if mode is not None:
+            policy['mode'] = mode
+        if timeout is not None:
+            policy['timeout'] = timeout
+        if propagate is not None:
+            propagate = propagate if isinstance(propagate, tuple) else (propagate,)
+            policy['propagate'] = tuple(set(policy.get('propagate', ())) | set(propagate))
+
+    def get_policy(self, name):
+        policy = self.policies.get(name, {})
+        return {'mode': policy.get('mode', 'sequential'), 'timeout': policy.get('timeout'),
+                'propagate': policy.get('propagate', ())}
+
+    async def _run_one(self, name, hook_info, timeout, args, kwargs):
+        timeout = hook_info.get('timeout') or timeout
+        start = time.perf_counter()
+        try:
+            coro = hook_info['implementation'](*args, **kwargs)
+            if timeout:
+                result = await asyncio.wait_for(coro, timeout)
+            else:
+                result = await coro
+        except BaseException:
+            metrics.observe('hook', name, hook_info['provider'], time.perf_counter() - start, error=True)
+            raise
+        metrics.observe('hook', name, hook_info['provider'], time.perf_counter() - start)
+        return result
+
+    async def _run_isolated(self, name, hook_info, timeout, args, kwargs, propagate=()):
+        """(ok, result) -- exceptions and timeouts are logged, not raised,
+        except for instances of the propagate types."""
+        try:
+            return True, await self._run_one(name, hook_info, timeout, args, kwargs)
+        except asyncio.CancelledError:
+            raise
+        except propagate:
+            raise
+        except asyncio.TimeoutError:
+            logging.warning(f"hook '{name}' implementation {hook_info['implementation'].__module__} timed out")
+        except Exception as e:
+            logging.error(f"hook '{name}' implementation {hook_info['implementation'].__module__} failed: {e}\n{traceback.format_exc()}")
+        return False, None
+
+    def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        if self._queue is not None and self._queue_loop is loop:
+            return
+        self._queue = asyncio.Queue(maxsize=_hook_queue_size())
+        self._queue_loop = loop
+        self._workers = [loop.create_task(self._worker()) for _ in range(_hook_workers())]
+
+    async def _worker(self):
+        queue = self._queue
+        while True:
+            name, hook_info, timeout, args, kwargs = await queue.get()
+            try:
+                await self._run_isolated(name, hook_info, timeout, args, kwargs)
+            finally:
+                queue.task_done()
+
+    def _enqueue(self, name, timeout, args, kwargs):
+        self._ensure_workers()
+        for hook_info in self.hooks.get(name, []):
+            try:
+                self._queue.put_nowait((name, hook_info, timeout, args, kwargs))
+            except asyncio.QueueFull:
+                self.dropped += 1
+                logging.warning(f"hook queue full, dropping background call to '{name}'")
+
+    def fire(self, name, *args, **kwargs):
+        """Start a hook without waiting for it (from sync or async code running
+        on the event loop). Background hooks are queued; others run in a task."""
+        if name not in self.hooks:
+            return
+        policy = self.get_policy(name)
+        if policy['mode'] == 'background':
+            self._enqueue(name, policy['timeout'], args, kwargs)
+        else:
+            asyncio.get_running_loop().create_task(self.execute_hooks(name, *args, **kwargs))
+
+    def queue_stats(self):
+        return {'depth': self._queue.qsize() if self._queue is not None else 0, 'dropped': self.dropped}
+
+    async def drain(self, timeout=None):
+        """Wait for queued background hook calls to finish (e.g. on shutdown)."""
+        if self._queue is None or self._queue_loop is not asyncio.get_running_loop():
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"{self._queue.qsize()} background hook calls still queued")
 
     async def execute_hooks(self, name, *args, **kwargs):
         if name not in self.hooks:
             return []
+        policy = self.get_policy(name)
+        mode = policy['mode']
+        timeout = policy['timeout']
+        if mode == 'background':
+            self._enqueue(name, timeout, args, kwargs)
+            return []
+        if mode == 'concurrent':
+            outcomes = await asyncio.gather(*[self._run_isolated(name, hook_info, timeout, args, kwargs, policy['propagate'])
+                                              for hook_info in self.hooks[name]], return_exceptions=True)
+            for outcome in outcomes:
+                if isinstance(outcome, BaseException):
+                    raise outcome
+            return [result for ok, result in outcomes if ok]
         results = []
         for hook_info in self.hooks[name]:
-            implementation = hook_info['implementation']
-            result = await implementation(*args, **kwargs)
+            result = await self._run_one(name, hook_info, timeout, args, kwargs)
             results.append(result)
         return results
 
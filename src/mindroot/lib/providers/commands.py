@@ -3,7 +3,7 @@ import os
 from . import ProviderManager
 from mindroot.lib.utils.debug import debug_box
 
-command_manager = ProviderManager()
+command_manager = ProviderManager(kind='command')
 
 def command(*, flags=[]):
     def decorator(func):
@@ -0,0 +1,184 @@
+"""Provider failover for the V2 model preference path of ProviderManager.execute.
+
+Each preferred (provider, model) pair for a service is tried in order, with:
+
+- Circuit breakers per provider. After MR_CIRCUIT_FAILURES consecutive
+  failures (default 3) a provider is skipped for the ExponentialBackoff wait
+  time (MR_CIRCUIT_INITIAL_DELAY, default 5s, doubling up to
+  MR_CIRCUIT_MAX_DELAY, default 300s). After that a call is let through
+  again as a probe. If every candidate is open they are all tried anyway.
+- A time-to-first-token deadline for streaming services (names starting
+  with 'stream', e.g. stream_chat): the call plus the first chunk must
+  arrive within MR_STREAM_TTFT_TIMEOUT seconds (default 120, 0 = none), or
+  the next provider is tried.
+- Optional hedging (MR_HEDGE_AFTER seconds, default 0 = off): if the
+  current attempt has not produced its first chunk in time, the next
+  candidate is started too; the first to produce a chunk wins and the
+  other is cancelled.
+
+The first chunk is read ahead and handed back in front of the rest of the
+stream, so callers see the normal stream.
+"""
+import os
+import time
+import asyncio
+import logging
+from ..utils.backoff import ExponentialBackoff
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+class CircuitBreaker:
+    """Open/closed state per provider on top of ExponentialBackoff."""
+
+    def __init__(self, threshold=None, initial_delay=None, max_delay=None):
+        self.threshold = int(threshold or _env_float('MR_CIRCUIT_FAILURES', 3))
+        self.backoff = ExponentialBackoff(initial_delay=initial_delay or _env_float('MR_CIRCUIT_INITIAL_DELAY', 5),
+                                          max_delay=max_delay or _env_float('MR_CIRCUIT_MAX_DELAY', 300))
+        self._open_until = {}
+
+    def allow(self, identifier) -> bool:
+        return time.monotonic() >= self._open_until.get(identifier, 0.0)
+
+    def record_failure(self, identifier) -> None:
+        self.backoff.record_failure(identifier)
+        attempts = self.backoff.get_attempts(identifier)
+        if attempts >= self.threshold:
+            wait = self.backoff.get_wait_time(identifier)
+            self._open_until[identifier] = time.monotonic() + wait
+            logging.warning(f"circuit open for provider '{identifier}' for {wait:.1f}s after {attempts} failures")
+
+    def record_success(self, identifier) -> None:
+        # A success closes the circuit and resets the count: the threshold is
+        # for consecutive failures.
+        self.backoff.reset(identifier)
+        self._open_until.pop(identifier, None)
+
+    def state(self) -> dict:
+        now = time.monotonic()
+        return {identifier: round(until - now, 1) for identifier, until in self._open_until.items() if until > now}
+
+
+breakers = CircuitBreaker()
+
+_EMPTY = object()
+
+
+class PrefetchedStream:
+    """Async iterator that yields an already-read first chunk, then the rest."""
+
+    def __init__(self, first, stream):
+        self._first = first
+        self._stream = stream
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._first is not _EMPTY:
+            first, self._first = self._first, _EMPTY
+            return first
+        if self._stream is None:
+            raise StopAsyncIteration
+        return await self._stream.__anext__()
+
+    async def aclose(self):
+        if self._stream is not None:
+            await _aclose(self._stream)
+
+
+async def _aclose(stream):
+    close = getattr(stream, 'aclose', None)
+    if close is not None:
+        try:
+            await close()
+        except Exception:
+            pass
+
+
+async def _attempt(invoke, candidate):
+    """Run one candidate; for streams, wait for the first chunk as well."""
+    result = await invoke(*candidate)
+    if not hasattr(result, '__anext__'):
+        return result
+    try:
+        first = await result.__anext__()
+    except StopAsyncIteration:
+        return PrefetchedStream(_EMPTY, None)
+    except BaseException:
+        await _aclose(result)
+        raise
+    return PrefetchedStream(first, result)
+
+
+async def _discard(task):
+    task.cancel()
+    try:
+        result = await task
+    except BaseException:
+        return
+    await _aclose(result)
+
+
+async def call_with_failover(name, candidates, invoke, streaming=True):
+    """Try candidates ((func_info, model_name) pairs, in preference order)
+    with breakers, TTFT deadline and hedging. invoke(func_info, model_name)
+    returns the implementation's awaitable. Raises the last error if every
+    candidate fails."""
+    ttft = _env_float('MR_STREAM_TTFT_TIMEOUT', 120) if streaming else 0
+    hedge_after = _env_float('MR_HEDGE_AFTER', 0) if streaming else 0
+    allowed = [c for c in candidates if breakers.allow(c[0]['provider'])]
+    queue = list(allowed or candidates)
+    running = {}
+    last_error = None
+
+    def start_next():
+        func_info, model_name = queue.pop(0)
+        coro = _attempt(invoke, (func_info, model_name))
+        if ttft:
+            coro = asyncio.wait_for(coro, ttft)
+        task = asyncio.ensure_future(coro)
+        running[task] = (func_info['provider'], model_name)
+
+    try:
+        while queue or running:
+            if not running:
+                start_next()
+            timeout = hedge_after if hedge_after and queue else None
+            done, _ = await asyncio.wait(list(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                provider, model_name = next(iter(running.values()))
+                logging.info(f"{name}: no first token from {provider}/{model_name} after {hedge_after}s, hedging")
+                start_next()
+                continue
+            winner = None
+            for task in done:
+                provider, model_name = running.pop(task)
+                try:
+                    result = task.result()
+                except asyncio.TimeoutError:
+                    last_error = TimeoutError(f"{provider}/{model_name}: no first token within {ttft}s")
+                    logging.warning(f"{name}: {last_error}")
+                    breakers.record_failure(provider)
+                    continue
+                except Exception as e:
+                    last_error = e
+                    logging.warning(f"{name}: provider {provider}/{model_name} failed: {e}")
+                    breakers.record_failure(provider)
+                    continue
+                if winner is None:
+                    breakers.record_success(provider)
+                    winner = result
+                else:
+                    await _aclose(result)
+            if winner is not None:
+                return winner
+        raise last_error or ValueError(f"no provider available for '{name}'")
+    finally:
+        for task in list(running):
+            await _discard(task)
@@ -1,13 +1,22 @@
 import inspect
 from . import HookManager
+from mindroot.lib.metrics import metrics
 hook_manager = HookManager()
+metrics.register_gauges('hook_queue', hook_manager.queue_stats)
 
-def hook():
+def hook(mode=None, timeout=None, propagate=None):
+    """Register a hook implementation.
+
+    mode: 'sequential', 'concurrent' or 'background' -- sets the execution
+    policy for the whole hook (see HookManager). timeout: seconds this
+    implementation may run before it is cancelled. propagate: exception
+    type(s) a concurrent hook raises to its caller instead of logging.
+    """
 
     def decorator(func):
         docstring = func.__doc__
         name = func.__name__
         signature = inspect.signature(func)
-        hook_manager.register_hook(name, func, signature, docstring)
+        hook_manager.register_hook(name, func, signature, docstring, mode=mode, timeout=timeout, propagate=propagate)
         return func
     return decorator
\ No newline at end of file
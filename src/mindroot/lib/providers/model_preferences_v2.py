@@ -1,11 +1,37 @@
 import json
 import os
+import copy
 import shutil
+import threading
 from typing import Dict, List, Tuple, Optional
 from pathlib import Path
 
+# Preferences held in memory, shared by all instances: file path ->
+# (file signature, preferences, {service: ((provider, model), ...)}).
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _file_signature(path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _ordered_pairs(pairs) -> Tuple[Tuple[str, str], ...]:
+    try:
+        return tuple((provider, model) for provider, model in pairs)
+    except (TypeError, ValueError):
+        return ()
+
 class ModelPreferencesV2:
-    """New model preferences system supporting ordered provider/model pairs for fallback selection."""
+    """New model preferences system supporting ordered provider/model pairs for fallback selection.
+
+    Preferences are kept in memory and written through to
+    data/preferred_models_v2.json. Edits made to the file by other processes
+    are picked up by comparing its mtime and size, so lookups on the LLM call
+    path do not read the file.
+    """
 
     def __init__(self):
         self.data_dir = Path.cwd() / 'data'
@@ -23,14 +49,35 @@ class ModelPreferencesV2:
                 default_prefs = {'stream_chat': [['ah_openrouter', 'deepseek/deepseek-chat-v3.1'], ['ah_anthropic', 'claude-sonnet-4-0'], ['mr_gemini', 'models/gemini-2.5-pro'], ['ah_openai', 'gpt-5']], 'text_to_image': [['ah_flux', 'flux-dev']]}
                 self.save_preferences(default_prefs)
 
-    def get_preferences(self) -> Dict[str, List[List[str]]]:
-        """Get preferences in new format: {service: [[provider, model], ...]}"""
-        self.ensure_preferences_exist()
+    def _store(self, signature, preferences: Dict) -> tuple:
+        ordered = {service: _ordered_pairs(pairs) for service, pairs in preferences.items()}
+        entry = (signature, preferences, ordered)
+        with _cache_lock:
+            _cache[str(self.preferences_file)] = entry
+        return entry
+
+    def _load(self) -> tuple:
+        """Cached (signature, preferences, ordered) entry, re-read from disk
+        only if the file changed or is not cached yet."""
+        signature = _file_signature(self.preferences_file)
+        entry = _cache.get(str(self.preferences_file))
+        if entry is not None and signature is not None and entry[0] == signature:
+            return entry
+        if signature is None:
+            self.ensure_preferences_exist()
+            signature = _file_signature(self.preferences_file)
         try:
             with open(self.preferences_file, 'r') as f:
-                return json.load(f)
+                preferences = json.load(f)
         except (FileNotFoundError, json.JSONDecodeError) as e:
-            return {}
+            preferences = {}
+        if not isinstance(preferences, dict):
+            preferences = {}
+        return self._store(signature, preferences)
+
+    def get_preferences(self) -> Dict[str, List[List[str]]]:
+        """Get preferences in new format: {service: [[provider, model], ...]}"""
+        return copy.deepcopy(self._load()[1])
 
     def save_preferences(self, preferences: Dict[str, List[List[str]]]) -> None:
         """Save preferences in new format."""
@@ -40,13 +87,11 @@ class ModelPreferencesV2:
                 json.dump(preferences, f, indent=2)
         except Exception as e:
             raise
+        self._store(_file_signature(self.preferences_file), copy.deepcopy(preferences))
 
-    def get_ordered_providers_for_service(self, service_name: str) -> List[Tuple[str, str]]:
-        """Get ordered list of (provider, model) pairs for a service."""
-        preferences = self.get_preferences()
-        if service_name not in preferences:
-            return []
-        return [(provider, model) for provider, model in preferences[service_name]]
+    def get_ordered_providers_for_service(self, service_name: str) -> Tuple[Tuple[str, str], ...]:
+        """Get ordered (provider, model) pairs for a service."""
+        return self._load()[2].get(service_name, ())
 
     def migrate_from_old_format(self, old_preferences: List[Dict]) -> Dict[str, List[List[str]]]:
         """Convert old format preferences to new format.
@@ -0,0 +1,159 @@
+"""Result memoization for services: @service(cache=...).
+
+    @service(cache=True)                    # defaults below
+    @service(cache={'ttl': 60, 'maxsize': 500, 'stamp': agent_file_stamp})
+    @service(cache=ServiceCache(ttl=30, copy=True))
+
+Results are cached per call arguments (the context argument is ignored, so
+only use this for services whose result does not depend on the context)
+with LRU eviction (maxsize) and a time to live in seconds (ttl, default
+MR_SERVICE_CACHE_TTL or 300; None = no expiry). Calls with unhashable
+arguments are not cached.
+
+Options:
+    stamp       stamp(*args, **kwargs) -> hashable, e.g. the mtime of the
+                file the result was read from. Evaluated on every hit; a
+                cached result is only used while the stamp is unchanged, so
+                files edited by other code paths are picked up at the cost
+                of a stat().
+    copy        return a deep copy on every call, for results callers modify.
+    cache_falsy cache None / empty results too (default True).
+
+Concurrent misses for the same key share one call (single-flight; see
+lib/utils/single_flight).
+Invalidate with service_manager.invalidate_cache(name, *args, **kwargs), or
+func.cache.invalidate(...) / func.cache.clear() on the decorated function.
+"""
+import os
+import copy
+import time
+import inspect
+import functools
+from collections import OrderedDict
+from ..utils.single_flight import SingleFlight
+
+_DEFAULT_TTL = object()
+
+
+def _default_ttl():
+    try:
+        return float(os.environ.get('MR_SERVICE_CACHE_TTL', '300'))
+    except ValueError:
+        return 300.0
+
+
+def file_stamp(path):
+    """(mtime, size) of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ServiceCache:
+
+    def __init__(self, ttl=_DEFAULT_TTL, maxsize=256, stamp=None, copy=False, cache_falsy=True):
+        self.ttl = _default_ttl() if ttl is _DEFAULT_TTL else ttl
+        self.maxsize = maxsize
+        self.stamp = stamp
+        self.copy = copy
+        self.cache_falsy = cache_falsy
+        self.name = None
+        self._entries = OrderedDict()
+        self._loading = SingleFlight()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_option(cls, option):
+        """Build from the @service(cache=...) argument."""
+        if isinstance(option, ServiceCache):
+            return option
+        if option is True:
+            return cls()
+        if isinstance(option, dict):
+            return cls(**option)
+        raise ValueError(f"invalid service cache option: {option!r}")
+
+    @staticmethod
+    def make_key(args, kwargs):
+        return (args, tuple(sorted((k, v) for k, v in kwargs.items() if k != 'context')))
+
+    def _output(self, value):
+        return copy.deepcopy(value) if self.copy else value
+
+    def invalidate(self, *args, **kwargs):
+        """Drop the cached result for these arguments (all results if none)."""
+        self._generation += 1
+        if not args and not kwargs:
+            self._entries.clear()
+            return
+        try:
+            self._entries.pop(self.make_key(args, kwargs), None)
+        except TypeError:
+            pass
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    async def call(self, func, args, kwargs):
+        key = self.make_key(args, kwargs)
+        try:
+            hash(key)
+        except TypeError:
+            return await func(*args, **kwargs)
+        stamp = self.stamp(*args, **{k: v for k, v in kwargs.items() if k != 'context'}) if self.stamp else None
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires, entry_stamp = entry
+            if (expires is None or time.monotonic() < expires) and entry_stamp == stamp:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._output(value)
+            del self._entries[key]
+        if key in self._loading:
+            self.hits += 1
+        else:
+            self.misses += 1
+        generation = self._generation
+
+        async def load():
+            value = await func(*args, **kwargs)
+            # Skip storing if the cache was invalidated while loading: the
+            # value may predate the change.
+            if generation == self._generation and (value or self.cache_falsy):
+                expires = time.monotonic() + self.ttl if self.ttl else None
+                self._entries[key] = (value, expires, stamp)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            return value
+        value = await self._loading.do(key, load)
+        return self._output(value)
+
+
+def cached(option=True):
+    """Memoize an async function (the decorator behind @service(cache=...);
+    also usable on plain helpers)."""
+    cache = ServiceCache.from_option(option)
+
+    def decorator(func):
+        params = list(inspect.signature(func).parameters)
+        # A context passed positionally is moved to kwargs, so that it is
+        # left out of the key and the stamp call like a keyword one.
+        context_index = params.index('context') if 'context' in params else None
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if context_index is not None and len(args) == context_index + 1:
+                kwargs = dict(kwargs, context=args[context_index])
+                args = args[:context_index]
+            return await cache.call(func, args, kwargs)
+        cache.name = func.__name__
+        wrapper.cache = cache
+        return wrapper
+    return decorator
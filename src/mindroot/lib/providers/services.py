@@ -3,6 +3,8 @@ import sys
 import inspect
 from typing import Type, TypeVar, get_type_hints
 from . import ProviderManager
+from .service_cache import ServiceCache, cached
+from mindroot.lib.metrics import metrics
 
 # Ensure singleton across different import paths (lib.providers vs mindroot.lib.providers)
 _SINGLETON_KEY = 'mindroot.lib.providers.services._service_manager'
@@ -17,7 +19,9 @@ else:
 
 P = TypeVar('P')  # Protocol type variable
 
-def service(*, flags=[]):
+def service(*, flags=[], cache=None):
+    """Register a service. cache=True / dict / ServiceCache memoizes results
+    per arguments (see service_cache)."""
     def decorator(func):
         docstring = func.__doc__
         name = func.__name__
@@ -27,6 +31,9 @@ def service(*, flags=[]):
             raise ValueError("Cannot determine module of function")
 
         module_name = os.path.basename(os.path.dirname(module.__file__))
+        if cache:
+            func = cached(cache)(func)
+            metrics.register_gauges(f'service_cache_{name}', func.cache.stats)
         service_manager.register_function(name, module_name, func, signature, docstring, flags)
         return func
     return decorator
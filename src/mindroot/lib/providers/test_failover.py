@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Tests for the provider circuit breaker.
+
+Run from src/mindroot:
+    python lib/providers/test_failover.py
+"""
+import os
+import sys
+import logging
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from lib.providers.failover import CircuitBreaker
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(threshold=3, initial_delay=60, max_delay=60)
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_opens_after_threshold(self):
+        for _ in range(2):
+            self.breaker.record_failure('p')
+        self.assertTrue(self.breaker.allow('p'))
+        self.breaker.record_failure('p')
+        self.assertFalse(self.breaker.allow('p'))
+        self.assertIn('p', self.breaker.state())
+        self.assertTrue(self.breaker.allow('other'))
+
+    def test_success_closes_and_resets_count(self):
+        for _ in range(3):
+            self.breaker.record_failure('p')
+        self.breaker.record_success('p')
+        self.assertTrue(self.breaker.allow('p'))
+        # Failures are counted from zero again.
+        for _ in range(2):
+            self.breaker.record_failure('p')
+        self.assertTrue(self.breaker.allow('p'))
+        self.assertEqual(self.breaker.state(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
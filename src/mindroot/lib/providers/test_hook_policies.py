@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Tests for hook execution policies (HookManager).
+
+Run from src/mindroot:
+    python lib/providers/test_hook_policies.py
+"""
+import os
+import sys
+import asyncio
+import inspect
+import logging
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from lib.providers import HookManager
+
+
+class InsufficientCredits(Exception):
+    pass
+
+
+def _register(manager, name, func, **kwargs):
+    manager.register_hook(name, func, inspect.signature(func), func.__doc__, **kwargs)
+
+
+class TestHookPolicies(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.manager = HookManager()
+        self.names = []
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        for name in self.names:
+            self.manager.hooks.pop(name, None)
+            self.manager.policies.pop(name, None)
+
+    def hook_name(self, suffix):
+        name = f"test_hook_{suffix}"
+        self.names.append(name)
+        return name
+
+    def test_handle_usage_is_sequential(self):
+        self.assertEqual(self.manager.get_policy('handle_usage')['mode'], 'sequential')
+
+    async def test_sequential_raises(self):
+        name = self.hook_name('sequential')
+
+        async def charge():
+            raise InsufficientCredits()
+        _register(self.manager, name, charge)
+        with self.assertRaises(InsufficientCredits):
+            await self.manager.execute_hooks(name)
+
+    async def test_concurrent_skips_failures_in_order(self):
+        name = self.hook_name('concurrent')
+
+        async def slow():
+            await asyncio.sleep(0.02)
+            return 'slow'
+
+        async def broken():
+            raise ValueError('broken')
+
+        async def fast():
+            return 'fast'
+        for func in (slow, broken, fast):
+            _register(self.manager, name, func, mode='concurrent')
+        self.assertEqual(await self.manager.execute_hooks(name), ['slow', 'fast'])
+
+    async def test_concurrent_timeout(self):
+        name = self.hook_name('timeout')
+
+        async def hangs():
+            await asyncio.sleep(10)
+
+        async def quick():
+            return 1
+        _register(self.manager, name, hangs, mode='concurrent', timeout=0.01)
+        _register(self.manager, name, quick)
+        self.assertEqual(await self.manager.execute_hooks(name), [1])
+
+    async def test_concurrent_propagate(self):
+        name = self.hook_name('propagate')
+        finished = []
+
+        async def charge():
+            raise InsufficientCredits()
+
+        async def other():
+            await asyncio.sleep(0.01)
+            finished.append(True)
+        _register(self.manager, name, charge, mode='concurrent', propagate=InsufficientCredits)
+        _register(self.manager, name, other)
+        with self.assertRaises(InsufficientCredits):
+            await self.manager.execute_hooks(name)
+        # The other implementations still ran to completion.
+        self.assertEqual(finished, [True])
+
+    async def test_background_returns_immediately(self):
+        name = self.hook_name('background')
+        seen = []
+
+        async def record(value):
+            seen.append(value)
+        _register(self.manager, name, record, mode='background')
+        self.assertEqual(await self.manager.execute_hooks(name, 1), [])
+        self.assertEqual(seen, [])
+        await self.manager.drain(timeout=1)
+        self.assertEqual(seen, [1])
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            self.manager.set_policy(self.hook_name('invalid'), mode='parallel')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Tests for service result caching (@service(cache=...) / cached()).
+
+Run from src/mindroot:
+    python lib/providers/test_service_cache.py
+"""
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from lib.providers.service_cache import ServiceCache, cached
+
+
+class TestServiceCache(unittest.IsolatedAsyncioTestCase):
+
+    async def test_hit_and_miss(self):
+        calls = []
+
+        @cached({'ttl': None})
+        async def load(name, context=None):
+            calls.append(name)
+            return {'name': name}
+        self.assertEqual(await load('a'), {'name': 'a'})
+        self.assertEqual(await load('a'), {'name': 'a'})
+        self.assertEqual(await load('b'), {'name': 'b'})
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertEqual(load.cache.stats(), {'size': 2, 'hits': 1, 'misses': 2})
+
+    async def test_context_is_not_part_of_the_key(self):
+        stamps = []
+
+        def stamp(name):
+            stamps.append(name)
+            return 1
+
+        @cached({'stamp': stamp})
+        async def load(name, context=None):
+            return name
+        await load('a', object())
+        await load('a', object())
+        await load('a', context=object())
+        self.assertEqual(load.cache.stats()['misses'], 1)
+        self.assertEqual(stamps, ['a', 'a', 'a'])
+
+    async def test_stamp_change_reloads(self):
+        version = [1]
+
+        @cached({'stamp': lambda name: version[0]})
+        async def load(name):
+            return version[0]
+        self.assertEqual(await load('a'), 1)
+        version[0] = 2
+        self.assertEqual(await load('a'), 2)
+
+    async def test_ttl_expiry(self):
+        calls = []
+
+        @cached({'ttl': 0.01})
+        async def load(name):
+            calls.append(name)
+            return name
+        await load('a')
+        await asyncio.sleep(0.02)
+        await load('a')
+        self.assertEqual(len(calls), 2)
+
+    async def test_maxsize(self):
+        @cached({'maxsize': 2})
+        async def load(name):
+            return name
+        for name in 'abc':
+            await load(name)
+        self.assertEqual(load.cache.stats()['size'], 2)
+
+    async def test_copy(self):
+        @cached({'copy': True})
+        async def load(name):
+            return {'items': []}
+        (await load('a'))['items'].append(1)
+        self.assertEqual(await load('a'), {'items': []})
+
+    async def test_falsy_not_cached(self):
+        calls = []
+
+        @cached({'cache_falsy': False})
+        async def load(name):
+            calls.append(name)
+            return None
+        await load('a')
+        await load('a')
+        self.assertEqual(len(calls), 2)
+
+    async def test_invalidate_during_load_is_not_stored(self):
+        @cached(True)
+        async def load(name):
+            await asyncio.sleep(0.01)
+            return name
+        task = asyncio.create_task(load('a'))
+        await asyncio.sleep(0)
+        load.cache.invalidate('a')
+        await task
+        self.assertEqual(load.cache.stats()['size'], 0)
+
+    async def test_concurrent_misses_share_one_call(self):
+        calls = []
+
+        @cached(True)
+        async def load(name):
+            calls.append(name)
+            await asyncio.sleep(0.01)
+            return name
+        self.assertEqual(await asyncio.gather(load('a'), load('a'), load('a')), ['a'] * 3)
+        self.assertEqual(calls, ['a'])
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        calls = []
+
+        @cached(True)
+        async def load(name):
+            calls.append(name)
+            await asyncio.sleep(0.03)
+            return name
+        first = asyncio.create_task(load('a'))
+        await asyncio.sleep(0.005)
+        second = asyncio.create_task(load('a'))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        self.assertEqual(await second, 'a')
+        self.assertEqual(len(calls), 2)
+        # The retried load was stored.
+        self.assertEqual(await load('a'), 'a')
+        self.assertEqual(len(calls), 2)
+
+    def test_invalid_option(self):
+        with self.assertRaises(ValueError):
+            ServiceCache.from_option('yes')
+
+
+if __name__ == '__main__':
+    unittest.main()
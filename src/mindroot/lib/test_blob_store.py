@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Tests for the chat history blob store.
+
+Run from src/mindroot:
+    python lib/test_blob_store.py
+"""
+import os
+import sys
+import base64
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import blob_store
+
+
+def _image_message(data):
+    url = 'data:image/png;base64,' + base64.b64encode(data).decode('ascii')
+    return {'role': 'user', 'content': [{'type': 'text', 'text': 'look'},
+                                        {'type': 'image_url', 'image_url': {'url': url}}]}
+
+
+class TestBlobStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {'MR_BLOB_DIR': self.tmp.name, 'MR_BLOB_MIN_CHARS': '16'})
+        self.env.start()
+        blob_store._get_base64.cache_clear()
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    async def test_round_trip_off_the_event_loop(self):
+        message = _image_message(os.urandom(256))
+        stored = blob_store.externalize_message(message)
+        self.assertTrue(blob_store.is_blob_ref(stored['content'][1]['image_url']['url']))
+        loop_thread = threading.get_ident()
+        threads = []
+        get_bytes = blob_store.get_bytes
+
+        def recording_get_bytes(digest):
+            threads.append(threading.get_ident())
+            return get_bytes(digest)
+        with mock.patch.object(blob_store, 'get_bytes', recording_get_bytes):
+            rehydrated = await blob_store.rehydrate_messages_async([stored])
+        self.assertEqual(rehydrated, [message])
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+    async def test_text_only_messages_are_returned_as_is(self):
+        messages = [{'role': 'user', 'content': [{'type': 'text', 'text': 'hi'}]}, {'role': 'assistant', 'content': 'ok'}]
+        self.assertIs(await blob_store.rehydrate_messages_async(messages), messages)
+
+    async def test_missing_blob_becomes_text(self):
+        stored = blob_store.externalize_message(_image_message(os.urandom(256)))
+        os.remove(blob_store.blob_path(stored['content'][1]['image_url']['url'][blob_store.BLOB_REF_KEY]))
+        rehydrated = await blob_store.rehydrate_messages_async([stored])
+        self.assertEqual(rehydrated[0]['content'][1], {'type': 'text', 'text': '[image unavailable]'})
+
+
+if __name__ == '__main__':
+    unittest.main()
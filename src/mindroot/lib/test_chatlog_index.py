@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Tests for the chatlog location index (ChatLogIndex).
+
+Run from src/mindroot:
+    python lib/test_chatlog_index.py
+"""
+import os
+import sys
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.chatlog_index import ChatLogIndex
+
+
+class TestChatLogIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.chat_dir = os.path.join(self.tmp.name, 'chat')
+        self.env = mock.patch.dict(os.environ, {'CHATLOG_DIR': self.chat_dir,
+                                                'CHATLOG_INDEX_DIR': os.path.join(self.tmp.name, 'chat_index')})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def write_log(self, log_id, user='user', agent='agent', parent=None):
+        log_dir = os.path.join(self.chat_dir, user, agent)
+        os.makedirs(log_dir, exist_ok=True)
+        path = os.path.join(log_dir, f'chatlog_{log_id}.json')
+        with open(path, 'w') as f:
+            json.dump({'agent': agent, 'messages': [], 'parent_log_id': parent}, f)
+        return path
+
+    def test_rebuild_indexes_existing_logs(self):
+        self.write_log('parent')
+        path = self.write_log('child', parent='parent')
+        index = ChatLogIndex()
+        self.assertEqual(index.find('child'), path)
+        self.assertEqual(index.children('parent'), ['child'])
+
+    def test_unindexed_log_is_found_on_disk(self):
+        index = ChatLogIndex()
+        index.load()
+        # Copied in after the index was built.
+        path = self.write_log('restored', user='bob', parent='parent')
+        self.assertEqual(index.find('restored'), path)
+        self.assertEqual(index.children('parent'), ['restored'])
+        # The hit was recorded in the index file.
+        self.assertEqual(ChatLogIndex().lookup('restored'), ('bob', 'agent'))
+
+    def test_register_without_load_does_not_rebuild(self):
+        self.write_log('parent')
+        ChatLogIndex().load()
+        index = ChatLogIndex()
+        with mock.patch.object(index, 'rebuild') as rebuild:
+            self.assertFalse(index.register('child', 'user', 'agent', 'parent', load=False))
+            rebuild.assert_not_called()
+        # The record is picked up when the index is loaded.
+        index.load()
+        self.assertEqual(index.children('parent'), ['child'])
+        self.assertTrue(index.register('child', 'user', 'agent', 'parent', load=False))
+
+    def test_unbuilt_index_is_rebuilt_on_load(self):
+        index = ChatLogIndex()
+        index.register('child', 'user', 'agent', 'parent', load=False)
+        self.write_log('other')
+        index.load()
+        self.assertIn('other', index.all_entries())
+
+    def test_missing_log(self):
+        index = ChatLogIndex()
+        self.assertIsNone(index.find('missing'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Tests for the live ChatContext cache (ContextCache).
+
+Run from src/mindroot:
+    python lib/test_context_cache.py
+"""
+import os
+import sys
+import time
+import asyncio
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.chatcontext import ContextCache
+
+
+class FakeChatLog:
+
+    def __init__(self, size):
+        self.size = size
+        self.measured = 0
+
+    def approx_bytes(self):
+        self.measured += 1
+        return self.size
+
+
+class FakeContext:
+
+    def __init__(self, size=0):
+        self.chat_log = FakeChatLog(size)
+
+
+class TestContextCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, {'MR_CONTEXT_CACHE_SIZE': '3', 'MR_CONTEXT_CACHE_TTL': '3600',
+                                                'MR_CONTEXT_CACHE_MAX_MB': '1',
+                                                'MR_CONTEXT_CACHE_SWEEP_INTERVAL': '60'})
+        self.env.start()
+        self.cache = ContextCache()
+
+    def tearDown(self):
+        self.env.stop()
+
+    def test_lru_eviction_by_count(self):
+        for log_id in 'abcd':
+            self.cache[log_id] = FakeContext()
+        self.assertEqual(self.cache.keys(), ['b', 'c', 'd'])
+        self.cache['b']
+        self.cache['e'] = FakeContext()
+        self.assertEqual(self.cache.keys(), ['d', 'b', 'e'])
+        self.assertEqual(self.cache.evictions, 2)
+
+    def test_busy_contexts_are_kept(self):
+        self.cache.register_busy_check(lambda log_id: log_id == 'a')
+        for log_id in 'abcd':
+            self.cache[log_id] = FakeContext()
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+
+    def test_evict_callback(self):
+        evicted = []
+        self.cache.register_evict_callback(lambda log_id, context: evicted.append(log_id))
+        for log_id in 'abcd':
+            self.cache[log_id] = FakeContext()
+        self.assertEqual(evicted, ['a'])
+
+    def test_byte_total_is_incremental(self):
+        contexts = [FakeContext(300 * 1024) for _ in range(3)]
+        for log_id, context in zip('abc', contexts):
+            self.cache[log_id] = context
+        self.assertEqual(self.cache.stats()['approx_bytes'], 900 * 1024)
+        # stats() does not measure the histories again.
+        measured = [c.chat_log.measured for c in contexts]
+        self.cache.stats()
+        self.assertEqual([c.chat_log.measured for c in contexts], measured)
+        # A lookup re-measures that context only.
+        contexts[0].chat_log.size = 100 * 1024
+        self.cache['a']
+        self.assertEqual(self.cache.stats()['approx_bytes'], 700 * 1024)
+        del self.cache['b']
+        self.assertEqual(self.cache.stats()['approx_bytes'], 400 * 1024)
+        self.cache.pop('a')
+        self.assertEqual(self.cache.stats()['approx_bytes'], 300 * 1024)
+
+    def test_eviction_by_bytes(self):
+        self.cache['a'] = FakeContext(600 * 1024)
+        self.cache['b'] = FakeContext(600 * 1024)
+        self.assertEqual(self.cache.keys(), ['b'])
+
+    def test_idle_entries_swept_on_lookup(self):
+        self.cache['a'] = FakeContext()
+        self.cache['b'] = FakeContext()
+        now = time.time()
+        with mock.patch.dict(os.environ, {'MR_CONTEXT_CACHE_TTL': '10'}), \
+                mock.patch('lib.chatcontext.time.time', return_value=now + 120):
+            self.cache['b']
+        self.assertEqual(self.cache.keys(), ['b'])
+
+    def test_sweep_is_rate_limited(self):
+        self.cache['a'] = FakeContext()
+        self.cache['b'] = FakeContext()
+        with mock.patch.dict(os.environ, {'MR_CONTEXT_CACHE_TTL': '0'}):
+            time.sleep(0.01)
+            self.cache['b']
+        # Within the sweep interval nothing is evicted on lookup.
+        self.assertEqual(self.cache.keys(), ['a', 'b'])
+
+    async def test_get_or_load_single_flight(self):
+        loads = []
+
+        async def loader():
+            loads.append(1)
+            await asyncio.sleep(0.01)
+            return FakeContext()
+        results = await asyncio.gather(*[self.cache.get_or_load('a', loader) for _ in range(3)])
+        self.assertEqual(len(loads), 1)
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertIs(await self.cache.get_or_load('a', loader), results[0])
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    async def test_cancelled_loader_does_not_cancel_others(self):
+        loads = []
+
+        async def loader():
+            loads.append(1)
+            await asyncio.sleep(0.03)
+            return FakeContext()
+        first = asyncio.create_task(self.cache.get_or_load('a', loader))
+        await asyncio.sleep(0.005)
+        second = asyncio.create_task(self.cache.get_or_load('a', loader))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        context = await second
+        self.assertIs(self.cache['a'], context)
+        self.assertEqual(len(loads), 2)
+
+
+class TestSharedContexts(unittest.TestCase):
+
+    def test_one_cache_for_both_import_paths(self):
+        import lib.chatcontext
+        import mindroot.lib.chatcontext
+        from mindroot.lib.metrics import metrics
+        self.assertIs(lib.chatcontext.contexts, mindroot.lib.chatcontext.contexts)
+        self.assertEqual(metrics._gauge_values()['context_cache'], lib.chatcontext.contexts.stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
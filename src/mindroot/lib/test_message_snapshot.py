@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Tests for copy-on-write history snapshots (message_snapshot, ChatLog.get_recent).
+
+Run from src/mindroot:
+    python lib/test_message_snapshot.py
+"""
+import os
+import sys
+import copy
+import json
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.message_snapshot import CowDict, cow_message, is_dirty, snapshot_messages, thaw
+
+
+def _message(text='hi', role='user'):
+    return {'role': role, 'content': [{'type': 'text', 'text': text}]}
+
+
+class TestCowMessage(unittest.TestCase):
+
+    def test_reads_do_not_dirty(self):
+        message = cow_message(_message())
+        message['content'][0]['text']
+        list(message['content'])
+        json.dumps(message)
+        self.assertFalse(is_dirty(message))
+
+    def test_nested_mutations_dirty_the_root(self):
+        mutations = [
+            lambda m: m.__setitem__('role', 'assistant'),
+            lambda m: m['content'][0].__setitem__('text', 'changed'),
+            lambda m: m['content'].append({'type': 'text', 'text': 'more'}),
+            lambda m: m['content'].pop(),
+            lambda m: m['content'][0].update(text='changed'),
+            lambda m: m['content'][0].pop('text'),
+            lambda m: m['content'].sort(key=str),
+        ]
+        for mutate in mutations:
+            original = _message()
+            message = cow_message(original)
+            mutate(message)
+            self.assertTrue(is_dirty(message))
+            self.assertEqual(original, _message())
+
+    def test_plain_dict_counts_as_dirty(self):
+        self.assertTrue(is_dirty(_message()))
+
+    def test_copies_are_plain(self):
+        message = cow_message(_message())
+        self.assertEqual(type(copy.deepcopy(message)), dict)
+        self.assertEqual(type(thaw(message)['content']), list)
+        self.assertEqual(type(pickle.loads(pickle.dumps(message))), dict)
+        self.assertEqual(json.loads(json.dumps(message)), _message())
+
+    def test_snapshot_messages_reuses_clean_copies(self):
+        clean = cow_message(_message('a'))
+        dirty = cow_message(_message('b'))
+        dirty['role'] = 'assistant'
+        plain = _message('c')
+        result = snapshot_messages([clean, dirty, plain])
+        self.assertIs(result[0], clean)
+        self.assertIsNot(result[1], dirty)
+        self.assertIsInstance(result[2], CowDict)
+        self.assertFalse(is_dirty(result[1]))
+
+
+class TestChatLogSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {'CHATLOG_DIR': os.path.join(self.tmp.name, 'chat'),
+                                                'CHATLOG_INDEX_DIR': os.path.join(self.tmp.name, 'chat_index')})
+        self.env.start()
+        from lib.chatlog import ChatLog
+        self.log = ChatLog(log_id='snapshot_test', agent='agent', user='user')
+        self.log.add_message(_message('one'))
+        self.log.add_message(_message('[{"say": {"text": "two"}}]', role='assistant'))
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def recent(self):
+        return self.log.get_recent(max_tokens=0)
+
+    def test_untouched_messages_are_shared(self):
+        first, second = self.recent(), self.recent()
+        self.assertIsNot(first, second)
+        self.assertTrue(all(a is b for a, b in zip(first, second)))
+
+    def test_modified_copy_is_replaced(self):
+        first = self.recent()
+        first[0]['content'][0]['text'] = 'changed'
+        second = self.recent()
+        self.assertIsNot(second[0], first[0])
+        self.assertIs(second[1], first[1])
+        self.assertEqual(second[0], _message('one'))
+        self.assertEqual(self.log.messages[0], _message('one'))
+
+    def test_new_and_merged_messages_are_copied(self):
+        first = self.recent()
+        self.log.add_message(_message('three'))
+        second = self.recent()
+        self.assertEqual(len(second), 3)
+        self.assertIs(second[1], first[1])
+        # A repeat role is merged into the last message (set_last).
+        self.log.add_message(_message('four'))
+        third = self.recent()
+        self.assertEqual(len(third), 3)
+        self.assertIsNot(third[2], second[2])
+        self.assertEqual(third[2], self.log.messages[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
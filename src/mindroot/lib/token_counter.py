@@ -6,7 +6,9 @@ import asyncio
 import aiofiles
 import aiofiles.os
 from typing import Dict, List
-from mindroot.lib.chatlog import ChatLog
+from mindroot.lib import chatlog_journal
+from mindroot.lib.chatlog_index import chatlog_index
+from mindroot.lib.token_ledger import TokenLedger
 
 async def find_chatlog_file(log_id: str) -> str:
     """
@@ -18,15 +20,7 @@ async def find_chatlog_file(log_id: str) -> str:
     Returns:
         The full path to the chatlog file if found, None otherwise
     """
-    chat_dir = os.environ.get('CHATLOG_DIR', 'data/chat')
-    
-    # Use os.walk to search through all subdirectories
-    for root, dirs, files in await asyncio.to_thread(os.walk, chat_dir):
-        for file in files:
-            if file == f"chatlog_{log_id}.json":
-                return os.path.join(root, file)
-    
-    return None
+    return await asyncio.to_thread(chatlog_index.find, log_id)
 
 def extract_delegate_task_log_ids(messages: List[Dict]) -> List[str]:
     """
@@ -89,12 +83,16 @@ async def get_cached_token_counts(log_id: str, log_path: str) -> Dict[str, int]:
     """
     Get cached token counts if available and valid.
     
+    count_tokens_for_log_id() no longer consults this cache: per-message
+    token counts are stored with each log, so counting is cheap and always
+    current.
+    
     Args:
         log_id: The log ID
         log_path: Path to the actual log file
         
     Returns:
-        Cached token counts if valid, None otherwise
+        Cached token counts if the log has not changed since they were saved, None otherwise
     """
     cache_path = await get_cache_path(log_id)
     
@@ -103,27 +101,14 @@ async def get_cached_token_counts(log_id: str, log_path: str) -> Dict[str, int]:
         return None
     
     try:
-        # Get modification times
-        log_mtime = await aiofiles.os.path.getmtime(log_path)
-        cache_mtime = await aiofiles.os.path.getmtime(cache_path)
-        current_time = time.time()
-        
         # If log was modified after cache was created, cache is invalid
+        log_mtime = await asyncio.to_thread(chatlog_journal.log_mtime, log_path)
+        cache_mtime = await aiofiles.os.path.getmtime(cache_path)
         if log_mtime > cache_mtime:
             return None
-        
-        # Don't recalculate sooner than 3 minutes after last calculation
-        if current_time - cache_mtime < 180:  # 3 minutes in seconds
-            async with aiofiles.open(cache_path, 'r') as f:
-                content = await f.read()
-                return json.loads(content)
-                
-        # For logs that haven't been modified in over an hour, consider them "finished"
-        # and use the cache regardless of when it was last calculated
-        if current_time - log_mtime > 3600:  # 1 hour in seconds
-            async with aiofiles.open(cache_path, 'r') as f:
-                content = await f.read()
-                return json.loads(content)
+        async with aiofiles.open(cache_path, 'r') as f:
+            content = await f.read()
+            return json.loads(content)
     
     except (json.JSONDecodeError, IOError) as e:
         print(f"Error reading token cache: {e}")
@@ -153,25 +138,11 @@ async def count_tokens_for_log_id(log_id: str) -> Dict[str, int]:
     if not chatlog_path:
         return None
     
-    # Check cache first
-    cached_counts = await get_cached_token_counts(log_id, chatlog_path)
-    if cached_counts:
-        print(f"Using cached token counts for {log_id}")
-        return cached_counts
-    
-    print(f"Calculating token counts for {log_id}")
-    
     # Load the chat log
-    async with aiofiles.open(chatlog_path, 'r') as f:
-        content = await f.read()
-        log_data = json.loads(content)
-        
-    # Create a temporary ChatLog instance to count tokens
-    temp_log = ChatLog(log_id=log_id, user="system", agent=log_data.get('agent', 'unknown'))
-    temp_log.messages = log_data.get('messages', [])
+    log_data = await chatlog_journal.read_log_data(chatlog_path)
     
     # Count tokens for this log
-    parent_counts = temp_log.count_tokens()
+    parent_counts = TokenLedger.from_log_data(log_data).totals()
     
     # Create combined counts (starting with parent counts)
     combined_counts = {}
@@ -180,7 +151,7 @@ async def count_tokens_for_log_id(log_id: str) -> Dict[str, int]:
     combined_counts['input_tokens_total'] = parent_counts['input_tokens_total']
     
     # Find delegated task log IDs
-    delegated_log_ids = extract_delegate_task_log_ids(temp_log.messages)
+    delegated_log_ids = extract_delegate_task_log_ids(log_data.get('messages', []))
     
     # Recursively count tokens for delegated tasks
     for delegated_id in delegated_log_ids:
@@ -201,7 +172,4 @@ async def count_tokens_for_log_id(log_id: str) -> Dict[str, int]:
     token_counts['combined_output_tokens_sequence'] = combined_counts['output_tokens_sequence']
     token_counts['combined_input_tokens_total'] = combined_counts['input_tokens_total']
     
-    # Save to cache
-    await save_token_counts_to_cache(log_id, token_counts)
-    
     return token_counts
@@ -0,0 +1,121 @@
+"""Running token totals for a chat log.
+
+ChatLog.count_tokens() used to re-estimate every earlier message for every
+assistant message (O(n^2)). TokenLedger keeps one count per message plus the
+running totals, and is updated by the same append / set_last / drop_last
+mutations the chatlog journal records, so totals are O(1) to read.
+
+Per-message counts are persisted with the log ('token_counts' in the
+snapshot, 'tokens' in journal records) together with the name of the
+tokenizer that produced them, so loading a log does not need to re-count
+its history either.
+"""
+from typing import Dict, List
+from mindroot.lib.tokenizer import Tokenizer, get_tokenizer
+
+
+class TokenLedger:
+
+    def __init__(self, tokenizer: Tokenizer = None):
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.counts: List[int] = []
+        self._prefix: List[int] = []
+        self._is_output: List[bool] = []
+        self.input_tokens_sequence = 0
+        self.output_tokens_sequence = 0
+        self.input_tokens_total = 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def _total_so_far(self) -> int:
+        if not self.counts:
+            return 0
+        return self._prefix[-1] + self.counts[-1]
+
+    def append(self, message: Dict, tokens: int = None) -> int:
+        if tokens is None:
+            tokens = self.tokenizer.count_message(message)
+        prefix = self._total_so_far()
+        is_output = message.get('role') == 'assistant'
+        if is_output:
+            self.output_tokens_sequence += tokens
+            # An assistant message was produced from everything before it.
+            self.input_tokens_total += prefix
+        else:
+            self.input_tokens_sequence += tokens
+        self.counts.append(tokens)
+        self._prefix.append(prefix)
+        self._is_output.append(is_output)
+        return tokens
+
+    def pop(self) -> None:
+        if not self.counts:
+            return
+        tokens = self.counts.pop()
+        prefix = self._prefix.pop()
+        if self._is_output.pop():
+            self.output_tokens_sequence -= tokens
+            self.input_tokens_total -= prefix
+        else:
+            self.input_tokens_sequence -= tokens
+
+    def set_last(self, message: Dict, tokens: int = None) -> int:
+        self.pop()
+        return self.append(message, tokens)
+
+    def reset(self, messages: List[Dict], counts: List[int] = None) -> None:
+        """Rebuild from a full message list, reusing stored counts when valid."""
+        self.counts = []
+        self._prefix = []
+        self._is_output = []
+        self.input_tokens_sequence = 0
+        self.output_tokens_sequence = 0
+        self.input_tokens_total = 0
+        if counts is not None and len(counts) != len(messages):
+            counts = None
+        for i, message in enumerate(messages):
+            self.append(message, counts[i] if counts is not None else None)
+
+    def apply_record(self, messages: List[Dict], record: Dict) -> None:
+        """Apply an append/set_last/drop_last change record (after messages
+        was updated) and store the token count on the record."""
+        op = record.get('op')
+        if op == 'append':
+            record['tokens'] = self.append(record['message'], record.get('tokens'))
+        elif op == 'set_last':
+            record['tokens'] = self.set_last(record['message'], record.get('tokens'))
+        elif op == 'drop_last':
+            self.pop()
+
+    def total(self) -> int:
+        """Tokens in all messages."""
+        return self._total_so_far()
+
+    def prefix_tokens(self, index: int) -> int:
+        """Tokens in messages[:index]."""
+        if index >= len(self.counts):
+            return self._total_so_far()
+        return self._prefix[index]
+
+    def totals(self) -> Dict[str, int]:
+        return {
+            'input_tokens_sequence': self.input_tokens_sequence,
+            'output_tokens_sequence': self.output_tokens_sequence,
+            'input_tokens_total': self.input_tokens_total
+        }
+
+    @property
+    def tokenizer_name(self) -> str:
+        return self.tokenizer.name
+
+    @classmethod
+    def from_log_data(cls, log_data: Dict) -> 'TokenLedger':
+        """Ledger for stored log data, counted with the tokenizer it was saved
+        with (recounting only if that tokenizer is no longer available)."""
+        ledger = cls(get_tokenizer(log_data.get('tokenizer', 'estimate')))
+        counts = log_data.get('token_counts')
+        if log_data.get('tokenizer', 'estimate') != ledger.tokenizer_name:
+            counts = None
+        ledger.reset(log_data.get('messages', []), counts)
+        return ledger
@@ -0,0 +1,327 @@
+"""Tokenizer backends for chat log token accounting.
+
+Token counts default to the old len(json.dumps(message)) // 4 estimate. For
+real counts, drop an offline vocab file into MR_TOKENIZER_DIR
+(default data/tokenizers):
+
+    data/tokenizers/cl100k_base.tiktoken     tiktoken-format BPE ranks
+    data/tokenizers/o200k_base.tiktoken
+    data/tokenizers/llama3.tokenizer.json    Hugging Face tokenizer file
+
+and point models at it with a "tokenizer" field in data/models.json:
+
+    {"name": "gpt-4o", ..., "tokenizer": "o200k_base"}
+
+Models without that field fall back to a built-in guess based on their name
+or family (FAMILY_TOKENIZERS). A tokenizer whose vocab file is missing falls
+back to the estimate. MR_TOKENIZER sets the tokenizer used when no model is
+known.
+
+.tiktoken files are encoded with the tiktoken package when it is installed
+and with a pure-Python BPE otherwise. tokenizer.json files need the
+tokenizers package. Neither is required.
+
+Message counts are cached by content hash, so re-counting a history on every
+turn only tokenizes the new messages.
+"""
+import os
+import re
+import json
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict
+
+try:
+    import regex
+except ImportError:
+    regex = None
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+try:
+    import tokenizers as hf_tokenizers
+except ImportError:
+    hf_tokenizers = None
+
+ESTIMATE = 'estimate'
+MODELS_FILE_PATH = 'data/models.json'
+
+# Per-message framing overhead of chat formats (role, separators).
+MESSAGE_OVERHEAD = 4
+# Images are billed by size, which history no longer has (see blob_store);
+# use a flat, typical figure.
+IMAGE_TOKENS = 1000
+
+# Name/family prefix -> tokenizer, for models.json entries without a
+# "tokenizer" field. Longest matching prefix wins.
+FAMILY_TOKENIZERS = {
+    'gpt-4o': 'o200k_base',
+    'gpt-4.1': 'o200k_base',
+    'gpt-5': 'o200k_base',
+    'o1': 'o200k_base',
+    'o3': 'o200k_base',
+    'o4': 'o200k_base',
+    'gpt-4': 'cl100k_base',
+    'gpt-3.5': 'cl100k_base',
+    'text-embedding-3': 'cl100k_base',
+}
+
+_CL100K_PATTERN = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+_O200K_PATTERN = '|'.join([
+    r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+    r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+    r"""\p{N}{1,3}""",
+    r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+    r"""\s*[\r\n]+""",
+    r"""\s+(?!\S)""",
+    r"""\s+""",
+])
+PATTERNS = {
+    'cl100k_base': _CL100K_PATTERN,
+    'o200k_base': _O200K_PATTERN,
+}
+# Approximation of the patterns above for the stdlib re module (no \p{..}).
+_FALLBACK_PATTERN = r"""'(?:[sdmt]|ll|ve|re)|[^\r\n\w]?[^\W\d_]+|\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"""
+
+
+def tokenizer_dir() -> str:
+    return os.environ.get('MR_TOKENIZER_DIR', 'data/tokenizers')
+
+
+def _cache_size() -> int:
+    try:
+        return int(os.environ.get('MR_TOKEN_COUNT_CACHE_SIZE', '20000'))
+    except ValueError:
+        return 20000
+
+
+class _CountCache:
+    """LRU of (tokenizer, message hash) -> token count, shared by all logs."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value: int) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+
+_count_cache = _CountCache(_cache_size())
+
+
+class Tokenizer:
+    """Base class: subclasses implement count_text()."""
+
+    name = ESTIMATE
+
+    def count_text(self, text: str) -> int:
+        raise NotImplementedError
+
+    def _count_part(self, part) -> int:
+        if isinstance(part, str):
+            return self.count_text(part)
+        if not isinstance(part, dict):
+            return self.count_text(json.dumps(part))
+        part_type = part.get('type', '')
+        if part_type == 'text':
+            return self.count_text(part.get('text', ''))
+        if 'image' in part_type:
+            return IMAGE_TOKENS
+        return self.count_text(json.dumps(part))
+
+    def _count_message(self, message: Dict) -> int:
+        content = message.get('content', '')
+        if isinstance(content, list):
+            tokens = sum(self._count_part(part) for part in content)
+        else:
+            tokens = self._count_part(content)
+        return tokens + MESSAGE_OVERHEAD
+
+    def count_message(self, message: Dict) -> int:
+        key = (self.name, hashlib.sha1(json.dumps(message, sort_keys=True).encode('utf-8')).digest())
+        tokens = _count_cache.get(key)
+        if tokens is None:
+            tokens = self._count_message(message)
+            _count_cache.put(key, tokens)
+        return tokens
+
+
+class EstimateTokenizer(Tokenizer):
+    """The historical chars/4 estimate. Cheaper than hashing, so not cached."""
+
+    name = ESTIMATE
+
+    def count_text(self, text: str) -> int:
+        return len(text) // 4
+
+    def count_message(self, message: Dict) -> int:
+        return len(json.dumps(message)) // 4
+
+
+def load_tiktoken_ranks(path: str) -> Dict[bytes, int]:
+    """Read a .tiktoken file: one 'base64(token) rank' pair per line."""
+    ranks = {}
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            token, rank = line.split()
+            ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+class BPETokenizer(Tokenizer):
+    """Byte-level BPE from tiktoken-format ranks."""
+
+    def __init__(self, name: str, ranks: Dict[bytes, int], pattern: str = None):
+        self.name = name
+        self.ranks = ranks
+        pattern = pattern or PATTERNS.get(name, _CL100K_PATTERN)
+        self._encoding = None
+        if tiktoken is not None:
+            self._encoding = tiktoken.Encoding(name, pat_str=pattern, mergeable_ranks=ranks, special_tokens={})
+        elif regex is not None:
+            self._split = regex.compile(pattern).findall
+        else:
+            self._split = re.compile(_FALLBACK_PATTERN).findall
+        self._count_piece = lru_cache(maxsize=65536)(self._bpe_count)
+
+    def _bpe_count(self, piece: bytes) -> int:
+        if piece in self.ranks:
+            return 1
+        parts = [piece[i:i + 1] for i in range(len(piece))]
+        while len(parts) > 1:
+            best_rank = None
+            best_index = None
+            for i in range(len(parts) - 1):
+                rank = self.ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank = rank
+                    best_index = i
+            if best_index is None:
+                break
+            parts[best_index:best_index + 2] = [parts[best_index] + parts[best_index + 1]]
+        return len(parts)
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode_ordinary(text))
+        return sum(self._count_piece(piece.encode('utf-8')) for piece in self._split(text))
+
+
+class HFTokenizer(Tokenizer):
+    """Hugging Face tokenizer.json (needs the tokenizers package)."""
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self._tokenizer = hf_tokenizers.Tokenizer.from_file(path)
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+_estimate = EstimateTokenizer()
+
+
+def _load_tokenizer(name: str) -> Tokenizer:
+    base = os.path.join(tokenizer_dir(), name)
+    if os.path.exists(base + '.tiktoken'):
+        return BPETokenizer(name, load_tiktoken_ranks(base + '.tiktoken'))
+    for path in (base + '.tokenizer.json', os.path.join(base, 'tokenizer.json')):
+        if os.path.exists(path):
+            if hf_tokenizers is None:
+                print(f"Warning: {path} needs the 'tokenizers' package; using token estimate")
+                return _estimate
+            return HFTokenizer(name, path)
+    print(f"Warning: no vocab file for tokenizer '{name}' in {tokenizer_dir()}; using token estimate")
+    return _estimate
+
+
+def get_tokenizer(name: str = None) -> Tokenizer:
+    """Tokenizer by vocab name; None means MR_TOKENIZER (default: estimate)."""
+    if not name:
+        name = os.environ.get('MR_TOKENIZER', ESTIMATE)
+    if name == ESTIMATE:
+        return _estimate
+    with _tokenizers_lock:
+        tokenizer = _tokenizers.get(name)
+        if tokenizer is None:
+            try:
+                tokenizer = _load_tokenizer(name)
+            except Exception as e:
+                print(f"Warning: could not load tokenizer '{name}': {e}; using token estimate")
+                tokenizer = _estimate
+            _tokenizers[name] = tokenizer
+        return tokenizer
+
+
+_models_cache = {'mtime': None, 'models': []}
+
+
+def _read_models() -> list:
+    try:
+        mtime = os.path.getmtime(MODELS_FILE_PATH)
+    except OSError:
+        return []
+    if _models_cache['mtime'] != mtime:
+        try:
+            with open(MODELS_FILE_PATH, 'r') as f:
+                _models_cache['models'] = json.load(f)
+        except (OSError, ValueError):
+            _models_cache['models'] = []
+        _models_cache['mtime'] = mtime
+    return _models_cache['models']
+
+
+def _guess_from_name(name: str):
+    if not name:
+        return None
+    name = name.lower().split('/')[-1]
+    matches = [prefix for prefix in FAMILY_TOKENIZERS if name.startswith(prefix)]
+    if not matches:
+        return None
+    return FAMILY_TOKENIZERS[max(matches, key=len)]
+
+
+def tokenizer_name_for_model(model: str = None) -> str:
+    """Resolve a model name to a tokenizer name via data/models.json."""
+    if not model:
+        return os.environ.get('MR_TOKENIZER', ESTIMATE)
+    for entry in _read_models():
+        if model in (entry.get('name'), entry.get('id')):
+            if entry.get('tokenizer'):
+                return entry['tokenizer']
+            guess = _guess_from_name(entry.get('family')) or _guess_from_name(model)
+            if guess:
+                return guess
+            break
+    return _guess_from_name(model) or os.environ.get('MR_TOKENIZER', ESTIMATE)
+
+
+def tokenizer_for_model(model: str = None) -> Tokenizer:
+    return get_tokenizer(tokenizer_name_for_model(model))
@@ -44,6 +44,15 @@ class ExponentialBackoff:
             else:
                 self._states[identifier] = state
 
+    def reset(self, identifier):
+        """Forgets all recorded failures for the given identifier."""
+        self._states.pop(identifier, None)
+
+    def get_attempts(self, identifier):
+        """Returns the current number of unrecovered failures for the identifier."""
+        state = self._states.get(identifier)
+        return state['attempts'] if state else 0
+
     def get_wait_time(self, identifier):
         """
         Gets the current calculated wait time for the given identifier.
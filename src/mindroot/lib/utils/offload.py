@@ -0,0 +1,63 @@
+"""Run CPU-heavy fallbacks off the event loop with a time budget.
+
+    result = await run_with_budget(recover, buffer, budget=0.25)
+
+The call runs in a small dedicated thread pool (MR_OFFLOAD_WORKERS, default
+2). If it does not finish within budget seconds, or every worker is still
+busy with earlier calls, None is returned straight away ("not yet
+parseable") and the caller can try again later. A call that overran keeps
+its worker until it finishes (threads cannot be interrupted); it does not
+queue more work behind it, since busy workers make later calls return None.
+"""
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from mindroot.lib.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_busy = 0
+stats = {'calls': 0, 'over_budget': 0, 'no_worker': 0}
+
+metrics.register_gauges('offload', lambda: dict(stats, busy_workers=_busy))
+
+
+def _workers():
+    try:
+        return max(1, int(os.environ.get('MR_OFFLOAD_WORKERS', '2')))
+    except ValueError:
+        return 2
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_workers(), thread_name_prefix='mr-offload')
+    return _executor
+
+
+def _done(_future):
+    global _busy
+    _busy -= 1
+
+
+async def run_with_budget(fn, *args, budget=None):
+    """fn(*args) in a worker thread, or None if over budget / no free worker."""
+    global _busy
+    if _busy >= _workers():
+        stats['no_worker'] += 1
+        return None
+    stats['calls'] += 1
+    _busy += 1
+    future = asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    future.add_done_callback(_done)
+    try:
+        # shield: on timeout, don't cancel the future, or _busy would be
+        # released while the thread is still running.
+        return await asyncio.wait_for(asyncio.shield(future), budget)
+    except asyncio.TimeoutError:
+        stats['over_budget'] += 1
+        logger.warning(f"{getattr(fn, '__name__', fn)} exceeded its {budget}s budget")
+        return None
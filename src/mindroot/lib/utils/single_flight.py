@@ -0,0 +1,55 @@
+"""Share one in-flight call between concurrent callers with the same key.
+
+    flight = SingleFlight()
+    value = await flight.do(key, load)
+
+The first caller for a key (the leader) runs load(); callers arriving while
+it runs wait for its result, or get its exception. If the leader is
+cancelled (e.g. its client disconnected) the cancellation is not passed on:
+one of the waiting callers runs load() again and becomes the new leader.
+Cancelling a waiting caller does not affect the others.
+"""
+import asyncio
+
+_ABANDONED = object()
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    async def do(self, key, load):
+        """load() once for all concurrent callers with this key."""
+        while True:
+            pending = self._calls.get(key)
+            if pending is None:
+                break
+            # shield: a waiting caller being cancelled must not cancel the
+            # shared future.
+            result = await asyncio.shield(pending)
+            if result is not _ABANDONED:
+                return result
+        pending = asyncio.get_running_loop().create_future()
+        self._calls[key] = pending
+        try:
+            result = await load()
+        except asyncio.CancelledError:
+            pending.set_result(_ABANDONED)
+            raise
+        except BaseException as e:
+            pending.set_exception(e)
+            # Mark the exception retrieved: there may be no waiting callers.
+            pending.exception()
+            raise
+        finally:
+            if self._calls.get(key) is pending:
+                del self._calls[key]
+        pending.set_result(result)
+        return result
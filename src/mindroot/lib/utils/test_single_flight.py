@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Tests for SingleFlight.
+
+Run from src/mindroot:
+    python lib/utils/test_single_flight.py
+"""
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from lib.utils.single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'value'
+        results = await asyncio.gather(*[flight.do('k', load) for _ in range(5)])
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(flight), 0)
+
+    async def test_exception_is_shared(self):
+        flight = SingleFlight()
+
+        async def load():
+            await asyncio.sleep(0.01)
+            raise ValueError('failed')
+        results = await asyncio.gather(flight.do('k', load), flight.do('k', load), return_exceptions=True)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+    async def test_leader_cancellation_is_not_passed_on(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+        leader = asyncio.create_task(flight.do('k', load))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do('k', load))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        # The follower ran load() again itself.
+        self.assertEqual(await follower, 2)
+        self.assertEqual(len(flight), 0)
+
+    async def test_follower_cancellation_does_not_affect_leader(self):
+        flight = SingleFlight()
+
+        async def load():
+            await asyncio.sleep(0.03)
+            return 'value'
+        leader = asyncio.create_task(flight.do('k', load))
+        await asyncio.sleep(0.005)
+        follower = asyncio.create_task(flight.do('k', load))
+        other = asyncio.create_task(flight.do('k', load))
+        await asyncio.sleep(0.005)
+        follower.cancel()
+        self.assertEqual(await leader, 'value')
+        self.assertEqual(await other, 'value')
+        with self.assertRaises(asyncio.CancelledError):
+            await follower
+
+    async def test_keys_are_independent(self):
+        flight = SingleFlight()
+
+        async def load(value):
+            await asyncio.sleep(0.01)
+            return value
+        results = await asyncio.gather(flight.do('a', lambda: load(1)), flight.do('b', lambda: load(2)))
+        self.assertEqual(results, [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,22 @@
 import json
 import os
+import copy
+import threading
 
 class DataAccess:
+    """Reads and writes the model/provider/plugin registry files in data/.
+
+    Parsed files are cached in memory and revalidated by mtime and size on
+    every read, so external edits are picked up while unchanged files are not
+    re-parsed. The read_* methods return private copies that callers may
+    modify. load() and derived() return shared objects that must be treated as
+    read-only.
+    """
 
     def __init__(self):
+        self._cache = {}
+        self._derived = {}
+        self._lock = threading.Lock()
         self.data_dir = 'data'
         self.models_file = os.path.join(self.data_dir, 'models.json')
         self.providers_file = os.path.join(self.data_dir, 'providers.json')
@@ -11,13 +24,51 @@ class DataAccess:
         self.equivalent_flags_file = os.path.join(self.data_dir, 'equivalent_flags.json')
         self.preferred_models_file = os.path.join(self.data_dir, 'preferred_models.json')
 
-    def read_json(self, file_path):
+    def _signature(self, file_path):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self, file_path):
+        """Parsed contents of a JSON file (shared; do not modify)."""
+        signature = self._signature(file_path)
+        cached = self._cache.get(file_path)
+        if cached is not None and signature is not None and cached[0] == signature:
+            return cached[1]
         with open(file_path, 'r') as f:
-            return json.load(f)
+            data = json.load(f)
+        # Stamp with the signature taken before reading, so a write racing
+        # with this read is picked up on the next call.
+        with self._lock:
+            self._cache[file_path] = (signature, data)
+        return data
+
+    def version(self, *file_paths):
+        """Cheap change stamp for a set of files (for caching derived data)."""
+        return tuple(self._signature(file_path) for file_path in file_paths)
+
+    def derived(self, name, file_paths, build):
+        """Value computed by build() from the given files, recomputed only when
+        one of them changes (shared; do not modify)."""
+        version = self.version(*file_paths)
+        cached = self._derived.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        value = build()
+        with self._lock:
+            self._derived[name] = (version, value)
+        return value
+
+    def read_json(self, file_path):
+        return copy.deepcopy(self.load(file_path))
 
     def write_json(self, file_path, data):
         with open(file_path, 'w') as f:
             json.dump(data, f, indent=2)
+        with self._lock:
+            self._cache[file_path] = (self._signature(file_path), copy.deepcopy(data))
 
     def read_models(self):
         return self.read_json(self.models_file)
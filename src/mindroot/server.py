@@ -97,6 +97,11 @@ def parse_args():
     create_user_parser.add_argument('--password', type=str, default=None, help='Password (auto-generated if not provided)')
     create_user_parser.add_argument('--roles', type=str, nargs='+', default=['user', 'verified'], help='Roles for the user')
 
+    # Chat log maintenance
+    chatlog_parser = subparsers.add_parser('chatlog', help='Chat log maintenance')
+    chatlog_subparsers = chatlog_parser.add_subparsers(dest='chatlog_command', required=True)
+    chatlog_subparsers.add_parser('reindex', help='Rebuild the chat log location and parent/child index from CHATLOG_DIR')
+
     # API key command group
     apikey_parser = subparsers.add_parser('apikey', help='Manage API keys')
     apikey_subparsers = apikey_parser.add_subparsers(dest='apikey_command', required=True)
@@ -306,6 +311,16 @@ def main():
             sys.exit(1)
         sys.exit(0)
 
+    if args.command == 'chatlog':
+        if args.chatlog_command == 'reindex':
+            from .lib.chatlog_index import chatlog_index, chat_dir
+            count = chatlog_index.rebuild()
+            print(f"Indexed {count} chat logs from {chat_dir()}")
+        else:
+            print(f"Unknown chatlog command: {args.chatlog_command}")
+            sys.exit(1)
+        sys.exit(0)
+
     # If the command is 'plugin', handle it and exit.
     if args.command == 'plugin':
         if args.plugin_command == 'install':
@@ -381,6 +396,13 @@ def main():
         except Exception as _e:
             print(colored(f"Could not install asyncio exception handler: {_e}", "red"))
         await setup_app_internal(app)
+        try:
+            # Load (or build) the chatlog index now, off the event loop, so
+            # requests never trigger a rebuild.
+            from .lib.chatlog_index import chatlog_index
+            await asyncio.to_thread(chatlog_index.load)
+        except Exception as _e:
+            _alog.error("Could not load chatlog index", exc_info=True)
         try:
             from .lib.hang_watchdog import hang_watchdog
             await hang_watchdog.start()